@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class ImdbAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'imdb_app'
\ No newline at end of file
+    name = 'imdb_app'
+
+    def ready(self):
+        from imdb_app import signals  # noqa: F401
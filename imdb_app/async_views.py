@@ -0,0 +1,166 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db.models import F
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from imdb_app.models import Movie, MovieActor, Rating, RatingSummary, Oscars
+from imdb_app.serializers import MovieSerializer, DetailedMovieSerializer, CastSerializer, RatingSerializer, \
+    ListOscarsSerializer
+from imdb_app.view_sets import MovieFilterSet, OscarsFilterSet
+
+# async versions of the hot read endpoints, mounted under api/imdb/async/ and served without a thread
+# per request when the project runs under ASGI (imdb_rest/asgi.py). same response bodies as the sync views.
+# the queries of one response are started together with asyncio.gather: Django's async ORM still runs
+# them one by one on the request's connection, but the event loop serves other requests meanwhile and
+# the views need no change once the ORM talks to the database asynchronously.
+# lists are paginated by page number only (no ?pagination=cursor)
+
+
+def render(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def not_found(model):
+    # the message of rest_framework for a get_object_or_404 miss
+    return render({'detail': f'No {model._meta.object_name} matches the given query.'}, status=404)
+
+
+def method_not_allowed(request):
+    return render({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+
+async def filter_queryset(request, filterset):
+    # validating a filter on a related model (?actor=<id>) looks the row up
+    if not await sync_to_async(filterset.is_valid)():
+        return None, render(filterset.errors, status=400)
+    return filterset.qs, None
+
+
+async def fetch(queryset):
+    return [obj async for obj in queryset]
+
+
+async def paginate(request, queryset, serializer_class):
+    # same page / count / next / previous as rest_framework's PageNumberPagination
+    page_size = api_settings.PAGE_SIZE
+    try:
+        page = int(request.GET.get('page', 1))
+        if page < 1:
+            raise ValueError
+    except ValueError:
+        return render({'detail': 'Invalid page.'}, status=404)
+
+    offset = (page - 1) * page_size
+    count, rows = await asyncio.gather(queryset.acount(), fetch(queryset[offset:offset + page_size]))
+    if page > 1 and not rows:
+        return render({'detail': 'Invalid page.'}, status=404)
+
+    url = request.build_absolute_uri()
+    if offset + page_size < count:
+        next_link = replace_query_param(url, 'page', page + 1)
+    else:
+        next_link = None
+    if page == 1:
+        previous_link = None
+    elif page == 2:
+        previous_link = remove_query_param(url, 'page')
+    else:
+        previous_link = replace_query_param(url, 'page', page - 1)
+
+    return render({
+        'count': count,
+        'next': next_link,
+        'previous': previous_link,
+        'results': serializer_class(rows, many=True).data,
+    })
+
+
+async def get_movies(request):
+    if request.method != 'GET':
+        return method_not_allowed(request)
+    queryset, error = await filter_queryset(request, MovieFilterSet(request.GET, queryset=Movie.objects.order_by('id')))
+    if error is not None:
+        return error
+    return await paginate(request, queryset, MovieSerializer)
+
+
+async def get_movie(request, movie_id):
+    # ?include=cast,rating adds the cast and the rating summary, fetched together with the movie
+    if request.method != 'GET':
+        return method_not_allowed(request)
+    include = set(request.GET.get('include', '').split(','))
+    queries = [Movie.objects.filter(id=movie_id).afirst()]
+    if 'cast' in include:
+        queries.append(fetch(MovieActor.objects.filter(movie_id=movie_id).select_related('actor').order_by('id')))
+    if 'rating' in include:
+        queries.append(RatingSummary.objects.filter(movie_id=movie_id).afirst())
+    movie, *extra = await asyncio.gather(*queries)
+    if movie is None:
+        return not_found(Movie)
+
+    data = DetailedMovieSerializer(movie).data
+    if 'cast' in include:
+        data['cast'] = CastSerializer(extra.pop(0), many=True).data
+    if 'rating' in include:
+        summary = extra.pop(0)
+        data['rating'] = {
+            'count': summary.count if summary else 0,
+            'avg': summary.avg if summary else None,
+            'min': summary.min_rating if summary else None,
+            'max': summary.max_rating if summary else None,
+        }
+    return render(data)
+
+
+async def get_movie_cast(request, movie_id):
+    if request.method != 'GET':
+        return method_not_allowed(request)
+    exists, cast = await asyncio.gather(
+        Movie.objects.filter(id=movie_id).aexists(),
+        fetch(MovieActor.objects.filter(movie_id=movie_id).select_related('actor').order_by('id')),
+    )
+    if not exists:
+        return not_found(Movie)
+    return render(CastSerializer(cast, many=True).data)
+
+
+async def get_movie_ratings(request, movie_id):
+    if request.method != 'GET':
+        return method_not_allowed(request)
+    exists, ratings = await asyncio.gather(
+        Movie.objects.filter(id=movie_id).aexists(),
+        fetch(Rating.objects.filter(movie_id=movie_id).order_by('id')),
+    )
+    if not exists:
+        return not_found(Movie)
+    return render(RatingSerializer(ratings, many=True).data)
+
+
+async def get_avg_movie_rating(request, movie_id):
+    if request.method != 'GET':
+        return method_not_allowed(request)
+    summary, exists = await asyncio.gather(
+        RatingSummary.objects.filter(movie_id=movie_id).afirst(),
+        Movie.objects.filter(id=movie_id).aexists(),
+    )
+    if not exists:
+        return not_found(Movie)
+    return render({'rating__avg': summary.avg if summary else None})
+
+
+async def get_oscars(request):
+    if request.method != 'GET':
+        return method_not_allowed(request)
+    queryset = Oscars.objects.annotate(
+        movie_name=F('movie__name'),
+        actor_name=F('actor__name'),
+        director_name=F('director__name'),
+    ).order_by('id')
+    queryset, error = await filter_queryset(request, OscarsFilterSet(request.GET, queryset=queryset))
+    if error is not None:
+        return error
+    return await paginate(request, queryset, ListOscarsSerializer)
@@ -0,0 +1,134 @@
+import copy
+import datetime
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from rest_framework.authentication import BasicAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from imdb_app.cache import LRUCache
+
+# cheap authentication for small reads:
+#   JWT:   tokens carry the user's is_staff next to its id, a recent access token authenticates a
+#          TokenUser built from its claims without loading the user (see ClaimsJWTAuthentication)
+#   Basic: verified username / password pairs are remembered for a short time, so PBKDF2 runs once per
+#          BASIC_AUTH_CACHE['TIMEOUT'] and not on every request (see CachedBasicAuthentication)
+
+DEFAULT_CREDENTIAL_CACHE = {'MAX_ENTRIES': 1024, 'TIMEOUT': 60}
+
+
+def add_claims(token, user):
+    token['is_staff'] = user.is_staff
+    return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+
+    @classmethod
+    def get_token(cls, user):
+        return add_claims(super().get_token(user), user)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    # the new access token gets the user's current is_staff, not the one it had at login
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data['access'])
+        user = get_user_model().objects.filter(
+            **{jwt_settings.USER_ID_FIELD: access[jwt_settings.USER_ID_CLAIM]}).first()
+        if user is not None:
+            data['access'] = str(add_claims(access, user))
+        return data
+
+
+def stateless_max_age():
+    # claims of access tokens older than this are checked against the database, None always checks
+    return getattr(settings, 'STATELESS_JWT_MAX_AGE', datetime.timedelta(minutes=15))
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that trusts the is_staff claim of an access token issued less than
+    STATELESS_JWT_MAX_AGE ago and skips the user lookup. A demoted or deactivated user keeps its
+    rights that long; older tokens and tokens without the claims load the user as before.
+    """
+
+    def get_user(self, validated_token):
+        if self.stateless(validated_token):
+            return TokenUser(validated_token)
+        return super().get_user(validated_token)
+
+    def stateless(self, validated_token):
+        max_age = stateless_max_age()
+        if max_age is None or 'is_staff' not in validated_token \
+                or jwt_settings.USER_ID_CLAIM not in validated_token or 'iat' not in validated_token:
+            return False
+        issued = datetime.datetime.fromtimestamp(validated_token['iat'], tz=datetime.timezone.utc)
+        return datetime.datetime.now(tz=datetime.timezone.utc) - issued <= max_age
+
+
+def database_user(user):
+    # the User row of request.user, for the views that need more than the id and is_staff
+    if isinstance(user, TokenUser):
+        return get_user_model().objects.get(**{jwt_settings.USER_ID_FIELD: user.id})
+    return user
+
+
+_credential_cache = None
+
+
+def get_credential_cache():
+    global _credential_cache
+    if _credential_cache is None:
+        options = {**DEFAULT_CREDENTIAL_CACHE, **getattr(settings, 'BASIC_AUTH_CACHE', {})}
+        _credential_cache = LRUCache(options['MAX_ENTRIES'], options['TIMEOUT']) \
+            if options['MAX_ENTRIES'] and options['TIMEOUT'] else False
+    return _credential_cache or None
+
+
+def clear_credential_cache():
+    # after a user changes: a new password, is_staff or is_active must not wait for the timeout
+    if _credential_cache:
+        _credential_cache.clear()
+
+
+def reset_credential_cache(*, setting, **kwargs):
+    global _credential_cache
+    if setting == 'BASIC_AUTH_CACHE':
+        _credential_cache = None
+
+
+setting_changed.connect(reset_credential_cache)
+
+
+def credential_key(userid, password):
+    # the passwords themselves are not kept
+    message = f'{userid}\0{password}'.encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """
+    BasicAuthentication that remembers the user of a verified username / password pair for
+    BASIC_AUTH_CACHE['TIMEOUT'] seconds (at most MAX_ENTRIES pairs). Failed attempts are not cached.
+    """
+
+    def authenticate_credentials(self, userid, password, request=None):
+        cache = get_credential_cache()
+        if cache is None:
+            return super().authenticate_credentials(userid, password, request)
+        key = credential_key(userid, password)
+        user = cache.get(key)
+        if user is None:
+            user, _ = super().authenticate_credentials(userid, password, request)
+            cache.set(key, user)
+        # every request gets its own instance
+        return copy.copy(user), None
@@ -0,0 +1,41 @@
+import hashlib
+import json
+
+from django.core.exceptions import ImproperlyConfigured
+
+from imdb_app.pool import get_pool, close_pools
+
+# database engines that take their connections from imdb_app.pool: 'imdb_app.backends.postgresql' and
+# 'imdb_app.backends.sqlite3' (for trying the pool locally), configured by DATABASES[alias]['POOL']
+
+
+class PooledDatabaseWrapperMixin:
+
+    def get_connection_pool(self, conn_params):
+        if self.settings_dict['CONN_MAX_AGE'] != 0:
+            raise ImproperlyConfigured('Pooled connections go back to the pool after every request, '
+                                       'set CONN_MAX_AGE to 0 for the pooled database engines')
+        key = hashlib.md5(json.dumps(conn_params, sort_keys=True, default=str).encode()).hexdigest()
+        return get_pool(self.alias, key, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_connection_pool(conn_params)
+        connect = lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params)
+        connection = pool.acquire(connect)
+        pool.fill(connect)
+        # not self.pool, the PostgreSQL backend has one for OPTIONS['pool'] (psycopg's pool)
+        self.connection_pool = pool
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.connection_pool.release(self.connection)
+
+
+class PooledDatabaseCreationMixin:
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # idle pooled connections would keep the test database in use
+        close_pools(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
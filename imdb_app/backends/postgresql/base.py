@@ -0,0 +1,12 @@
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgreSQLDatabaseWrapper
+from django.db.backends.postgresql.creation import DatabaseCreation as PostgreSQLDatabaseCreation
+
+from imdb_app.backends import PooledDatabaseWrapperMixin, PooledDatabaseCreationMixin
+
+
+class DatabaseCreation(PooledDatabaseCreationMixin, PostgreSQLDatabaseCreation):
+    pass
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, PostgreSQLDatabaseWrapper):
+    creation_class = DatabaseCreation
@@ -0,0 +1,12 @@
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.db.backends.sqlite3.creation import DatabaseCreation as SQLiteDatabaseCreation
+
+from imdb_app.backends import PooledDatabaseWrapperMixin, PooledDatabaseCreationMixin
+
+
+class DatabaseCreation(PooledDatabaseCreationMixin, SQLiteDatabaseCreation):
+    pass
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, SQLiteDatabaseWrapper):
+    creation_class = DatabaseCreation
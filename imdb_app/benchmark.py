@@ -0,0 +1,717 @@
+import asyncio
+import base64
+import datetime
+import itertools
+import json
+import random
+import secrets
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.db.utils import load_backend
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from imdb_app.authentication import ClaimsTokenObtainPairSerializer
+from imdb_app.cache import get_response_cache
+from imdb_app.costars import CoStarGraph, MAX_DEGREES, timed_paths
+from imdb_app.fastjson import compile_serializer
+from imdb_app.models import Movie, Actor, MovieActor, MovieDirector, Directors, Oscars, Rating, RatingSummary, \
+    RatingDay, empty_histogram
+from imdb_app.pool import close_pools, pool_stats
+from imdb_app.search import get_movie_search
+from imdb_app.serializers import RatingSerializer, ActorSerializer, MovieSerializer, DirectorsSerializer
+from imdb_app.trends import rating_trends
+
+# synthetic data, an in-process load test of every imdb_app route, an HTTP load test of running
+# WSGI / ASGI servers, the CPU cost of serializing rows, the rating trends read from the rollup vs
+# the raw ratings, the cost of authentication and of opening database connections and co-star searches on
+# a synthetic graph, see the generate_data, benchmark, benchmark_servers, benchmark_serializers,
+# benchmark_trends, benchmark_auth, benchmark_connections and benchmark_costars management commands
+
+WORDS = ['dream', 'heist', 'galaxy', 'detective', 'war', 'love', 'ship', 'gangster', 'robot', 'island',
+         'family', 'secret', 'city', 'revenge', 'journey', 'king', 'storm', 'mirror', 'river', 'ghost']
+NOMINATIONS = ['BEST PICTURE', 'DIRECTING', 'FILM EDITING', 'MUSIC', 'SOUND', 'CINEMATOGRAPHY']
+ACTING_NOMINATIONS = ['ACTOR IN A LEADING ROLE', 'ACTRESS IN A LEADING ROLE',
+                      'ACTOR IN A SUPPORTING ROLE', 'ACTRESS IN A SUPPORTING ROLE']
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def generate_catalogue(movies=1000, actors=500, directors=100, cast_per_movie=5, ratings_per_movie=20,
+                       oscars=500, chunk_size=10000, seed=0, log=None):
+    """
+    Adds a synthetic catalogue with bulk inserts, chunk by chunk so memory stays flat for millions of rows.
+    Rating summaries are written together with the ratings and the search index is rebuilt at the end.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    run = rng.randrange(10 ** 9)
+
+    actor_ids = []
+    for chunk in chunked(range(actors), chunk_size):
+        created = Actor.objects.bulk_create(
+            [Actor(name=f'Actor {run}-{i}', birth_year=rng.randint(1920, 2005)) for i in chunk])
+        actor_ids.extend(actor.id for actor in created)
+    log(f'{actors} actors')
+
+    director_ids = [director.id for director in Directors.objects.bulk_create(
+        [Directors(name=f'Director {run}-{i}', birth_year=rng.randint(1920, 1990)) for i in range(directors)])]
+    log(f'{directors} directors')
+
+    movie_ids = []
+    cast_rows = rating_rows = 0
+    for chunk in chunked(range(movies), chunk_size):
+        created = Movie.objects.bulk_create([
+            Movie(name=f'Movie {run}-{i}', description=' '.join(rng.choices(WORDS, k=12)),
+                  duration_in_min=rng.randint(70, 200), release_year=rng.randint(1920, 2023))
+            for i in chunk
+        ])
+        chunk_ids = [movie.id for movie in created]
+        movie_ids.extend(chunk_ids)
+
+        cast = [MovieActor(movie_id=movie_id, actor_id=actor_id, salary=rng.randint(1, 100) * 10000,
+                           main_role=position == 0)
+                for movie_id in chunk_ids
+                for position, actor_id in enumerate(rng.sample(actor_ids, min(cast_per_movie, len(actor_ids))))]
+        MovieActor.objects.bulk_create(cast, batch_size=chunk_size)
+        cast_rows += len(cast)
+        MovieDirector.objects.bulk_create([MovieDirector(movie_id=movie_id, director_id=rng.choice(director_ids))
+                                           for movie_id in chunk_ids], batch_size=chunk_size)
+
+        ratings = []
+        summaries = []
+        days = {}
+        for movie_id in chunk_ids:
+            histogram = empty_histogram()
+            for _ in range(rng.randint(0, 2 * ratings_per_movie)):
+                rating = rng.randint(1, 10)
+                histogram[rating - 1] += 1
+                rating_date = f'{rng.randint(2000, 2023)}-{rng.randint(1, 12):02}-01'
+                ratings.append(Rating(movie_id=movie_id, rating=rating, rating_date=rating_date))
+                day = days.setdefault((movie_id, rating_date), RatingDay(movie_id=movie_id, day=rating_date))
+                day.count += 1
+                day.total += rating
+            summary = RatingSummary(movie_id=movie_id, histogram=histogram)
+            summary.refresh_from_histogram()
+            summaries.append(summary)
+        Rating.objects.bulk_create(ratings, batch_size=chunk_size)
+        RatingSummary.objects.bulk_create(summaries, batch_size=chunk_size)
+        RatingDay.objects.bulk_create(days.values(), batch_size=chunk_size)
+        rating_rows += len(ratings)
+        log(f'{len(movie_ids)} movies, {cast_rows} cast rows, {rating_rows} ratings')
+
+    for chunk in chunked(range(oscars), chunk_size):
+        rows = []
+        for _ in chunk:
+            acting = rng.random() < 0.4
+            rows.append(Oscars(
+                nomination=rng.choice(ACTING_NOMINATIONS if acting else NOMINATIONS),
+                ceremony_year=rng.randint(1929, 2023), movie_id=rng.choice(movie_ids),
+                actor_id=rng.choice(actor_ids) if acting else None,
+                director_id=rng.choice(director_ids) if not acting and rng.random() < 0.3 else None,
+            ))
+        Oscars.objects.bulk_create(rows)
+        MovieDirector.objects.bulk_create([MovieDirector(movie_id=row.movie_id, director_id=row.director_id)
+                                           for row in rows if row.director_id], ignore_conflicts=True)
+    log(f'{oscars} oscars')
+
+    get_movie_search().rebuild()
+    log('search index rebuilt')
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    url: str
+    data: object = None
+    staff: bool = False
+    content_type: str = None
+    # writes run in a transaction that is rolled back, so every iteration sees the same data
+    write: bool = False
+
+
+@dataclass
+class Result:
+    name: str
+    timings: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    statuses: set = field(default_factory=set)
+
+    def percentile(self, p):
+        ordered = sorted(self.timings)
+        index = max(int(round(p / 100 * len(ordered))) - 1, 0)
+        return ordered[index]
+
+    def summary(self):
+        total = sum(self.timings)
+        return {
+            'requests': len(self.timings),
+            'p50_ms': round(self.percentile(50), 3),
+            'p95_ms': round(self.percentile(95), 3),
+            'p99_ms': round(self.percentile(99), 3),
+            'throughput_rps': round(len(self.timings) / (total / 1000), 1) if total else None,
+            'queries_per_request': round(statistics.mean(self.queries), 2),
+            'statuses': sorted(self.statuses),
+        }
+
+
+@contextmanager
+def staff_user():
+    # a staff user with a random password for one run, deleted afterwards
+    username = f'benchmark-{secrets.token_hex(8)}@example.com'
+    password = secrets.token_urlsafe(24)
+    user = User.objects.create_user(username, username, password, is_staff=True)
+    try:
+        yield user, password
+    finally:
+        user.delete()
+
+
+def build_scenarios(user, password):
+    movie = Movie.objects.order_by('id').first()
+    actor = Actor.objects.order_by('id').first()
+    director = Directors.objects.order_by('id').first()
+    oscar = Oscars.objects.order_by('id').first()
+    rating = Rating.objects.order_by('id').first()
+    if not (movie and actor and director and oscar and rating):
+        raise ValueError('The benchmark needs data, run the generate_data command first')
+    year = oscar.ceremony_year
+    cast = [{'actor': actor.id, 'salary': 1000, 'main_role': True}]
+    new_movie = {'name': 'Benchmark movie', 'description': 'A benchmark', 'duration_in_min': 100,
+                 'release_year': 2000, 'cast': cast}
+    ratings_ndjson = '\n'.join(json.dumps({'movie_id': movie.id, 'rating': 7, 'date': '2020-01-01'})
+                               for _ in range(100))
+
+    return [
+        # router viewsets
+        Scenario('movies list', 'get', '/api/imdb/movies/'),
+        Scenario('movies list cursor', 'get', '/api/imdb/movies/?pagination=cursor&page_size=50'),
+        Scenario('movies filtered', 'get', '/api/imdb/movies/?release_year=2000&duration_from=90'),
+        Scenario('movies by description', 'get', '/api/imdb/movies/?description=dream'),
+        Scenario('movie detail', 'get', f'/api/imdb/movies/{movie.id}/'),
+        Scenario('movie page', 'get', f'/api/imdb/movies/{movie.id}/page/'),
+        Scenario('movie page sparse', 'get',
+                 f'/api/imdb/movies/{movie.id}/page/?include=cast,rating&fields=id,name&fields[actor]=name'),
+        Scenario('movie create', 'post', '/api/imdb/movies/', new_movie, staff=True, write=True),
+        Scenario('movie batch create', 'post', '/api/imdb/movies/batch/',
+                 [{**new_movie, 'name': f'Benchmark movie {i}'} for i in range(50)], staff=True, write=True),
+        Scenario('actors list', 'get', '/api/imdb/actors/'),
+        Scenario('actor detail', 'get', f'/api/imdb/actors/{actor.id}/'),
+        Scenario('actor movies', 'get', f'/api/imdb/actors/{actor.id}/movies/?page_size=50'),
+        Scenario('directors list', 'get', '/api/imdb/directors/'),
+        Scenario('director detail', 'get', f'/api/imdb/directors/{director.id}/'),
+        Scenario('director movies', 'get', f'/api/imdb/directors/{director.id}/movies/?page_size=50'),
+        Scenario('oscars list', 'get', '/api/imdb/oscars/'),
+        Scenario('oscar detail', 'get', f'/api/imdb/oscars/{oscar.id}/'),
+        Scenario('oscars of a year', 'get', f'/api/imdb/oscars/years/{year}/'),
+        Scenario('oscars movies leaderboard', 'get', '/api/imdb/oscars/leaderboard/movies/'),
+        Scenario('oscars actors leaderboard', 'get', '/api/imdb/oscars/leaderboard/actors/?from_year=1990'),
+        Scenario('oscars directors leaderboard', 'get', '/api/imdb/oscars/leaderboard/directors/'),
+        Scenario('movie with most oscars', 'get', '/api/imdb/oscars/movie_with_most_oscars'),
+        Scenario('actor with most oscars', 'get', '/api/imdb/oscars/actor_with_most_oscars/'),
+        Scenario('total oscars', 'get', '/api/imdb/oscars/total_oscars/'),
+        # function views
+        Scenario('movie search', 'get', '/api/imdb/movies/search?q=dream+gal'),
+        Scenario('ratings', 'get', '/api/imdb/ratings'),
+        Scenario('movie cast', 'get', f'/api/imdb/movies/{movie.id}/cast'),
+        Scenario('movie ratings', 'get', f'/api/imdb/movies/{movie.id}/ratings'),
+        Scenario('movie ratings avg', 'get', f'/api/imdb/movies/{movie.id}/ratings/avg'),
+        Scenario('add rating', 'post', f'/api/imdb/ratings/{movie.id}', {'rating': 8}, write=True),
+        Scenario('bulk ratings', 'post', '/api/imdb/ratings/bulk', ratings_ndjson, staff=True,
+                 content_type='application/x-ndjson', write=True),
+        Scenario('delete rating', 'delete', f'/api/imdb/ratings/delete/{rating.id}', write=True),
+        Scenario('add actor to movie', 'post', f'/api/imdb/movies/{movie.id}/actor',
+                 {'actor_name': actor.name, 'main_role': False, 'salary': 1000}, write=True),
+        # auth
+        Scenario('login', 'post', '/api/imdb/auth/login',
+                 {'username': user.username, 'password': password}, write=True),
+        Scenario('signup', 'post', '/api/imdb/auth/signup',
+                 {'email': 'benchmark-new@example.com', 'password': 'Another-password-2', 'is_staff': False},
+                 write=True),
+        Scenario('me', 'get', '/api/imdb/auth/me', staff=True),
+    ]
+
+
+class Rollback(Exception):
+    pass
+
+
+def send(client, scenario):
+    kwargs = {}
+    if scenario.content_type:
+        kwargs['content_type'] = scenario.content_type
+    elif scenario.data is not None:
+        kwargs['format'] = 'json'
+    return getattr(client, scenario.method)(scenario.url, scenario.data, **kwargs)
+
+
+def run_scenario(scenario, iterations, warmup=1, cold_cache=False, client=None, user=None):
+    client = client or APIClient()
+    if scenario.staff:
+        client.force_authenticate(user)
+    result = Result(scenario.name)
+
+    for i in range(warmup + iterations):
+        if cold_cache:
+            get_response_cache().clear()
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            if scenario.write:
+                try:
+                    with transaction.atomic():
+                        response = send(client, scenario)
+                        raise Rollback()
+                except Rollback:
+                    pass
+            else:
+                response = send(client, scenario)
+            elapsed = (time.perf_counter() - start) * 1000
+        if i < warmup:
+            continue
+        result.timings.append(elapsed)
+        result.queries.append(len(ctx.captured_queries))
+        result.statuses.add(response.status_code)
+    return result
+
+
+def run_benchmark(iterations=20, only=None, cold_cache=False, log=None):
+    log = log or (lambda name, result: None)
+    results = {}
+    with staff_user() as (user, password):
+        for scenario in build_scenarios(user, password):
+            if only and not any(name in scenario.name for name in only):
+                continue
+            results[scenario.name] = run_scenario(scenario, iterations, cold_cache=cold_cache, user=user).summary()
+            log(scenario.name, results[scenario.name])
+    return {
+        'meta': {
+            'vendor': connection.vendor,
+            'iterations': iterations,
+            'cold_cache': cold_cache,
+            'movies': Movie.objects.count(),
+            'ratings': Rating.objects.count(),
+        },
+        'scenarios': results,
+    }
+
+
+def find_regressions(report, baseline, threshold):
+    """
+    A scenario regresses when its p95 grows by more than threshold (0.2 = 20%)
+    or it runs more queries per request than in the baseline.
+    """
+    regressions = []
+    for name, current in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms")
+        if current['queries_per_request'] > previous['queries_per_request']:
+            regressions.append(f"{name}: queries per request {previous['queries_per_request']} -> "
+                               f"{current['queries_per_request']}")
+    return regressions
+
+
+# HTTP load test of running servers: many keep-alive connections at once, sent from one event loop
+
+async def read_chunked(reader):
+    while True:
+        size = int((await reader.readline()).split(b';')[0], 16)
+        if size == 0:
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            return
+        await reader.readexactly(size + 2)
+
+
+async def http_get(reader, writer, host, path):
+    # one request on an open connection, returns (status, server closes the connection)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept: application/json\r\n\r\n'.encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError('connection closed by the server')
+    status = int(status_line.split()[1])
+
+    length, chunked, close = None, False, False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding':
+            chunked = 'chunked' in value
+        elif name == 'connection':
+            close = value == 'close'
+
+    if chunked:
+        await read_chunked(reader)
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()
+        close = True
+    return status, close
+
+
+async def load_test(url, connections=100, requests=1000, cache_buster=None):
+    """
+    GETs url requests times over connections concurrent keep-alive connections,
+    returns the latency percentiles, throughput, statuses and connection errors.
+    with cache_buster every request gets a ?<cache_buster>=<n> of its own, a miss of any response cache
+    """
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    result = Result(url)
+    errors = 0
+    sent = itertools.count()
+
+    def next_path():
+        if cache_buster is None:
+            return path
+        return f"{path}{'&' if parts.query else '?'}{cache_buster}={next(sent)}"
+
+    async def worker(count):
+        nonlocal errors
+        reader = writer = None
+        for _ in range(count):
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(host, port)
+                start = time.perf_counter()
+                status, close = await http_get(reader, writer, parts.netloc, next_path())
+            except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                errors += 1
+                close = True
+            else:
+                result.timings.append((time.perf_counter() - start) * 1000)
+                result.statuses.add(status)
+            if close and writer is not None:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    connections = max(min(connections, requests), 1)
+    counts = [requests // connections + (i < requests % connections) for i in range(connections)]
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(count) for count in counts))
+    elapsed = time.perf_counter() - start
+
+    if not result.timings:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(result.timings),
+        'errors': errors,
+        'p50_ms': round(result.percentile(50), 3),
+        'p95_ms': round(result.percentile(95), 3),
+        'p99_ms': round(result.percentile(99), 3),
+        'throughput_rps': round(len(result.timings) / elapsed, 1),
+        'statuses': sorted(result.statuses),
+    }
+
+
+# query parameter no view reads, a new value per request misses the response cache of the WSGI server
+# (a process of its own, get_response_cache().clear() here would not reach it)
+CACHE_BUSTER = 'nocache'
+
+
+def server_endpoints():
+    # (name, sync path, async path) of the endpoints that have an async version (see async_views.py)
+    movie = Movie.objects.order_by('id').first()
+    if movie is None:
+        raise ValueError('The benchmark needs data, run the generate_data command first')
+    return [
+        ('movies list', '/api/imdb/movies/', '/api/imdb/async/movies/'),
+        ('movie detail', f'/api/imdb/movies/{movie.id}/', f'/api/imdb/async/movies/{movie.id}/'),
+        ('movie cast', f'/api/imdb/movies/{movie.id}/cast', f'/api/imdb/async/movies/{movie.id}/cast'),
+        ('movie ratings', f'/api/imdb/movies/{movie.id}/ratings', f'/api/imdb/async/movies/{movie.id}/ratings'),
+        ('movie ratings avg', f'/api/imdb/movies/{movie.id}/ratings/avg',
+         f'/api/imdb/async/movies/{movie.id}/ratings/avg'),
+        ('oscars list', '/api/imdb/oscars/', '/api/imdb/async/oscars/'),
+    ]
+
+
+def compare_servers(wsgi_url, asgi_url, connection_counts=(10, 100, 500), requests=2000, only=None, log=None):
+    """
+    The sync views on a WSGI server against their async versions on an ASGI server, both serving
+    the same database, e.g. gunicorn imdb_rest.wsgi and uvicorn imdb_rest.asgi:application.
+    the sync movie / oscar lists and details are response cached (cache.py) and the async views are not,
+    every request of both servers carries a parameter of its own so that both run their queries
+    """
+    log = log or (lambda name, server, connections, result: None)
+    results = {}
+    for name, sync_path, async_path in server_endpoints():
+        if only and not any(part in name for part in only):
+            continue
+        for connections in connection_counts:
+            for server, url in (('wsgi', wsgi_url.rstrip('/') + sync_path),
+                                ('asgi', asgi_url.rstrip('/') + async_path)):
+                result = asyncio.run(load_test(url, connections, requests, cache_buster=CACHE_BUSTER))
+                results.setdefault(name, {}).setdefault(str(connections), {})[server] = result
+                log(name, server, connections, result)
+    return {
+        'meta': {'wsgi': wsgi_url, 'asgi': asgi_url, 'requests': requests, 'movies': Movie.objects.count(),
+                 'response_cache': f'bypassed on both servers, every request has a ?{CACHE_BUSTER}= of its own'},
+        'endpoints': results,
+    }
+
+
+# CPU per row of the DRF serializers against the fastjson encoders
+
+def serializer_cases():
+    return [
+        ('ratings', Rating.objects.order_by('id'), RatingSerializer),
+        ('actors', Actor.objects.order_by('id'), ActorSerializer),
+        ('directors', Directors.objects.order_by('id'), DirectorsSerializer),
+        ('movies', Movie.objects.order_by('id'), MovieSerializer),
+    ]
+
+
+def cpu_time(fn, repeat):
+    # the best of repeat runs, in process CPU seconds (database driver included)
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        result = fn()
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def serializer_cpu_per_row(repeat=3, limit=None, only=None):
+    results = {}
+    for name, queryset, serializer_class in serializer_cases():
+        if only and not any(part in name for part in only):
+            continue
+        if limit:
+            queryset = queryset[:limit]
+        rows = queryset.count()
+        if not rows:
+            continue
+        encoder = compile_serializer(serializer_class)
+        drf_time, drf_body = cpu_time(
+            lambda: JSONRenderer().render(serializer_class(queryset.all(), many=True).data), repeat)
+        fast_time, fast_body = cpu_time(lambda: encoder.render(queryset.all()), repeat)
+        results[name] = {
+            'rows': rows,
+            'drf_us_per_row': round(drf_time / rows * 1e6, 3),
+            'fast_us_per_row': round(fast_time / rows * 1e6, 3),
+            'speedup': round(drf_time / fast_time, 1) if fast_time else None,
+            'identical': drf_body == fast_body,
+        }
+    return results
+
+
+def wall_time(fn, repeat):
+    # the best of repeat runs, in seconds (database time included)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def trend_cases():
+    most_rated = RatingSummary.objects.order_by('-count', 'movie_id').values_list('movie_id', flat=True).first()
+    return [
+        ('one movie by day', {'movie_ids': [most_rated], 'interval': 'day'}),
+        ('one movie by month', {'movie_ids': [most_rated], 'interval': 'month'}),
+        ('top 10 by week', {'top': 10, 'interval': 'week'}),
+        ('top 10 by month', {'top': 10, 'interval': 'month'}),
+        ('top 50 by month, 5 years', {'top': 50, 'interval': 'month', 'from_date': datetime.date(2015, 1, 1),
+                                      'to_date': datetime.date(2019, 12, 31)}),
+    ]
+
+
+def compare_trend_sources(repeat=3, only=None):
+    # the trends read from the daily rollup against the same trends bucketed from the raw ratings
+    results = {}
+    if not Rating.objects.exists():
+        return results
+    for name, kwargs in trend_cases():
+        if only and not any(part in name for part in only):
+            continue
+        raw_time, raw = wall_time(lambda: rating_trends(source='raw', **kwargs), repeat)
+        rollup_time, rollup = wall_time(lambda: rating_trends(source='rollup', **kwargs), repeat)
+        results[name] = {
+            'movies': len(rollup),
+            'buckets': sum(len(movie['trend']) for movie in rollup),
+            'raw_ms': round(raw_time * 1000, 2),
+            'rollup_ms': round(rollup_time * 1000, 2),
+            'speedup': round(raw_time / rollup_time, 1) if rollup_time else None,
+            'identical': raw == rollup,
+        }
+    return results
+
+
+def auth_modes(user, password):
+    # name, Authorization header, settings; the first one is the baseline
+    basic = 'Basic ' + base64.b64encode(f'{user.username}:{password}'.encode()).decode()
+    bearer = 'Bearer ' + str(ClaimsTokenObtainPairSerializer.get_token(user).access_token)
+    return [
+        ('anonymous', None, {}),
+        ('basic', basic, {'BASIC_AUTH_CACHE': {'MAX_ENTRIES': 0}}),
+        ('basic, cached', basic, {}),
+        ('jwt', bearer, {'STATELESS_JWT_MAX_AGE': None}),
+        ('jwt, stateless', bearer, {}),
+    ]
+
+
+def auth_overhead(iterations=20, url='/api/imdb/movies/top?limit=1'):
+    # the same small read with every way of authenticating, overhead_ms is the p50 above the anonymous one
+    results = {}
+    with staff_user() as (user, password):
+        for name, authorization, overrides in auth_modes(user, password):
+            client = APIClient()
+            if authorization:
+                client.credentials(HTTP_AUTHORIZATION=authorization)
+            with override_settings(**overrides):
+                result = run_scenario(Scenario(name, 'get', url), iterations, client=client)
+            results[name] = result.summary()
+    baseline = next(iter(results.values()))['p50_ms']
+    for result in results.values():
+        result['overhead_ms'] = round(result['p50_ms'] - baseline, 3)
+    return results
+
+
+POOLED_ENGINES = {
+    'django.db.backends.postgresql': 'imdb_app.backends.postgresql',
+    'django.db.backends.sqlite3': 'imdb_app.backends.sqlite3',
+}
+
+
+def connection_modes(settings_dict):
+    # name, engine, CONN_MAX_AGE; the first one is the baseline
+    engine = settings_dict['ENGINE']
+    plain = next((django_engine for django_engine, pooled in POOLED_ENGINES.items() if pooled == engine), engine)
+    return [
+        ('new connection', plain, 0),
+        ('persistent', plain, None),
+        ('pooled', POOLED_ENGINES[plain], 0),
+    ]
+
+
+def connection_requests(settings_dict, alias, iterations, result):
+    # what a request does with its connection: checked at the start, one query, given up at the end.
+    # the wrapper is made in the thread using it, like Django's connections
+    wrapper = load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, alias)
+    for _ in range(iterations):
+        start = time.perf_counter()
+        wrapper.close_if_unusable_or_obsolete()
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+        wrapper.close_if_unusable_or_obsolete()
+        result.timings.append((time.perf_counter() - start) * 1000)
+        result.queries.append(1)
+    wrapper.close()
+
+
+def connection_overhead(iterations=200, threads=1, alias='default'):
+    """
+    The time of a one query request with a new connection per request, with a persistent connection and
+    with a pooled one, from `threads` threads at once. saved_ms is the p50 below the new connection one.
+    """
+    settings_dict = connections[alias].settings_dict
+    results = {}
+    for name, engine, max_age in connection_modes(settings_dict):
+        backend_alias = f'benchmark-{name}'
+        mode_settings = {**settings_dict, 'ENGINE': engine, 'CONN_MAX_AGE': max_age, 'CONN_HEALTH_CHECKS': True}
+        # one Result per thread, merged once they are done
+        partial = [Result(name) for _ in range(threads)]
+        workers = [threading.Thread(target=connection_requests, args=(mode_settings, backend_alias, iterations, part))
+                   for part in partial]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        result = Result(name)
+        for part in partial:
+            result.timings += part.timings
+            result.queries += part.queries
+        results[name] = result.summary()
+        pools = pool_stats(backend_alias)
+        if pools:
+            results[name]['pool'] = pools[0]
+        close_pools(backend_alias)
+    baseline = next(iter(results.values()))['p50_ms']
+    for result in results.values():
+        result['saved_ms'] = round(baseline - result['p50_ms'], 3)
+    return results
+
+
+def synthetic_cast(actors, movies, cast_per_movie, seed=0):
+    # (actor_id, movie_id) of a synthetic catalogue, a fifth of the cast drawn from the busiest 1% of the actors
+    rng = random.Random(seed)
+    stars = max(actors // 100, 1)
+    for movie_id in range(1, movies + 1):
+        for _ in range(cast_per_movie):
+            yield (rng.randrange(stars) if rng.random() < 0.2 else rng.randrange(actors)) + 1, movie_id
+
+
+def search_summary(timings, degrees):
+    result = Result('', timings=timings)
+    connected = [n for n in degrees if n is not None]
+    return {
+        'searches': len(timings),
+        'p50_ms': round(result.percentile(50), 3),
+        'p95_ms': round(result.percentile(95), 3),
+        'p99_ms': round(result.percentile(99), 3),
+        'connected': len(connected),
+        'mean_degrees': round(statistics.mean(connected), 2) if connected else None,
+    }
+
+
+def costar_search(actors=200000, movies=100000, cast_per_movie=10, searches=200, one_way_searches=20, seed=0):
+    """
+    Builds the co-star graph of a synthetic catalogue (no database) and times shortest path searches between
+    random actors, bidirectional and, on the first one_way_searches pairs, one way from the source.
+    """
+    start = time.perf_counter()
+    graph = CoStarGraph(synthetic_cast(actors, movies, cast_per_movie, seed))
+    build_time = time.perf_counter() - start
+
+    rng = random.Random(seed + 1)
+    ids = graph.actors.ids
+    pairs = [(ids[rng.randrange(len(ids))], ids[rng.randrange(len(ids))]) for _ in range(searches)]
+    timings, degrees = timed_paths(graph, pairs)
+    one_way_timings, one_way_degrees = timed_paths(graph, pairs[:one_way_searches], bidirectional=False)
+    return {
+        'graph': {
+            'actors': len(ids),
+            'movies': len(graph.movies.ids),
+            'cast_rows': graph.edges,
+            'build_s': round(build_time, 2),
+            'arrays_mb': round(graph.nbytes() / 2 ** 20, 1),
+            'max_degrees': MAX_DEGREES,
+        },
+        'bidirectional': search_summary(timings, degrees),
+        'one way': {**search_summary(one_way_timings, one_way_degrees),
+                    'same_degrees': one_way_degrees == degrees[:one_way_searches]},
+    }
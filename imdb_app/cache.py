@@ -0,0 +1,211 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.signals import setting_changed
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from imdb_app.routers import current_replica
+
+# response cache for the catalogue viewsets. settings.RESPONSE_CACHE:
+#   BACKEND:     'lru' for a per process LRU, or the alias of a Django cache (shared between workers)
+#   MAX_ENTRIES: size of the LRU
+#   TIMEOUT:     seconds an entry lives, bounds staleness for writes that send no signals
+# every model has a generation number that is part of the key of the responses built from it,
+# a write bumps the generation (see signals.py) so the old entries are never read again.
+# responses read from a replica have keys of their own: one stored while the replica lags behind a
+# write must not be served to the client of the write, which reads from the primary (see routers.py)
+DEFAULT_SETTINGS = {'BACKEND': 'lru', 'MAX_ENTRIES': 1024, 'TIMEOUT': 300}
+KEY_PREFIX = 'imdb:response'
+_NOT_CACHED = object()
+
+
+class LRUCache:
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        result = {}
+        for key in keys:
+            value = self.get(key, _NOT_CACHED)
+            if value is not _NOT_CACHED:
+                result[key] = value
+        return result
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        # same timeout semantics as Django caches, None never expires
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.timeout
+        expires = float('inf') if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def incr(self, key):
+        with self.lock:
+            if key not in self.entries:
+                raise ValueError(key)
+            value, expires = self.entries[key]
+            self.entries[key] = (value + 1, expires)
+            return value + 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class ResponseCache:
+
+    def __init__(self, backend, timeout):
+        self.backend = backend
+        self.timeout = timeout
+
+    def generation_key(self, model):
+        return f'{KEY_PREFIX}:generation:{model._meta.label_lower}'
+
+    def new_generation(self):
+        # a counter that was evicted must not come back at a value old entries were stored under
+        return time.time_ns()
+
+    def generations(self, models):
+        keys = [self.generation_key(model) for model in models]
+        found = self.backend.get_many(keys)
+        for key in keys:
+            if key not in found:
+                found[key] = self.new_generation()
+                self.backend.set(key, found[key], None)
+        return [found[key] for key in keys]
+
+    def invalidate(self, model):
+        key = self.generation_key(model)
+        try:
+            self.backend.incr(key)
+        except ValueError:
+            self.backend.set(key, self.new_generation(), None)
+
+    def response_key(self, request, models):
+        params = sorted((name, value) for name in request.query_params
+                        for value in request.query_params.getlist(name))
+        source = 'primary' if current_replica.get() is None else 'replica'
+        raw = json.dumps([request.path, params, user_role(request.user), source, self.generations(models)])
+        return f'{KEY_PREFIX}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.timeout)
+
+    def clear(self):
+        self.backend.clear()
+
+
+def user_role(user):
+    if not user or not user.is_authenticated:
+        return 'anonymous'
+    return 'staff' if user.is_staff else 'user'
+
+
+def make_etag(data):
+    content = json.dumps(data, cls=JSONEncoder, sort_keys=True)
+    return f'"{hashlib.md5(content.encode()).hexdigest()}"'
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        options = {**DEFAULT_SETTINGS, **getattr(settings, 'RESPONSE_CACHE', {})}
+        if options['BACKEND'] == 'lru':
+            backend = LRUCache(options['MAX_ENTRIES'], options['TIMEOUT'])
+        else:
+            backend = caches[options['BACKEND']]
+        _response_cache = ResponseCache(backend, options['TIMEOUT'])
+    return _response_cache
+
+
+def reset_response_cache(*, setting, **kwargs):
+    global _response_cache
+    if setting == 'RESPONSE_CACHE':
+        _response_cache = None
+
+
+setting_changed.connect(reset_response_cache)
+
+
+def invalidate(model):
+    get_response_cache().invalidate(model)
+
+
+def invalidate_on_write(model):
+    invalidate(model)
+    # again after commit, a read between the write and the commit may have cached the old rows
+    transaction.on_commit(lambda: invalidate(model))
+
+
+class CachedResponseMixin:
+    """
+    Caches list / retrieve responses of a viewset and answers If-None-Match with 304.
+    cache_models are the models the responses are built from, get_cache_models() can vary them by action.
+    """
+    cache_models = ()
+
+    def get_cache_models(self):
+        return self.cache_models
+
+    def cached_response(self, request, build_response, *args, **kwargs):
+        response_cache = get_response_cache()
+        key = response_cache.response_key(request, self.get_cache_models())
+        cached = response_cache.get(key)
+        if cached is None:
+            response = build_response(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cached = (make_etag(response.data), response.data)
+            response_cache.set(key, cached)
+
+        etag, data = cached
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(data, headers={'ETag': etag})
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
@@ -0,0 +1,335 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.db import transaction
+
+from imdb_app.models import Actor, Movie, MovieActor
+
+# "degrees of separation" between actors: an in process index of the actor <-> movie graph of the
+# movie_actors table and a bidirectional breadth first search over it.
+# the graph is two CSR adjacency lists in integer arrays (the movies of every actor and the cast of every
+# movie, by position in the sorted id arrays), 8 bytes per id and per cast row and direction. changes since
+# the arrays were built live in small per node overlays, merged into new arrays once they grow:
+#   new / updated / deleted rows: MovieActor signals, after the commit (see signals.py)
+#   bulk inserts:                read with id > the highest id seen - SYNC_WINDOW, before every search
+#   the same in other processes: the cast of the actors of a path is read again before it is returned, the
+#                                search runs again if it changed
+
+MAX_DEGREES = 6
+# overlay changes, as a share of the cast rows, that get the arrays rebuilt
+COMPACT_RATIO = 0.1
+MIN_COMPACT = 1000
+CHUNK_SIZE = 10000
+# ids are taken at insert and not at commit, a transaction committing after a later one has rows below the
+# highest id seen: sync reads the last SYNC_WINDOW ids again
+SYNC_WINDOW = 200
+
+
+class Side:
+    # one direction of the adjacency: the neighbours of node i are targets[offsets[i]:offsets[i + 1]],
+    # plus added[i], minus removed[i]
+
+    def __init__(self, ids, offsets, targets):
+        self.ids = ids
+        self.offsets = offsets
+        self.targets = targets
+        self.view = memoryview(targets)
+        self.base = len(ids)
+        # the nodes added after the arrays were built, at the positions from self.base on
+        self.extra = {}
+        self.extra_ids = []
+        self.added = {}
+        self.removed = {}
+
+    def position(self, node_id, create=False):
+        i = bisect_left(self.ids, node_id)
+        if i < self.base and self.ids[i] == node_id:
+            return i
+        position = self.extra.get(node_id)
+        if position is None and create:
+            position = self.extra[node_id] = self.base + len(self.extra_ids)
+            self.extra_ids.append(node_id)
+        return position
+
+    def node_id(self, position):
+        return self.ids[position] if position < self.base else self.extra_ids[position - self.base]
+
+    def base_neighbours(self, position):
+        if position >= self.base:
+            return self.view[0:0]
+        return self.view[self.offsets[position]:self.offsets[position + 1]]
+
+    def neighbours(self, position):
+        base = self.base_neighbours(position)
+        added, removed = self.added.get(position), self.removed.get(position)
+        if not added and not removed:
+            return base
+        return [n for n in base if not removed or n not in removed] + list(added or ())
+
+    def has(self, position, neighbour):
+        if neighbour in self.added.get(position, ()):
+            return True
+        return neighbour not in self.removed.get(position, ()) and neighbour in self.base_neighbours(position)
+
+    def add(self, position, neighbour):
+        removed = self.removed.get(position)
+        if removed and neighbour in removed:
+            removed.discard(neighbour)
+        elif neighbour not in self.base_neighbours(position):
+            self.added.setdefault(position, set()).add(neighbour)
+
+    def remove(self, position, neighbour):
+        added = self.added.get(position)
+        if added and neighbour in added:
+            added.discard(neighbour)
+        elif neighbour in self.base_neighbours(position):
+            self.removed.setdefault(position, set()).add(neighbour)
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.ids, self.offsets, self.targets))
+
+
+def csr(ids, count, keys, source, target):
+    # offsets / targets of `count` nodes from the sorted (actor, movie) keys, grouped by key[source]
+    offsets = array('q', bytes(8 * (count + 1)))
+    for key in keys:
+        offsets[key[source] + 1] += 1
+    for i in range(count):
+        offsets[i + 1] += offsets[i]
+    targets = array('q', bytes(8 * len(keys)))
+    cursor = array('q', offsets)
+    for key in keys:
+        targets[cursor[key[source]]] = key[target]
+        cursor[key[source]] += 1
+    return Side(ids, offsets, targets)
+
+
+class CoStarGraph:
+
+    def __init__(self, pairs, last_id=0):
+        """pairs: (actor_id, movie_id) of the cast rows, duplicates allowed"""
+        pairs = set(pairs)
+        actor_ids = array('q', sorted({actor_id for actor_id, _ in pairs}))
+        movie_ids = array('q', sorted({movie_id for _, movie_id in pairs}))
+        actor_index = {actor_id: i for i, actor_id in enumerate(actor_ids)}
+        movie_index = {movie_id: i for i, movie_id in enumerate(movie_ids)}
+        keys = sorted((actor_index[actor_id], movie_index[movie_id]) for actor_id, movie_id in pairs)
+        self.actors = csr(actor_ids, len(actor_ids), keys, 0, 1)
+        self.movies = csr(movie_ids, len(movie_ids), keys, 1, 0)
+        self.edges = len(keys)
+        # links added / removed since the arrays were built
+        self.changes = 0
+        self.last_id = last_id
+        self.lock = threading.RLock()
+
+    @classmethod
+    def from_database(cls, chunk_size=CHUNK_SIZE):
+        with transaction.atomic():
+            rows = MovieActor.objects.order_by().values_list('id', 'actor_id', 'movie_id').iterator(chunk_size)
+            last_id = 0
+            pairs = set()
+            for row_id, actor_id, movie_id in rows:
+                pairs.add((actor_id, movie_id))
+                last_id = max(last_id, row_id)
+        return cls(pairs, last_id)
+
+    def pairs(self):
+        # the (actor_id, movie_id) of every current link
+        for position in range(self.actors.base + len(self.actors.extra_ids)):
+            actor_id = self.actors.node_id(position)
+            for movie in self.actors.neighbours(position):
+                yield actor_id, self.movies.node_id(movie)
+
+    def nbytes(self):
+        return self.actors.nbytes() + self.movies.nbytes()
+
+    def link(self, actor_id, movie_id):
+        with self.lock:
+            actor = self.actors.position(actor_id, create=True)
+            movie = self.movies.position(movie_id, create=True)
+            if not self.actors.has(actor, movie):
+                self.actors.add(actor, movie)
+                self.movies.add(movie, actor)
+                self.edges += 1
+                self.changes += 1
+            self.compact_if_needed()
+
+    def unlink(self, actor_id, movie_id):
+        with self.lock:
+            actor, movie = self.actors.position(actor_id), self.movies.position(movie_id)
+            if actor is not None and movie is not None and self.actors.has(actor, movie):
+                self.actors.remove(actor, movie)
+                self.movies.remove(movie, actor)
+                self.edges -= 1
+                self.changes += 1
+            self.compact_if_needed()
+
+    def compact_if_needed(self):
+        if self.changes > max(MIN_COMPACT, self.edges * COMPACT_RATIO):
+            rebuilt = CoStarGraph(self.pairs(), self.last_id)
+            self.actors, self.movies, self.edges, self.changes = rebuilt.actors, rebuilt.movies, rebuilt.edges, 0
+
+    def sync(self):
+        # the cast rows added without signals (bulk inserts, other processes), one index range query
+        rows = MovieActor.objects.filter(id__gt=self.last_id - SYNC_WINDOW).order_by('id') \
+            .values_list('id', 'actor_id', 'movie_id')
+        for row_id, actor_id, movie_id in rows:
+            self.link(actor_id, movie_id)
+            self.last_id = max(self.last_id, row_id)
+
+    def refresh(self, pairs):
+        # the links of (actor_id, movie_id) pairs as they are in the database, after an update / delete
+        pairs = set(pairs)
+        if not pairs:
+            return
+        actor_ids = {actor_id for actor_id, _ in pairs}
+        movie_ids = {movie_id for _, movie_id in pairs}
+        existing = set(MovieActor.objects.filter(actor_id__in=actor_ids, movie_id__in=movie_ids)
+                       .values_list('actor_id', 'movie_id'))
+        for actor_id, movie_id in pairs:
+            if (actor_id, movie_id) in existing:
+                self.link(actor_id, movie_id)
+            else:
+                self.unlink(actor_id, movie_id)
+
+    def refresh_actors(self, actor_ids):
+        # the links of actors as they are in the database, returns the number of links that changed
+        expected = {actor_id: set() for actor_id in actor_ids}
+        for actor_id, movie_id in MovieActor.objects.filter(actor_id__in=list(expected)) \
+                .values_list('actor_id', 'movie_id'):
+            expected[actor_id].add(movie_id)
+        changed = 0
+        with self.lock:
+            for actor_id, movie_ids in expected.items():
+                position = self.actors.position(actor_id)
+                current = set() if position is None else \
+                    {self.movies.node_id(movie) for movie in self.actors.neighbours(position)}
+                for movie_id in movie_ids - current:
+                    self.link(actor_id, movie_id)
+                for movie_id in current - movie_ids:
+                    self.unlink(actor_id, movie_id)
+                changed += len(movie_ids ^ current)
+        return changed
+
+    def shortest_path(self, source_id, target_id, max_degrees=MAX_DEGREES, bidirectional=True):
+        """
+        ([actor ids], [movie ids]) of a shortest chain of co-stars from source to target, movie i shared by
+        actors i and i + 1, or None if there is none of at most max_degrees movies.
+        The smaller of the two frontiers is expanded one level at a time; a movie is scanned once per side.
+        """
+        with self.lock:
+            source, target = self.actors.position(source_id), self.actors.position(target_id)
+            if source is None or target is None:
+                return ([source_id], []) if source_id == target_id else None
+            if source == target:
+                return [source_id], []
+            # actor -> (previous actor, movie, depth), toward the source / the target
+            parents = ({source: (None, None, 0)}, {target: (None, None, 0)})
+            seen_movies = (set(), set())
+            frontiers = ([source], [target])
+            depths = [0, 0]
+            while frontiers[0] and frontiers[1] and depths[0] + depths[1] < max_degrees:
+                side = 0 if not bidirectional or len(frontiers[0]) <= len(frontiers[1]) else 1
+                mine, other, seen = parents[side], parents[1 - side], seen_movies[side]
+                best = None
+                next_frontier = []
+                for actor in frontiers[side]:
+                    for movie in self.actors.neighbours(actor):
+                        if movie in seen:
+                            continue
+                        seen.add(movie)
+                        for costar in self.movies.neighbours(movie):
+                            if costar in mine:
+                                continue
+                            mine[costar] = (actor, movie, depths[side] + 1)
+                            next_frontier.append(costar)
+                            if costar in other:
+                                length = depths[side] + 1 + other[costar][2]
+                                if best is None or length < best[0]:
+                                    best = (length, costar)
+                depths[side] += 1
+                frontiers[side][:] = next_frontier
+                if best is not None:
+                    return self.path_through(best[1], parents)
+            return None
+
+    def path_through(self, meeting, parents):
+        actors, movies = [meeting], []
+        actor = meeting
+        while parents[0][actor][0] is not None:
+            actor, movie, _ = parents[0][actor]
+            actors.insert(0, actor)
+            movies.insert(0, movie)
+        actor = meeting
+        while parents[1][actor][0] is not None:
+            actor, movie, _ = parents[1][actor]
+            actors.append(actor)
+            movies.append(movie)
+        return [self.actors.node_id(a) for a in actors], [self.movies.node_id(m) for m in movies]
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_costar_graph():
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            _graph = CoStarGraph.from_database()
+        return _graph
+
+
+def loaded_costar_graph():
+    # None while no search has built the graph, writes then have nothing to update
+    return _graph
+
+
+def reset_costar_graph():
+    global _graph
+    with _graph_lock:
+        _graph = None
+
+
+def actor_path(source_id, target_id, max_degrees=MAX_DEGREES, attempts=3):
+    """
+    {'degrees': n, 'path': [{'actor': {id, name}, 'movie': {id, name, release_year} or None}]}, the movie of
+    a step being the one its actor shares with the actor of the previous step. degrees is None and path
+    empty when the actors aren't connected within max_degrees.
+    """
+    graph = get_costar_graph()
+    graph.sync()
+    found = None
+    for _ in range(attempts):
+        found = graph.shortest_path(source_id, target_id, max_degrees)
+        # the cast of the path's actors is read again, a path over links that changed is searched again
+        if found is None or not found[1] or not graph.refresh_actors(found[0]):
+            break
+        found = None
+    if found is None:
+        return {'degrees': None, 'path': []}
+
+    actor_ids, movie_ids = found
+    actors = dict(Actor.objects.filter(id__in=actor_ids).values_list('id', 'name'))
+    movies = {movie_id: {'id': movie_id, 'name': name, 'release_year': release_year}
+              for movie_id, name, release_year in
+              Movie.objects.filter(id__in=movie_ids).values_list('id', 'name', 'release_year')}
+    return {
+        'degrees': len(movie_ids),
+        'path': [{'actor': {'id': actor_id, 'name': actors.get(actor_id)},
+                  'movie': movies.get(movie_ids[i - 1]) if i else None}
+                 for i, actor_id in enumerate(actor_ids)],
+    }
+
+
+def timed_paths(graph, queries, max_degrees=MAX_DEGREES, bidirectional=True):
+    # milliseconds per search and degrees found (None: not connected) for (source, target) pairs
+    timings, degrees = [], []
+    for source_id, target_id in queries:
+        start = time.perf_counter()
+        found = graph.shortest_path(source_id, target_id, max_degrees, bidirectional)
+        timings.append((time.perf_counter() - start) * 1000)
+        degrees.append(len(found[1]) if found else None)
+    return timings, degrees
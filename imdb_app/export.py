@@ -0,0 +1,182 @@
+import csv
+import datetime
+
+from django.db.models import F
+from rest_framework.utils.encoders import JSONEncoder
+
+from imdb_app.models import Rating, Movie, MovieActor, Oscars
+
+# streamed NDJSON / CSV exports. rows are read with iterator(chunk_size=...) (a server side cursor on
+# PostgreSQL) and written one chunk at a time, so the memory of a worker doesn't grow with the table.
+# the filters are parsed before anything is streamed, a bad one raises ValueError
+
+DEFAULT_CHUNK_SIZE = 2000
+MAX_CHUNK_SIZE = 20000
+OUTPUTS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+RATING_COLUMNS = ['id', 'movie_id', 'rating', 'rating_date']
+MOVIE_COLUMNS = ['id', 'name', 'description', 'duration_in_min', 'release_year', 'pic_url']
+CAST_COLUMNS = ['actor', 'actor_name', 'salary', 'main_role']
+OSCAR_COLUMNS = ['id', 'nomination', 'ceremony_year', 'movie_id', 'movie_name', 'actor_id', 'actor_name',
+                 'director_id', 'director_name']
+
+json_encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def parse_date(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be in YYYY-MM-DD format')
+
+
+def parse_int(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+
+
+def parse_ids(params, name):
+    # ?movie=1&movie=2 or ?movie=1,2
+    ids = []
+    for value in params.getlist(name):
+        for part in value.split(','):
+            if part:
+                try:
+                    ids.append(int(part))
+                except ValueError:
+                    raise ValueError(f'{name} must be a list of ids')
+    return ids
+
+
+class Echo:
+    # a file for csv.writer that hands back what is written
+    def write(self, value):
+        return value
+
+
+def write_csv(columns, rows, chunk_size):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    chunk = []
+    for row in rows:
+        chunk.append(writer.writerow(['' if value is None else value for value in row]))
+        if len(chunk) == chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def write_ndjson(objects, chunk_size):
+    encode = json_encoder.encode
+    chunk = []
+    for obj in objects:
+        chunk.append(encode(obj) + '\n')
+        if len(chunk) == chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def write_rows(columns, rows, output, chunk_size):
+    if output == 'csv':
+        return write_csv(columns, rows, chunk_size)
+    return write_ndjson((dict(zip(columns, row)) for row in rows), chunk_size)
+
+
+def export_ratings(params, output, chunk_size=DEFAULT_CHUNK_SIZE):
+    # ?from_date=&to_date= (YYYY-MM-DD, inclusive) and ?movie=<id>[,<id>...]
+    # the rows can be imported again with ratings/bulk
+    queryset = Rating.objects.order_by('id')
+    from_date, to_date = parse_date(params, 'from_date'), parse_date(params, 'to_date')
+    movie_ids = parse_ids(params, 'movie')
+    if from_date:
+        queryset = queryset.filter(rating_date__gte=from_date)
+    if to_date:
+        queryset = queryset.filter(rating_date__lte=to_date)
+    if movie_ids:
+        queryset = queryset.filter(movie_id__in=movie_ids)
+    rows = queryset.values_list(*RATING_COLUMNS).iterator(chunk_size=chunk_size)
+    return write_rows(RATING_COLUMNS, rows, output, chunk_size)
+
+
+def export_oscars(params, output, chunk_size=DEFAULT_CHUNK_SIZE):
+    # ?from_year=&to_year= (ceremony years, inclusive) and ?movie=<id>[,<id>...]
+    queryset = Oscars.objects.order_by('id').annotate(
+        movie_name=F('movie__name'),
+        actor_name=F('actor__name'),
+        director_name=F('director__name'),
+    )
+    from_year, to_year = parse_int(params, 'from_year'), parse_int(params, 'to_year')
+    movie_ids = parse_ids(params, 'movie')
+    if from_year is not None:
+        queryset = queryset.filter(ceremony_year__gte=from_year)
+    if to_year is not None:
+        queryset = queryset.filter(ceremony_year__lte=to_year)
+    if movie_ids:
+        queryset = queryset.filter(movie_id__in=movie_ids)
+    rows = queryset.values_list(*OSCAR_COLUMNS).iterator(chunk_size=chunk_size)
+    return write_rows(OSCAR_COLUMNS, rows, output, chunk_size)
+
+
+def iter_movies_with_cast(movies, chunk_size):
+    # (movie row, [cast rows]) with one cast query per chunk of movies
+    chunk = []
+    for movie in movies.iterator(chunk_size=chunk_size):
+        chunk.append(movie)
+        if len(chunk) == chunk_size:
+            yield from with_cast(chunk)
+            chunk = []
+    if chunk:
+        yield from with_cast(chunk)
+
+
+def with_cast(movies):
+    cast = {}
+    rows = MovieActor.objects.filter(movie_id__in=[movie[0] for movie in movies]) \
+        .order_by('movie_id', 'id').values_list('movie_id', 'actor_id', 'actor__name', 'salary', 'main_role')
+    for movie_id, *member in rows:
+        cast.setdefault(movie_id, []).append(member)
+    for movie in movies:
+        yield movie, cast.get(movie[0], [])
+
+
+def export_movies(params, output, chunk_size=DEFAULT_CHUNK_SIZE):
+    # ?from_year=&to_year= (release years, inclusive) and ?movie=<id>[,<id>...].
+    # NDJSON has one movie per line with its cast (the shape movies/batch/ takes),
+    # CSV one line per cast member (and one for a movie without cast)
+    queryset = Movie.objects.order_by('id')
+    from_year, to_year = parse_int(params, 'from_year'), parse_int(params, 'to_year')
+    movie_ids = parse_ids(params, 'movie')
+    if from_year is not None:
+        queryset = queryset.filter(release_year__gte=from_year)
+    if to_year is not None:
+        queryset = queryset.filter(release_year__lte=to_year)
+    if movie_ids:
+        queryset = queryset.filter(id__in=movie_ids)
+    movies = iter_movies_with_cast(queryset.values_list(*MOVIE_COLUMNS), chunk_size)
+
+    if output == 'csv':
+        rows = (movie + tuple(member) for movie, cast in movies for member in (cast or [[None] * 4]))
+        return write_csv(MOVIE_COLUMNS + CAST_COLUMNS, rows, chunk_size)
+    return write_ndjson(({**dict(zip(MOVIE_COLUMNS, movie)), 'cast': [dict(zip(CAST_COLUMNS, m)) for m in cast]}
+                         for movie, cast in movies), chunk_size)
+
+
+EXPORTS = {
+    'ratings': export_ratings,
+    'movies': export_movies,
+    'oscars': export_oscars,
+}
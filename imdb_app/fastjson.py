@@ -0,0 +1,196 @@
+import json
+import math
+from json.encoder import encode_basestring
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from imdb_app.serializers import TimedSerializerMixin
+
+# fast path for read only lists: rows come from values_list() and are written straight to JSON by
+# per field encoders compiled once per serializer, skipping serializer instances and to_representation.
+# the bytes are the ones JSONRenderer writes for serializer.data (compact, unicode, strict floats).
+# serializers with fields that have no encoder here fall back to DRF. settings.FAST_SERIALIZATION turns it off
+
+CHUNK_SIZE = 2000
+
+
+def encode_int(value):
+    return 'null' if value is None else int.__repr__(int(value))
+
+
+def encode_float(value):
+    if value is None:
+        return 'null'
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError('Out of range float values are not JSON compliant: ' + repr(value))
+    return float.__repr__(value)
+
+
+def encode_str(value):
+    return 'null' if value is None else encode_basestring(str(value))
+
+
+def encode_bool(value):
+    if value is None:
+        return 'null'
+    return 'true' if value else 'false'
+
+
+def encode_date(value):
+    # DateField returns None for every false value
+    return encode_basestring(value.isoformat()) if value else 'null'
+
+
+def field_encoder(field):
+    # the encoder of a serializer field, None when the fast path can't reproduce its to_representation
+    if isinstance(field, serializers.BooleanField):
+        return encode_bool
+    if isinstance(field, serializers.IntegerField):
+        return encode_int
+    if isinstance(field, serializers.FloatField):
+        return encode_float
+    if isinstance(field, serializers.DateField):
+        output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+        return encode_date if output_format == 'iso-8601' else None
+    if type(field) in (serializers.CharField, serializers.URLField, serializers.EmailField, serializers.SlugField):
+        return encode_str
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        return encode_int
+    return None
+
+
+class RowEncoder:
+    """
+    Writes values_list() rows of a model serializer as JSON objects, see compile_serializer
+    """
+
+    def __init__(self, columns, keys, encoders):
+        self.columns = columns
+        # '{"name":', ',"release_year":', ...
+        self.prefixes = [('{' if i == 0 else ',') + encode_basestring(key) + ':' for i, key in enumerate(keys)]
+        self.encoders = encoders
+        self.items = list(zip(range(len(columns)), self.prefixes, self.encoders))
+
+    def encode_row(self, row):
+        if not self.items:
+            return '{}'
+        return ''.join([prefix + encode(row[i]) for i, prefix, encode in self.items]) + '}'
+
+    def iter_json(self, queryset, chunk_size=CHUNK_SIZE):
+        # the JSON list in pieces, one piece per chunk of rows
+        rows = queryset.values_list(*self.columns).iterator(chunk_size=chunk_size)
+        encode_row = self.encode_row
+        chunk = []
+        first = True
+        for row in rows:
+            chunk.append(encode_row(row))
+            if len(chunk) == chunk_size:
+                yield ('[' if first else ',') + ','.join(chunk)
+                first = False
+                chunk = []
+        if chunk or first:
+            yield ('[' if first else ',') + ','.join(chunk)
+        yield ']'
+
+    def render(self, queryset):
+        return escape_separators(''.join(self.iter_json(queryset))).encode()
+
+
+def escape_separators(text):
+    # as JSONRenderer, keeps the output a strict javascript subset
+    return text.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+
+_compiled = {}
+
+
+def compile_serializer(serializer_class, fields=None):
+    """
+    The RowEncoder of a ModelSerializer (with the DynamicFieldsMixin fields= if given),
+    None when one of its readable fields isn't a plain column
+    """
+    key = (serializer_class, tuple(fields) if fields is not None else None)
+    if key not in _compiled:
+        _compiled[key] = build_row_encoder(serializer_class, fields)
+    return _compiled[key]
+
+
+def build_row_encoder(serializer_class, fields):
+    # the timing of TimedSerializerMixin doesn't change the output
+    if serializer_class.to_representation not in (serializers.ModelSerializer.to_representation,
+                                                  TimedSerializerMixin.to_representation):
+        return None
+    kwargs = {'fields': fields} if fields is not None else {}
+    serializer = serializer_class(**kwargs)
+    model = serializer.Meta.model
+    columns, keys, encoders = [], [], []
+    for field in serializer._readable_fields:
+        encoder = field_encoder(field)
+        if encoder is None or '.' in field.source or field.source == '*':
+            return None
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        if not model_field.concrete or model_field.many_to_many:
+            return None
+        columns.append(model_field.attname)
+        keys.append(field.field_name)
+        encoders.append(encoder)
+    return RowEncoder(columns, keys, encoders)
+
+
+class PreRenderedJSON(bytes):
+    # JSON that is already rendered, passed through by FastJSONRenderer
+    pass
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, PreRenderedJSON):
+            return bytes(data)
+        if isinstance(data, dict) and any(isinstance(value, PreRenderedJSON) for value in data.values()):
+            # a pagination envelope around a pre rendered page, only built in fast_mode (compact, unicode)
+            items = [encode_basestring(str(key)) + ':' + (
+                value.decode() if isinstance(value, PreRenderedJSON)
+                else json.dumps(value, cls=self.encoder_class, ensure_ascii=False, allow_nan=False,
+                                separators=(',', ':'))
+            ) for key, value in data.items()]
+            return escape_separators('{' + ','.join(items) + '}').encode()
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+def fast_mode(request):
+    # the encoders write compact, unicode, strict JSON, like JSONRenderer with the default settings
+    renderer = getattr(request, 'accepted_renderer', None)
+    return getattr(settings, 'FAST_SERIALIZATION', True) and isinstance(renderer, FastJSONRenderer) \
+        and renderer.compact and renderer.strict and not renderer.ensure_ascii \
+        and renderer.get_indent(request.accepted_media_type, {}) is None
+
+
+def list_response(request, queryset, serializer_class, fields=None):
+    # Response(serializer_class(queryset, many=True).data), rendered by the fast path when it can
+    if fast_mode(request):
+        encoder = compile_serializer(serializer_class, fields)
+        if encoder is not None:
+            return Response(PreRenderedJSON(encoder.render(queryset)))
+    kwargs = {'fields': fields} if fields is not None else {}
+    return Response(serializer_class(queryset, many=True, **kwargs).data)
+
+
+def paginated_response(request, paginator, page, serializer_class):
+    # paginator.get_paginated_response(serializer_class(page, many=True).data), with the page rendered
+    # by the fast path when it is still a queryset (see LazyPageNumberPagination)
+    if fast_mode(request) and isinstance(page, QuerySet):
+        encoder = compile_serializer(serializer_class)
+        if encoder is not None:
+            return paginator.get_paginated_response(PreRenderedJSON(encoder.render(page)))
+    return paginator.get_paginated_response(serializer_class(page, many=True).data)
@@ -0,0 +1,124 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework.exceptions import ValidationError
+
+from imdb_app.models import MovieActor
+
+# ?fields= / ?expand= for the viewsets: clients name the fields they want, only those columns are
+# selected, and related objects are joined / prefetched only when they are expanded
+
+
+def split_param(value):
+    return [name for name in value.split(',') if name]
+
+
+def sparse_fields(request, resource, allowed):
+    # ?fields=a,b keeps only those fields of the resource of the response (resource None),
+    # ?fields[<resource>]=a,b those of a nested one. None when not asked for
+    param = 'fields' if resource is None else f'fields[{resource}]'
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return checked_names(split_param(value), allowed, param, 'Unknown fields')
+
+
+def checked_names(names, allowed, param, message):
+    unknown = sorted(set(names) - set(allowed))
+    if unknown:
+        raise ValidationError({param: [f"{message}: {', '.join(unknown)}"]})
+    return names
+
+
+def model_columns(model, names):
+    # the names that are columns of model, for only(). foreign keys load their id
+    columns = []
+    for name in names:
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.concrete and not field.many_to_many:
+            columns.append(name)
+    return columns
+
+
+class Expansion:
+    """
+    A relation a client can ?expand=. A foreign key (select=) is joined in the same query and nested
+    instead of its id, a reverse / many relation (prefetch=) is loaded with one more query.
+    models are the models the expanded data comes from, for the response cache.
+    """
+
+    def __init__(self, serializer_class, select=None, prefetch=None, source=None, models=()):
+        self.serializer_class = serializer_class
+        self.select = select
+        self.prefetch = prefetch
+        self.source = source
+        self.models = models
+
+    def serializer(self):
+        if self.prefetch is not None:
+            return self.serializer_class(read_only=True, many=True, source=self.source)
+        return self.serializer_class(read_only=True, source=self.source)
+
+    def apply(self, queryset):
+        if self.select is not None:
+            return queryset.select_related(self.select)
+        return queryset.prefetch_related(self.prefetch() if callable(self.prefetch) else self.prefetch)
+
+    def columns(self):
+        # the columns of a joined relation that its serializer shows
+        if self.select is None:
+            return []
+        model = self.serializer_class.Meta.model
+        return [f'{self.select}__{name}' for name in model_columns(model, self.serializer_class().fields)]
+
+
+class SparseFieldsetMixin:
+    """
+    ?fields=id,name returns only those fields and selects only their columns,
+    ?expand=<relation> nests a relation named in expandable (see Expansion)
+    """
+    expandable = {}
+    sparse_actions = ('list', 'retrieve')
+
+    def requested_fields(self):
+        return sparse_fields(self.request, None, [*self.get_serializer_class()().fields, *self.expandable])
+
+    def requested_expand(self):
+        names = split_param(self.request.query_params.get('expand', ''))
+        return checked_names(names, self.expandable, 'expand', 'Cannot expand')
+
+    def get_cache_models(self):
+        models = tuple(super().get_cache_models())
+        if self.action in self.sparse_actions:
+            for name in self.requested_expand():
+                models += tuple(model for model in self.expandable[name].models if model not in models)
+        return models
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in self.sparse_actions:
+            return queryset
+        expand = self.requested_expand()
+        fields = self.requested_fields()
+        for name in expand:
+            queryset = self.expandable[name].apply(queryset)
+        if fields is not None:
+            columns = model_columns(queryset.model, fields)
+            for name in expand:
+                expansion = self.expandable[name]
+                if expansion.select is not None:
+                    columns += [expansion.select, *expansion.columns()]
+            queryset = queryset.only('id', *columns)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.sparse_actions:
+            kwargs.setdefault('fields', self.requested_fields())
+            kwargs.setdefault('expand', {name: self.expandable[name].serializer() for name in self.requested_expand()})
+        return super().get_serializer(*args, **kwargs)
+
+
+def cast_prefetch():
+    return Prefetch('movieactor_set', queryset=MovieActor.objects.select_related('actor').order_by('id'))
@@ -0,0 +1,302 @@
+import csv
+import datetime
+import io
+import json
+
+from django.db import connection, transaction
+
+from imdb_app.cache import invalidate
+from imdb_app.models import Movie, Rating, RatingSummary, RatingDay, empty_histogram, Actor, MovieActor, Directors, \
+    MovieDirector
+from imdb_app.search import get_movie_search
+from imdb_app.serializers import BatchMovieSerializer, cast_errors, director_errors
+
+DEFAULT_BATCH_SIZE = 5000
+# largest ?batch_size= a client can ask for, a batch is held in memory and written in one transaction
+MAX_BATCH_SIZE = 20000
+DEFAULT_MOVIE_CHUNK_SIZE = 500
+# stop collecting reject details after this many, only keep counting them
+MAX_REPORTED_REJECTS = 1000
+
+
+def iter_lines(stream):
+    # stream yields bytes (an upload / HttpRequest) or str (a text file) one line at a time
+    for line in stream:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        yield line
+
+
+def iter_ndjson_rows(stream):
+    for line_number, line in enumerate(iter_lines(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None, 'invalid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'expected a JSON object'
+            continue
+        yield line_number, row, None
+
+
+def iter_csv_rows(stream):
+    reader = csv.DictReader(iter_lines(stream))
+    for row in reader:
+        # the header is line 1
+        yield reader.line_num, row, None
+
+
+def parse_row(row):
+    try:
+        movie_id = int(row['movie_id'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('movie_id is missing or not a number')
+    try:
+        rating = row['rating']
+        # int() would truncate 7.9 to 7, a CSV '7.9' fails in int()
+        if isinstance(rating, float) and not rating.is_integer():
+            raise ValueError
+        rating = int(rating)
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('rating is missing or not a whole number')
+    if not 1 <= rating <= 10:
+        raise ValueError('rating must be between 1 and 10')
+
+    rating_date = row.get('date') or row.get('rating_date')
+    if rating_date:
+        try:
+            rating_date = datetime.date.fromisoformat(rating_date)
+        except (TypeError, ValueError):
+            raise ValueError('date must be in YYYY-MM-DD format')
+    else:
+        rating_date = datetime.date.today()
+    return movie_id, rating, rating_date
+
+
+class RatingIngestion:
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, max_reported_rejects=MAX_REPORTED_REJECTS):
+        self.batch_size = batch_size
+        self.max_reported_rejects = max_reported_rejects
+        self.inserted = 0
+        self.rejected = 0
+        self.rejects = []
+
+    def reject(self, line_number, error):
+        self.rejected += 1
+        if len(self.rejects) < self.max_reported_rejects:
+            self.rejects.append({'line': line_number, 'error': error})
+
+    def run(self, rows):
+        # rows: (line_number, row dict or None, parse error or None), consumed lazily batch by batch
+        batch = []
+        for line_number, row, error in rows:
+            if error is None:
+                try:
+                    batch.append((line_number, *parse_row(row)))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                self.reject(line_number, error)
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+        return self.report()
+
+    def write_batch(self, batch):
+        movie_ids = {movie_id for _, movie_id, _, _ in batch}
+        existing = set(Movie.objects.filter(id__in=movie_ids).values_list('id', flat=True))
+
+        accepted = []
+        deltas_by_movie = {}
+        deltas_by_day = {}
+        for line_number, movie_id, rating, rating_date in batch:
+            if movie_id not in existing:
+                self.reject(line_number, f'movie {movie_id} does not exist')
+                continue
+            accepted.append((movie_id, rating, rating_date))
+            deltas_by_movie.setdefault(movie_id, empty_histogram())[rating - 1] += 1
+            count, total = deltas_by_day.get((movie_id, rating_date), (0, 0))
+            deltas_by_day[(movie_id, rating_date)] = (count + 1, total + rating)
+
+        if not accepted:
+            return
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                copy_ratings(accepted)
+            else:
+                Rating.objects.bulk_create(
+                    [Rating(movie_id=movie_id, rating=rating, rating_date=rating_date)
+                     for movie_id, rating, rating_date in accepted],
+                    batch_size=self.batch_size,
+                )
+            RatingSummary.apply_histograms(deltas_by_movie)
+            RatingDay.apply_deltas(deltas_by_day)
+        # bulk inserts send no post_save signals
+        invalidate(Rating)
+        self.inserted += len(accepted)
+
+    def report(self):
+        return {'inserted': self.inserted, 'rejected': self.rejected, 'rejects': self.rejects}
+
+
+def copy_ratings(accepted):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for movie_id, rating, rating_date in accepted:
+        writer.writerow((movie_id, rating, rating_date.isoformat()))
+    buffer.seek(0)
+
+    meta = Rating._meta
+    columns = ', '.join(meta.get_field(name).column for name in ('movie', 'rating', 'rating_date'))
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY {meta.db_table} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def ingest_ratings(stream, fmt='ndjson', batch_size=DEFAULT_BATCH_SIZE):
+    rows = iter_csv_rows(stream) if fmt == 'csv' else iter_ndjson_rows(stream)
+    return RatingIngestion(batch_size=batch_size).run(rows)
+
+
+class MovieIngestion:
+    """
+    Creates movies with their cast chunk by chunk. atomic=True creates all of them or none,
+    otherwise every chunk is committed on its own and invalid movies are skipped.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_MOVIE_CHUNK_SIZE, atomic=True):
+        self.chunk_size = chunk_size
+        self.atomic = atomic
+        self.results = []
+        self.seen_names = set()
+        self.created = 0
+        self.rejected = 0
+        self.rolled_back = False
+
+    def reject(self, index, errors):
+        self.rejected += 1
+        self.results.append({'index': index, 'status': 'rejected', 'errors': errors})
+
+    def run(self, items):
+        # items: (index, movie dict or None, parse error or None)
+        if self.atomic:
+            with transaction.atomic():
+                self.process(items)
+                if self.rejected:
+                    transaction.set_rollback(True)
+                    self.roll_back()
+        else:
+            self.process(items)
+        if self.created:
+            invalidate(Movie)
+            invalidate(MovieActor)
+            invalidate(MovieDirector)
+        return self.report()
+
+    def process(self, items):
+        chunk = []
+        for index, data, error in items:
+            if error is not None:
+                self.reject(index, {'non_field_errors': [error]})
+                continue
+            serializer = BatchMovieSerializer(data=data)
+            if not serializer.is_valid():
+                self.reject(index, serializer.errors)
+                continue
+            chunk.append((index, serializer.validated_data))
+            if len(chunk) >= self.chunk_size:
+                self.write_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.write_chunk(chunk)
+
+    def write_chunk(self, chunk):
+        names = {data['name'] for _, data in chunk}
+        existing_names = set(Movie.objects.filter(name__in=names).values_list('name', flat=True))
+        actor_ids = {cast['actor'] for _, data in chunk for cast in data.get('cast', [])}
+        existing_actors = set(Actor.objects.filter(id__in=actor_ids).values_list('id', flat=True))
+        director_ids = {director_id for _, data in chunk for director_id in data.get('directors', [])}
+        existing_directors = set(Directors.objects.filter(id__in=director_ids).values_list('id', flat=True))
+
+        accepted = []
+        for index, data in chunk:
+            errors = {}
+            if data['name'] in existing_names:
+                errors['name'] = ['A movie with this name already exists']
+            elif data['name'] in self.seen_names:
+                errors['name'] = ['A movie with this name appears earlier in the batch']
+            cast_data = data.get('cast', [])
+            cast_problems = cast_errors([cast['actor'] for cast in cast_data], existing_actors)
+            if cast_problems:
+                errors['cast'] = cast_problems
+            director_problems = director_errors(data.get('directors', []), existing_directors)
+            if director_problems:
+                errors['directors'] = director_problems
+            if errors:
+                self.reject(index, errors)
+                continue
+            self.seen_names.add(data['name'])
+            accepted.append((index, data))
+
+        # once an all-or-nothing import has failed only validation goes on, to report every error
+        if not accepted or (self.atomic and self.rejected):
+            return
+        with transaction.atomic():
+            movies = Movie.objects.bulk_create(
+                [Movie(**{field: value for field, value in data.items() if field not in ('cast', 'directors')})
+                 for _, data in accepted]
+            )
+            MovieActor.objects.bulk_create(
+                [MovieActor(movie=movie, actor_id=cast['actor'], salary=cast['salary'], main_role=cast['main_role'])
+                 for movie, (_, data) in zip(movies, accepted) for cast in data.get('cast', [])],
+                batch_size=DEFAULT_BATCH_SIZE,
+            )
+            MovieDirector.objects.bulk_create(
+                [MovieDirector(movie=movie, director_id=director_id, credited=True)
+                 for movie, (_, data) in zip(movies, accepted) for director_id in data.get('directors', [])],
+                batch_size=DEFAULT_BATCH_SIZE,
+            )
+            get_movie_search().index_movies([movie.id for movie in movies])
+
+        self.created += len(movies)
+        for movie, (index, _) in zip(movies, accepted):
+            self.results.append({'index': index, 'status': 'created', 'id': movie.id})
+
+    def roll_back(self):
+        self.rolled_back = True
+        self.created = 0
+        for result in self.results:
+            if result['status'] == 'created':
+                result['status'] = 'rolled_back'
+                del result['id']
+
+    def report(self):
+        return {
+            'created': self.created,
+            'rejected': self.rejected,
+            'rolled_back': self.rolled_back,
+            'results': sorted(self.results, key=lambda result: result['index']),
+        }
+
+
+def iter_movie_items(movies):
+    for index, data in enumerate(movies):
+        if isinstance(data, dict):
+            yield index, data, None
+        else:
+            yield index, None, 'expected a JSON object'
+
+
+def iter_ndjson_movie_items(stream):
+    # NDJSON items are numbered from 0 like list items, blank lines are skipped
+    for index, (_, data, error) in enumerate(iter_ndjson_rows(stream)):
+        yield index, data, error
+
+
+def ingest_movies(items, chunk_size=DEFAULT_MOVIE_CHUNK_SIZE, atomic=True):
+    return MovieIngestion(chunk_size=chunk_size, atomic=atomic).run(items)
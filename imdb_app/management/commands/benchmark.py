@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from imdb_app.benchmark import run_benchmark, find_regressions
+
+
+class Command(BaseCommand):
+    help = 'Runs every imdb_app endpoint in process and reports latency percentiles and queries per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--only', nargs='*', help='Run only the scenarios whose name contains one of these')
+        parser.add_argument('--cold-cache', action='store_true', help='Clear the response cache before every request')
+        parser.add_argument('--output', help='Write the report as JSON to this file')
+        parser.add_argument('--baseline', help='Compare with the JSON report of an earlier run')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed p95 growth over the baseline, 0.2 = 20%%')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'scenario':<32}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>10}{'queries':>9}  status")
+        try:
+            report = run_benchmark(options['iterations'], only=options['only'], cold_cache=options['cold_cache'],
+                                   log=self.log_result)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = find_regressions(report, baseline, options['threshold'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(regression)
+                raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    def log_result(self, name, result):
+        self.stdout.write(f"{name:<32}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}"
+                          f"{result['throughput_rps']:>10}{result['queries_per_request']:>9}  "
+                          f"{','.join(map(str, result['statuses']))}")
@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from imdb_app.benchmark import auth_overhead
+
+
+class Command(BaseCommand):
+    help = 'Compares the time and queries per request of anonymous, Basic and JWT authenticated reads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--url', default='/api/imdb/movies/top?limit=1', help='A cheap GET to authenticate')
+        parser.add_argument('--output', help='Write the report as JSON to this file')
+
+    def handle(self, *args, **options):
+        results = auth_overhead(options['iterations'], options['url'])
+
+        self.stdout.write(f"{'auth':<16}{'p50':>9}{'p95':>9}{'overhead':>10}{'queries':>9}  status")
+        for name, result in results.items():
+            self.stdout.write(f"{name:<16}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['overhead_ms']:>10}"
+                              f"{result['queries_per_request']:>9}  {result['statuses']}")
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from imdb_app.benchmark import connection_overhead
+
+
+class Command(BaseCommand):
+    help = 'Compares the latency of a one query request with new, persistent and pooled database connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Requests per thread')
+        parser.add_argument('--threads', type=int, default=1, help='Threads sending requests at once')
+        parser.add_argument('--database', default='default', help='The database alias to connect to')
+        parser.add_argument('--output', help='Write the report as JSON to this file')
+
+    def handle(self, *args, **options):
+        results = connection_overhead(options['iterations'], options['threads'], options['database'])
+
+        self.stdout.write(f"{'connection':<16}{'p50':>9}{'p95':>9}{'p99':>9}{'saved':>9}  pool")
+        for name, result in results.items():
+            pool = result.get('pool')
+            pool_line = f"created {pool['created']}, waits {pool['waits']}, exhausted {pool['exhausted']}" \
+                if pool else ''
+            self.stdout.write(f"{name:<16}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}"
+                              f"{result['saved_ms']:>9}  {pool_line}")
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from imdb_app.benchmark import costar_search
+
+
+class Command(BaseCommand):
+    help = 'Times co-star shortest path searches on a synthetic actor / movie graph, built in memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--actors', type=int, default=200000)
+        parser.add_argument('--movies', type=int, default=100000)
+        parser.add_argument('--cast-per-movie', type=int, default=10)
+        parser.add_argument('--searches', type=int, default=200, help='Random pairs of actors to connect')
+        parser.add_argument('--one-way-searches', type=int, default=20,
+                            help='Pairs also searched one way only, for comparison')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the report as JSON to this file')
+
+    def handle(self, *args, **options):
+        results = costar_search(options['actors'], options['movies'], options['cast_per_movie'],
+                                options['searches'], options['one_way_searches'], options['seed'])
+
+        graph = results['graph']
+        self.stdout.write(f"{graph['actors']} actors, {graph['movies']} movies, {graph['cast_rows']} cast rows: "
+                          f"built in {graph['build_s']}s, {graph['arrays_mb']} MB of arrays")
+        self.stdout.write(f"{'search':<16}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'connected':>11}"
+                          f"{'degrees':>9}")
+        for name in ('bidirectional', 'one way'):
+            result = results[name]
+            self.stdout.write(f"{name:<16}{result['searches']:>7}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+                              f"{result['p99_ms']:>10}{result['connected']:>11}{str(result['mean_degrees']):>9}")
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
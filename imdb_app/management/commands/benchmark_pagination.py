@@ -0,0 +1,72 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIClient
+
+from imdb_app.cache import get_response_cache
+from imdb_app.models import Movie
+from imdb_app.pagination import KeysetCursorPagination
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compares page number and cursor pagination latency on the first and on a deep page of /movies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=50000,
+                            help='Synthetic movies to add for the run (rolled back afterwards)')
+        parser.add_argument('--page', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options['movies'])
+                self.run(options['page'], options['repeat'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def seed(self, count):
+        Movie.objects.bulk_create(
+            [Movie(name=f'Movie {i}', description='synthetic', duration_in_min=90, release_year=2000)
+             for i in range(count)],
+            batch_size=5000,
+        )
+
+    def measure(self, client, url, repeat):
+        timings = []
+        for _ in range(repeat):
+            # /movies responses are cached (see cache.py), every request has to run its query
+            get_response_cache().clear()
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.status_code
+        return statistics.median(timings)
+
+    def run(self, page, repeat):
+        client = APIClient()
+        paginator = KeysetCursorPagination()
+        page_size = paginator.page_size
+        offset = (page - 1) * page_size
+
+        # the cursor a client would hold after walking to the deep page
+        last_seen = Movie.objects.order_by('id').values_list('id', flat=True)[offset - 1]
+        paginator.base_url = 'http://testserver/api/imdb/movies/'
+        deep_cursor_url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=last_seen))
+
+        cases = [
+            ('page number, page 1', '/api/imdb/movies/?page=1'),
+            (f'page number, page {page}', f'/api/imdb/movies/?page={page}'),
+            ('cursor, page 1', '/api/imdb/movies/?pagination=cursor'),
+            (f'cursor, page {page}', deep_cursor_url),
+        ]
+        for label, url in cases:
+            self.stdout.write(f'{label:<30} {self.measure(client, url, repeat):8.2f} ms (median of {repeat})')
@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from imdb_app.benchmark import serializer_cpu_per_row
+
+
+class Command(BaseCommand):
+    help = 'Compares the CPU per row of the DRF serializers and the fast values_list() encoders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per case, the best one is reported')
+        parser.add_argument('--limit', type=int, help='Serialize at most this many rows per case')
+        parser.add_argument('--only', nargs='*', help='Run only the cases whose name contains one of these')
+        parser.add_argument('--output', help='Write the report as JSON to this file')
+
+    def handle(self, *args, **options):
+        results = serializer_cpu_per_row(options['repeat'], options['limit'], options['only'])
+        if not results:
+            raise CommandError('Nothing to serialize, run the generate_data command first')
+
+        self.stdout.write(f"{'case':<12}{'rows':>9}{'drf us/row':>12}{'fast us/row':>13}{'speedup':>9}  identical")
+        for name, result in results.items():
+            self.stdout.write(f"{name:<12}{result['rows']:>9}{result['drf_us_per_row']:>12}"
+                              f"{result['fast_us_per_row']:>13}{result['speedup']:>9}  {result['identical']}")
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+        if not all(result['identical'] for result in results.values()):
+            raise CommandError('The fast encoders wrote different bytes than the serializers')
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from imdb_app.benchmark import compare_servers
+
+
+class Command(BaseCommand):
+    help = 'Load tests the sync views on a WSGI server and the async views on an ASGI server side by side'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', required=True, help='Base url of the WSGI server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--asgi', required=True, help='Base url of the ASGI server, e.g. http://127.0.0.1:8001')
+        parser.add_argument('--connections', type=int, nargs='+', default=[10, 100, 500],
+                            help='Concurrent connections, one run per value')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per run')
+        parser.add_argument('--only', nargs='*', help='Run only the endpoints whose name contains one of these')
+        parser.add_argument('--output', help='Write the report as JSON to this file')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'endpoint':<22}{'server':>7}{'conns':>7}{'p50':>9}{'p95':>9}{'p99':>9}"
+                          f"{'req/s':>10}{'errors':>8}  status")
+        try:
+            report = compare_servers(options['wsgi'], options['asgi'], options['connections'], options['requests'],
+                                     only=options['only'], log=self.log_result)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+    def log_result(self, name, server, connections, result):
+        if not result['requests']:
+            self.stdout.write(f"{name:<22}{server:>7}{connections:>7}  no successful request, "
+                              f"{result['errors']} errors")
+            return
+        self.stdout.write(f"{name:<22}{server:>7}{connections:>7}{result['p50_ms']:>9}{result['p95_ms']:>9}"
+                          f"{result['p99_ms']:>9}{result['throughput_rps']:>10}{result['errors']:>8}  "
+                          f"{','.join(map(str, result['statuses']))}")
@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from imdb_app.benchmark import compare_trend_sources
+
+
+class Command(BaseCommand):
+    help = 'Compares the rating trends read from the daily rollup with the same trends bucketed from the ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per case, the best one is reported')
+        parser.add_argument('--only', nargs='*', help='Run only the cases whose name contains one of these')
+        parser.add_argument('--output', help='Write the report as JSON to this file')
+
+    def handle(self, *args, **options):
+        results = compare_trend_sources(options['repeat'], options['only'])
+        if not results:
+            raise CommandError('No ratings, run the generate_data command first')
+
+        self.stdout.write(f"{'case':<26}{'buckets':>9}{'raw ms':>10}{'rollup ms':>11}{'speedup':>9}  identical")
+        for name, result in results.items():
+            self.stdout.write(f"{name:<26}{result['buckets']:>9}{result['raw_ms']:>10}"
+                              f"{result['rollup_ms']:>11}{result['speedup']:>9}  {result['identical']}")
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+        if not all(result['identical'] for result in results.values()):
+            raise CommandError('The rollup returned other trends than the ratings table')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from imdb_app.benchmark import generate_catalogue
+
+
+class Command(BaseCommand):
+    help = 'Adds a synthetic catalogue of movies, actors, cast, ratings and Oscars for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=1000)
+        parser.add_argument('--actors', type=int, default=500)
+        parser.add_argument('--directors', type=int, default=100)
+        parser.add_argument('--cast-per-movie', type=int, default=5)
+        parser.add_argument('--ratings-per-movie', type=int, default=20, help='On average')
+        parser.add_argument('--oscars', type=int, default=500)
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            generate_catalogue(
+                movies=options['movies'], actors=options['actors'], directors=options['directors'],
+                cast_per_movie=options['cast_per_movie'], ratings_per_movie=options['ratings_per_movie'],
+                oscars=options['oscars'], chunk_size=options['chunk_size'], seed=options['seed'],
+                log=self.stdout.write,
+            )
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from imdb_app.ingest import ingest_ratings, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Imports ratings from an NDJSON or CSV file of (movie_id, rating, date) rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for stdin")
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help='Defaults to csv for .csv files and ndjson otherwise')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+
+        if path == '-':
+            report = ingest_ratings(sys.stdin, fmt=fmt, batch_size=options['batch_size'])
+        else:
+            try:
+                with open(path, encoding='utf-8', newline='') as stream:
+                    report = ingest_ratings(stream, fmt=fmt, batch_size=options['batch_size'])
+            except OSError as e:
+                raise CommandError(str(e))
+
+        for reject in report['rejects']:
+            self.stderr.write(f"line {reject['line']}: {reject['error']}")
+        self.stdout.write(f"Inserted {report['inserted']} ratings, rejected {report['rejected']}")
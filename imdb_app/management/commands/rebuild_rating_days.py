@@ -0,0 +1,28 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from imdb_app.trends import rebuild_rating_days, stale_rating_days
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily rating rollup the trends are read from and checks it against the ratings table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=datetime.date.fromisoformat,
+                            help='Only the days from this date on (YYYY-MM-DD), the whole rollup by default')
+        parser.add_argument('--check-only', action='store_true',
+                            help="Only compare the rollup with the ratings table, don't rebuild")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not options['check_only']:
+            days = rebuild_rating_days(options['since'], options['batch_size'])
+            self.stdout.write(f'Rebuilt {days} rating days')
+
+        stale = stale_rating_days(options['since'])
+        if stale:
+            for movie_id, day in stale[:20]:
+                self.stderr.write(f'movie {movie_id} on {day}: rollup does not match the ratings table')
+            raise CommandError(f'{len(stale)} rating days are out of date')
+        self.stdout.write(self.style.SUCCESS('Rating days match the ratings table'))
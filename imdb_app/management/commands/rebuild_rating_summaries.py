@@ -0,0 +1,62 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from imdb_app.models import Rating, RatingSummary, empty_histogram
+
+
+def histograms_from_ratings():
+    # one GROUP BY over the raw table: {movie_id: histogram}
+    histograms = defaultdict(empty_histogram)
+    rows = Rating.objects.order_by().values_list('movie_id', 'rating').annotate(n=Count('id'))
+    for movie_id, rating, n in rows.iterator():
+        histograms[movie_id][rating - 1] = n
+    return histograms
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per movie rating summaries from the ratings table and checks them against it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check-only', action='store_true',
+                            help="Only compare the stored summaries with the ratings table, don't rebuild")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not options['check_only']:
+            self.rebuild(options['batch_size'])
+
+        mismatches = self.check_summaries()
+        if mismatches:
+            for movie_id in mismatches:
+                self.stderr.write(f'movie {movie_id}: summary does not match the ratings table')
+            raise CommandError(f'{len(mismatches)} rating summaries are out of date')
+        self.stdout.write(self.style.SUCCESS('Rating summaries match the ratings table'))
+
+    def rebuild(self, batch_size):
+        with transaction.atomic():
+            histograms = histograms_from_ratings()
+            RatingSummary.objects.all().delete()
+            summaries = []
+            for movie_id, histogram in histograms.items():
+                summary = RatingSummary(movie_id=movie_id, histogram=histogram)
+                summary.refresh_from_histogram()
+                summaries.append(summary)
+            RatingSummary.objects.bulk_create(summaries, batch_size=batch_size)
+        self.stdout.write(f'Rebuilt {len(summaries)} rating summaries')
+
+    def check_summaries(self):
+        histograms = histograms_from_ratings()
+        mismatches = []
+        for summary in RatingSummary.objects.iterator():
+            expected = RatingSummary(movie_id=summary.movie_id,
+                                     histogram=histograms.pop(summary.movie_id, empty_histogram()))
+            expected.refresh_from_histogram()
+            if (summary.histogram, summary.count, summary.total, summary.min_rating, summary.max_rating) != \
+                    (expected.histogram, expected.count, expected.total, expected.min_rating, expected.max_rating):
+                mismatches.append(summary.movie_id)
+        # movies that have ratings but no summary row at all
+        mismatches.extend(histograms.keys())
+        return mismatches
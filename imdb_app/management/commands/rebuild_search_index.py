@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from imdb_app.search import get_movie_search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the movie full text search index from the movies table'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            indexed = get_movie_search().rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} movies'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from imdb_app.ranking import refresh_movie_scores
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the movies/top and movies/trending scores of the movies whose ratings changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute every movie')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        run = refresh_movie_scores(options['full'], options['batch_size'])
+        kind = 'full' if run.full else 'incremental'
+        self.stdout.write(self.style.SUCCESS(
+            f'{kind} refresh: {run.movies} movie scores, mean rating {run.mean_rating}'))
@@ -0,0 +1,103 @@
+import threading
+from collections import defaultdict
+
+from django.http import HttpResponse
+
+# in process request metrics, filled by middleware.QueryInstrumentationMiddleware and
+# served in the Prometheus text format by metrics_view. collectors add lines of their own (see pool.py)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PREFIX = 'imdb'
+
+# name -> (type, help)
+METRICS = {
+    'requests_total': ('counter', 'Requests by view, method and status'),
+    'request_duration_seconds': ('histogram', 'Request duration by view'),
+    'db_queries_total': ('counter', 'SQL queries run by view'),
+    'db_duplicate_queries_total': ('counter', 'SQL queries repeating an earlier query shape of the same request'),
+    'db_time_seconds_total': ('counter', 'Time spent in SQL queries by view'),
+    'serializer_time_seconds_total': ('counter', 'Time spent building serializer data by view'),
+    'response_bytes_total': ('counter', 'Response body bytes by view'),
+}
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+def format_value(value):
+    # exact, as the Prometheus client writes them: ints as ints, floats with repr (:g keeps 6 digits)
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.collectors = []
+        self.reset()
+
+    def add_collector(self, collect):
+        # collect() returns the lines of metrics kept elsewhere, with their HELP and TYPE
+        if collect not in self.collectors:
+            self.collectors.append(collect)
+
+    def reset(self):
+        self.counters = defaultdict(int)
+        # labels -> [count per bucket, +Inf count, sum]
+        self.histograms = {}
+
+    def observe(self, view, method, status, duration, queries, duplicates, db_time, serializer_time, size):
+        view_label = (('view', view),)
+        with self.lock:
+            self.counters[('requests_total', view_label + (('method', method), ('status', status)))] += 1
+            self.counters[('db_queries_total', view_label)] += queries
+            self.counters[('db_duplicate_queries_total', view_label)] += duplicates
+            self.counters[('db_time_seconds_total', view_label)] += db_time
+            self.counters[('serializer_time_seconds_total', view_label)] += serializer_time
+            self.counters[('response_bytes_total', view_label)] += size
+
+            histogram = self.histograms.setdefault(view_label, [[0] * len(DURATION_BUCKETS), 0, 0.0])
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += 1
+            histogram[2] += duration
+
+    def render(self):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {labels: [list(buckets), count, total]
+                          for labels, (buckets, count, total) in self.histograms.items()}
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            full_name = f'{PREFIX}_{name}'
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {metric_type}')
+            if metric_type == 'histogram':
+                for labels, (buckets, count, total) in sorted(histograms.items()):
+                    for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+                        lines.append(f'{full_name}_bucket{format_labels(labels + (("le", bound),))} {bucket_count}')
+                    lines.append(f'{full_name}_bucket{format_labels(labels + (("le", "+Inf"),))} {count}')
+                    lines.append(f'{full_name}_sum{format_labels(labels)} {format_value(total)}')
+                    lines.append(f'{full_name}_count{format_labels(labels)} {count}')
+            else:
+                for (counter_name, labels), value in sorted(counters.items()):
+                    if counter_name == name:
+                        lines.append(f'{full_name}{format_labels(labels)} {format_value(value)}')
+        for collect in self.collectors:
+            lines.extend(collect())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,166 @@
+import contextvars
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from imdb_app.metrics import registry
+
+logger = logging.getLogger('imdb_app.requests')
+
+# the RequestRecorder of the request being handled, if any
+current_recorder = contextvars.ContextVar('current_recorder', default=None)
+
+# literals and IN lists are replaced so that "the same query with other values" gets one fingerprint
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN \((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)', re.IGNORECASE)
+
+
+def fingerprint(sql):
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+# execute wrappers of every database connection. connections are per thread and under ASGI the queries
+# run in the sync_to_async threads, not in the one of the middleware: the wrappers are added to every
+# connection when it is opened and find the request they record for in a contextvar
+_connection_wrappers = []
+
+
+def install_connection_wrappers(connection, **kwargs):
+    for wrapper in _connection_wrappers:
+        if wrapper not in connection.execute_wrappers:
+            # first, the execute_wrapper() blocks of django pop the last one
+            connection.execute_wrappers.insert(0, wrapper)
+
+
+def add_connection_wrapper(wrapper):
+    _connection_wrappers.append(wrapper)
+    for connection in connections.all(initialized_only=True):
+        install_connection_wrappers(connection)
+
+
+connection_created.connect(install_connection_wrappers)
+
+
+class RequestRecorder:
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.fingerprints.values())
+
+    def repeated_fingerprints(self, threshold):
+        return {sql: count for sql, count in self.fingerprints.items() if count >= threshold}
+
+
+def record_query(execute, sql, params, many, context):
+    # sees every query of every connection, counted for the request being handled
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+add_connection_wrapper(record_query)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Records the SQL queries (count, time, repeated shapes), serializer time and response size of every
+    request. They go to the /metrics endpoint, to one JSON log line per request on the imdb_app.requests
+    logger and, with DEBUG, to X-... response headers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # stay async under ASGI, so that the async views (see async_views.py) are not run in a thread
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @contextmanager
+    def recording(self):
+        recorder = RequestRecorder()
+        token = current_recorder.set(recorder)
+        try:
+            yield recorder
+        finally:
+            current_recorder.reset(token)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with self.recording() as recorder:
+            response = self.get_response(request)
+        if request.path != '/metrics':
+            self.record(request, response, recorder, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with self.recording() as recorder:
+            response = await self.get_response(request)
+        if request.path != '/metrics':
+            self.record(request, response, recorder, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, recorder, duration):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        size = 0 if response.streaming else len(response.content)
+
+        registry.observe(view, request.method, response.status_code, duration, recorder.queries,
+                         recorder.duplicates, recorder.db_time, recorder.serializer_time, size)
+
+        logger.info(json.dumps({
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'queries': recorder.queries,
+            'db_ms': round(recorder.db_time * 1000, 2),
+            'duplicate_queries': recorder.duplicates,
+            'serializer_ms': round(recorder.serializer_time * 1000, 2),
+            'response_bytes': size,
+        }))
+        repeated = recorder.repeated_fingerprints(getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5))
+        if repeated:
+            logger.warning(json.dumps({'view': view, 'path': request.path, 'repeated_queries': repeated}))
+
+        if settings.DEBUG:
+            response['X-DB-Queries'] = recorder.queries
+            response['X-DB-Time-ms'] = f'{recorder.db_time * 1000:.2f}'
+            response['X-DB-Duplicate-Queries'] = recorder.duplicates
+            response['X-Serializer-Time-ms'] = f'{recorder.serializer_time * 1000:.2f}'
+            response['X-Response-Size'] = size
+            response['X-Request-Time-ms'] = f'{duration * 1000:.2f}'
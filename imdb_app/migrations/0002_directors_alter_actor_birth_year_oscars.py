@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:34
+
+import django.db.models.deletion
+import imdb_app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imdb_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Directors',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_column='name', max_length=256)),
+                ('birth_year', models.IntegerField(db_column='birth_year', null=True)),
+            ],
+            options={
+                'db_table': 'directors',
+            },
+        ),
+        migrations.AlterField(
+            model_name='actor',
+            name='birth_year',
+            field=models.IntegerField(db_column='birth_year', null=True),
+        ),
+        migrations.CreateModel(
+            name='Oscars',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nomination', imdb_app.models.UpperCaseCharField(db_column='nomination', max_length=256)),
+                ('ceremony_year', models.IntegerField(db_column='ceremony_year')),
+                ('actor', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='imdb_app.actor')),
+                ('director', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='imdb_app.directors')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='imdb_app.movie')),
+            ],
+            options={
+                'db_table': 'oscars',
+            },
+        ),
+    ]
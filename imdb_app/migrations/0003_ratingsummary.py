@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from imdb_app.models import empty_histogram
+
+
+def build_summaries(apps, schema_editor):
+    Rating = apps.get_model('imdb_app', 'Rating')
+    RatingSummary = apps.get_model('imdb_app', 'RatingSummary')
+    histograms = {}
+    rows = Rating.objects.order_by().values_list('movie_id', 'rating').annotate(n=models.Count('id'))
+    for movie_id, rating, n in rows:
+        histograms.setdefault(movie_id, empty_histogram())[rating - 1] = n
+    summaries = []
+    for movie_id, histogram in histograms.items():
+        # as RatingSummary.refresh_from_histogram, which the historical model does not have
+        rated = [i + 1 for i, n in enumerate(histogram) if n]
+        summaries.append(RatingSummary(movie_id=movie_id, histogram=histogram, count=sum(histogram),
+                                       total=sum((i + 1) * n for i, n in enumerate(histogram)),
+                                       min_rating=min(rated), max_rating=max(rated)))
+    RatingSummary.objects.bulk_create(summaries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imdb_app', '0002_directors_alter_actor_birth_year_oscars'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingSummary',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='imdb_app.movie')),
+                ('count', models.IntegerField(db_column='count', default=0)),
+                ('total', models.BigIntegerField(db_column='total', default=0)),
+                ('min_rating', models.SmallIntegerField(db_column='min_rating', null=True)),
+                ('max_rating', models.SmallIntegerField(db_column='max_rating', null=True)),
+                ('histogram', models.JSONField(db_column='histogram', default=empty_histogram)),
+            ],
+            options={
+                'db_table': 'rating_summaries',
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:36
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imdb_app', '0003_ratingsummary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rating',
+            name='rating_date',
+            field=models.DateField(db_column='rating_date', default=datetime.date.today),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:37
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def create_description_trigram_index(apps, schema_editor):
+    # description__icontains runs UPPER(description) LIKE UPPER('%x%'), only a trigram index can serve it
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS movies_description_trgm_idx '
+                          'ON movies USING gin (UPPER(description) gin_trgm_ops)')
+
+
+def drop_description_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS movies_description_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imdb_app', '0004_rating_date_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(django.db.models.functions.text.Upper('name'), name='movies_name_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['duration_in_min'], name='movies_duration_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['release_year'], name='movies_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='oscars',
+            index=models.Index(fields=['ceremony_year', 'nomination'], name='oscars_year_nomination_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='oscars',
+            index=models.Index(fields=['nomination', 'ceremony_year'], name='oscars_nomination_year_idx'),
+        ),
+        migrations.RunPython(create_description_trigram_index, drop_description_trigram_index),
+    ]
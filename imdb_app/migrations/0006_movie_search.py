@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def create_search_table(apps, schema_editor):
+    from imdb_app.search import get_movie_search
+    movie_search = get_movie_search(schema_editor.connection.vendor)
+    with schema_editor.connection.cursor() as cursor:
+        movie_search.create_table(cursor)
+    movie_search.rebuild(schema_editor.connection, apps.get_model('imdb_app', 'Movie'))
+
+
+def drop_search_table(apps, schema_editor):
+    from imdb_app.search import get_movie_search
+    with schema_editor.connection.cursor() as cursor:
+        get_movie_search(schema_editor.connection.vendor).drop_table(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imdb_app', '0005_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_rating_days(apps, schema_editor):
+    Rating = apps.get_model('imdb_app', 'Rating')
+    RatingDay = apps.get_model('imdb_app', 'RatingDay')
+    rows = Rating.objects.order_by().values_list('movie_id', 'rating_date') \
+        .annotate(n=models.Count('id'), total=models.Sum('rating'))
+    RatingDay.objects.bulk_create((RatingDay(movie_id=movie_id, day=day, count=n, total=total)
+                                   for movie_id, day, n, total in rows.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imdb_app', '0007_rating_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_column='day')),
+                ('count', models.IntegerField(db_column='count', default=0)),
+                ('total', models.BigIntegerField(db_column='total', default=0)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_days', to='imdb_app.movie')),
+            ],
+            options={
+                'db_table': 'rating_days',
+                'indexes': [models.Index(fields=['day'], name='rating_days_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('movie', 'day'), name='rating_days_movie_day_uniq')],
+            },
+        ),
+        migrations.RunPython(build_rating_days, migrations.RunPython.noop),
+    ]
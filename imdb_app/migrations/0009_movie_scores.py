@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imdb_app', '0008_rating_days'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('finished_at', models.DateTimeField(auto_now_add=True, db_column='finished_at')),
+                ('full', models.BooleanField(db_column='full')),
+                ('movies', models.IntegerField(db_column='movies')),
+                ('last_rating_id', models.BigIntegerField(db_column='last_rating_id')),
+                ('mean_rating', models.FloatField(db_column='mean_rating', null=True)),
+                ('min_votes', models.IntegerField(db_column='min_votes')),
+                ('half_life_days', models.FloatField(db_column='half_life_days')),
+            ],
+            options={
+                'db_table': 'score_runs',
+            },
+        ),
+        migrations.CreateModel(
+            name='MovieScore',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='imdb_app.movie')),
+                ('ratings', models.IntegerField(db_column='ratings')),
+                ('avg', models.FloatField(db_column='avg')),
+                ('bayesian', models.FloatField(db_column='bayesian')),
+                ('trending', models.FloatField(db_column='trending')),
+            ],
+            options={
+                'db_table': 'movie_scores',
+                'indexes': [models.Index(fields=['-bayesian', 'movie'], name='movie_scores_bayesian_idx'), models.Index(fields=['-trending', 'movie'], name='movie_scores_trending_idx')],
+            },
+        ),
+    ]
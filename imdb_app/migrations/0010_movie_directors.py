@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_nominated_directors(apps, schema_editor):
+    Oscars = apps.get_model('imdb_app', 'Oscars')
+    MovieDirector = apps.get_model('imdb_app', 'MovieDirector')
+    pairs = Oscars.objects.filter(director__isnull=False).order_by() \
+        .values_list('movie_id', 'director_id').distinct()
+    MovieDirector.objects.bulk_create((MovieDirector(movie_id=movie_id, director_id=director_id)
+                                       for movie_id, director_id in pairs.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imdb_app', '0009_movie_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieDirector',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('director', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movie_directors', to='imdb_app.directors')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movie_directors', to='imdb_app.movie')),
+            ],
+            options={
+                'db_table': 'movie_directors',
+                'constraints': [models.UniqueConstraint(fields=('director', 'movie'), name='movie_directors_director_movie_uniq')],
+            },
+        ),
+        migrations.RunPython(link_nominated_directors, migrations.RunPython.noop),
+    ]
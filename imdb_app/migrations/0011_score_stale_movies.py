@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imdb_app', '0010_movie_directors'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='scorerun',
+            name='last_rating_id',
+        ),
+        migrations.AddField(
+            model_name='ratingsummary',
+            name='score_stale',
+            field=models.BooleanField(db_column='score_stale', default=True),
+        ),
+        migrations.AddIndex(
+            model_name='ratingsummary',
+            index=models.Index(condition=models.Q(('score_stale', True)), fields=['movie'], name='rating_summaries_stale_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imdb_app', '0011_score_stale_movies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moviedirector',
+            name='credited',
+            field=models.BooleanField(db_column='credited', default=False),
+        ),
+    ]
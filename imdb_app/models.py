@@ -1,6 +1,8 @@
+import datetime
 
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Upper
 from django.core.exceptions import ValidationError
 
 
@@ -33,8 +35,32 @@ class Movie(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        from imdb_app.search import get_movie_search
+
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # keep the full text search document in step with name / description
+            if update_fields is None or {'name', 'description'} & set(update_fields):
+                get_movie_search().index_movies([self.id])
+
+    def delete(self, *args, **kwargs):
+        from imdb_app.search import get_movie_search
+
+        with transaction.atomic():
+            get_movie_search().remove_movies([self.id])
+            return super().delete(*args, **kwargs)
+
     class Meta:
         db_table = 'movies'
+        # match the MovieFilterSet filters, name__iexact compares UPPER(name).
+        # description__icontains gets a trigram index on PostgreSQL only (see migration 0005)
+        indexes = [
+            models.Index(Upper('name'), name='movies_name_upper_idx'),
+            models.Index(fields=['duration_in_min'], name='movies_duration_idx'),
+            models.Index(fields=['release_year'], name='movies_year_idx'),
+        ]
 
 
 class Rating(models.Model):
@@ -42,10 +68,181 @@ class Rating(models.Model):
     movie = models.ForeignKey('Movie',on_delete=models.CASCADE,)
     rating = models.SmallIntegerField(db_column='rating', null=False,
                 validators=[MinValueValidator(1), MaxValueValidator(10)])
-    rating_date = models.DateField(db_column='rating_date', null=False, auto_now_add=True)
+    rating_date = models.DateField(db_column='rating_date', null=False, default=datetime.date.today)
 
     class Meta:
         db_table = 'ratings'
+        indexes = [
+            # a movie's ratings in a date range, and date ranges over all movies
+            models.Index(fields=['movie', 'rating_date'], name='ratings_movie_date_idx'),
+            models.Index(fields=['rating_date'], name='ratings_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # the movie's rating summary and daily rollup are kept in the same transaction as the rating itself
+        with transaction.atomic():
+            if not self._state.adding:
+                old = Rating.objects.filter(pk=self.pk).values('movie_id', 'rating', 'rating_date').first()
+                if old is not None:
+                    RatingSummary.apply(old['movie_id'], old['rating'], -1)
+                    RatingDay.apply(old['movie_id'], old['rating_date'], old['rating'], -1)
+            super().save(*args, **kwargs)
+            RatingSummary.apply(self.movie_id, self.rating, 1)
+            RatingDay.apply(self.movie_id, self.rating_date, self.rating, 1)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            RatingSummary.apply(self.movie_id, self.rating, -1)
+            RatingDay.apply(self.movie_id, self.rating_date, self.rating, -1)
+        return result
+
+
+def empty_histogram():
+    return [0] * 10
+
+
+class RatingSummary(models.Model):
+
+    movie = models.OneToOneField('Movie', on_delete=models.CASCADE, primary_key=True,
+                                 related_name='rating_summary')
+    count = models.IntegerField(db_column='count', default=0)
+    total = models.BigIntegerField(db_column='total', default=0)
+    min_rating = models.SmallIntegerField(db_column='min_rating', null=True)
+    max_rating = models.SmallIntegerField(db_column='max_rating', null=True)
+    # histogram[i] is the number of ratings equal to i + 1
+    histogram = models.JSONField(db_column='histogram', default=empty_histogram)
+    # set with every change of the movie's ratings, in their transaction: the scores of the movie are
+    # computed again by the next refresh_movie_scores (see ranking.py)
+    score_stale = models.BooleanField(db_column='score_stale', default=True)
+
+    class Meta:
+        db_table = 'rating_summaries'
+        indexes = [
+            models.Index(fields=['movie'], condition=models.Q(score_stale=True), name='rating_summaries_stale_idx'),
+        ]
+
+    @property
+    def avg(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def refresh_from_histogram(self):
+        self.count = sum(self.histogram)
+        self.total = sum((i + 1) * n for i, n in enumerate(self.histogram))
+        rated = [i + 1 for i, n in enumerate(self.histogram) if n]
+        self.min_rating = min(rated) if rated else None
+        self.max_rating = max(rated) if rated else None
+
+    @classmethod
+    def apply(cls, movie_id, rating, delta):
+        deltas = empty_histogram()
+        deltas[int(rating) - 1] = delta
+        return cls.apply_histograms({movie_id: deltas})[movie_id]
+
+    @classmethod
+    def apply_histograms(cls, deltas_by_movie):
+        # has to run inside the transaction that inserts / deletes the ratings.
+        # deltas_by_movie: {movie_id: [change in the number of 1 ratings, ..., of 10 ratings]}
+        with transaction.atomic():
+            summaries = cls.objects.select_for_update().in_bulk(list(deltas_by_movie))
+            missing = [movie_id for movie_id in deltas_by_movie if movie_id not in summaries]
+            if missing:
+                cls.objects.bulk_create([cls(movie_id=movie_id) for movie_id in missing], ignore_conflicts=True)
+                summaries.update(cls.objects.select_for_update().in_bulk(missing))
+
+            for movie_id, deltas in deltas_by_movie.items():
+                summary = summaries[movie_id]
+                summary.histogram = [max(n + d, 0) for n, d in zip(summary.histogram, deltas)]
+                summary.refresh_from_histogram()
+                summary.score_stale = True
+            cls.objects.bulk_update(summaries.values(),
+                                    ['count', 'total', 'min_rating', 'max_rating', 'histogram', 'score_stale'])
+        return summaries
+
+
+class RatingDay(models.Model):
+    # the ratings of a movie on one day, the rollup the rating trends are read from (see trends.py)
+
+    movie = models.ForeignKey('Movie', on_delete=models.CASCADE, related_name='rating_days')
+    day = models.DateField(db_column='day')
+    count = models.IntegerField(db_column='count', default=0)
+    total = models.BigIntegerField(db_column='total', default=0)
+
+    class Meta:
+        db_table = 'rating_days'
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'day'], name='rating_days_movie_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='rating_days_day_idx'),
+        ]
+
+    @classmethod
+    def apply(cls, movie_id, day, rating, delta):
+        return cls.apply_deltas({(movie_id, day): (delta, delta * int(rating))})
+
+    @classmethod
+    def apply_deltas(cls, deltas):
+        # has to run inside the transaction that inserts / deletes the ratings.
+        # deltas: {(movie_id, day): (change in the number of ratings, change in their sum)}
+        with transaction.atomic():
+            movie_ids = {movie_id for movie_id, _ in deltas}
+            days = {day for _, day in deltas}
+
+            def locked():
+                rows = cls.objects.select_for_update().filter(movie_id__in=movie_ids, day__in=days)
+                return {(row.movie_id, row.day): row for row in rows if (row.movie_id, row.day) in deltas}
+
+            rows = locked()
+            missing = [key for key in deltas if key not in rows]
+            if missing:
+                cls.objects.bulk_create([cls(movie_id=movie_id, day=day) for movie_id, day in missing],
+                                        ignore_conflicts=True)
+                rows = locked()
+
+            for key, (count, total) in deltas.items():
+                rows[key].count = max(rows[key].count + count, 0)
+                rows[key].total = max(rows[key].total + total, 0)
+            cls.objects.bulk_update(rows.values(), ['count', 'total'])
+            # a day whose ratings were all deleted
+            empty = [row.id for row in rows.values() if not row.count]
+            if empty:
+                cls.objects.filter(id__in=empty).delete()
+        return rows
+
+
+class MovieScore(models.Model):
+    # the ranking scores of a movie, computed in bulk from the ratings (see ranking.py)
+
+    movie = models.OneToOneField('Movie', on_delete=models.CASCADE, primary_key=True, related_name='score')
+    ratings = models.IntegerField(db_column='ratings')
+    avg = models.FloatField(db_column='avg')
+    bayesian = models.FloatField(db_column='bayesian')
+    # log2 of the recent activity, on a scale that doesn't move with time (see ranking.log_activity)
+    trending = models.FloatField(db_column='trending')
+
+    class Meta:
+        db_table = 'movie_scores'
+        indexes = [
+            models.Index(fields=['-bayesian', 'movie'], name='movie_scores_bayesian_idx'),
+            models.Index(fields=['-trending', 'movie'], name='movie_scores_trending_idx'),
+        ]
+
+
+class ScoreRun(models.Model):
+    # a refresh of the movie scores, with the settings it used
+
+    finished_at = models.DateTimeField(db_column='finished_at', auto_now_add=True)
+    full = models.BooleanField(db_column='full')
+    movies = models.IntegerField(db_column='movies')
+    mean_rating = models.FloatField(db_column='mean_rating', null=True)
+    min_votes = models.IntegerField(db_column='min_votes')
+    half_life_days = models.FloatField(db_column='half_life_days')
+
+    class Meta:
+        db_table = 'score_runs'
 
 
 class MovieActor(models.Model):
@@ -72,6 +269,30 @@ class Directors(models.Model):
     class Meta:
         db_table = 'directors'
 
+
+class MovieDirector(models.Model):
+    # who directed a movie: given with the movie (credited, see CreateMovieSerializer) or taken from the
+    # oscars with a director (see Oscars.save and migration 0010), those go away with their nominations
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='movie_directors')
+    director = models.ForeignKey(Directors, on_delete=models.CASCADE, related_name='movie_directors')
+    credited = models.BooleanField(db_column='credited', default=False)
+
+    def __str__(self):
+        return f"{self.director.name} directed {self.movie.name}"
+
+    class Meta:
+        db_table = 'movie_directors'
+        constraints = [
+            models.UniqueConstraint(fields=['director', 'movie'], name='movie_directors_director_movie_uniq'),
+        ]
+
+    @classmethod
+    def forget_nomination(cls, movie_id, director_id):
+        # the link a nomination made, once no nomination of the director for the movie is left
+        if not Oscars.objects.filter(movie_id=movie_id, director_id=director_id).exists():
+            cls.objects.filter(movie_id=movie_id, director_id=director_id, credited=False).delete()
+
+
 class UpperCaseCharField(models.CharField):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -103,6 +324,11 @@ class Oscars(models.Model):
 
     class Meta:
         db_table = 'oscars'
+        # match the OscarsFilterSet filters, actor__isnull uses the actor foreign key index
+        indexes = [
+            models.Index(fields=['ceremony_year', 'nomination'], name='oscars_year_nomination_idx'),
+            models.Index(fields=['nomination', 'ceremony_year'], name='oscars_nomination_year_idx'),
+        ]
 
     def actor_validate(self):
         if self.actor is not None:
@@ -112,7 +338,23 @@ class Oscars(models.Model):
 
     def save(self, *args, **kwargs):
         self.actor_validate()
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            old = None
+            if not self._state.adding:
+                old = Oscars.objects.filter(pk=self.pk).values_list('movie_id', 'director_id').first()
+            super().save(*args, **kwargs)
+            # a director nominated for a movie directed it
+            if self.director_id is not None:
+                MovieDirector.objects.get_or_create(movie_id=self.movie_id, director_id=self.director_id)
+            if old and old[1] is not None and old != (self.movie_id, self.director_id):
+                MovieDirector.forget_nomination(*old)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            if self.director_id is not None:
+                MovieDirector.forget_nomination(self.movie_id, self.director_id)
+        return result
 
 
 
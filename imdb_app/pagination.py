@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+
+
+class LazyPageNumberPagination(PageNumberPagination):
+    # returns the page as a sliced queryset instead of a list, so that it is fetched once by whoever
+    # reads it: the serializer, or values_list() on the fast path (see fastjson.paginated_response)
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, 'MAX_PAGE_SIZE', 100)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return self.page.object_list
+
+
+class KeysetCursorPagination(CursorPagination):
+    # WHERE id > <last id seen> ORDER BY id LIMIT n - uses the primary key index and never runs COUNT(*)
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, 'MAX_PAGE_SIZE', 100)
+
+
+class OptInCursorPagination(BasePagination):
+    """
+    Page number pagination by default, keyset pagination when the client asks for it
+    with ?pagination=cursor (the next / previous links keep it, together with ?cursor=)
+    """
+    cursor_mode_query_param = 'pagination'
+
+    def __init__(self):
+        self.page_number_paginator = LazyPageNumberPagination()
+        self.cursor_paginator = KeysetCursorPagination()
+        self.paginator = self.page_number_paginator
+
+    def use_cursor(self, request):
+        return request.query_params.get(self.cursor_mode_query_param) == 'cursor' \
+            or self.cursor_paginator.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.paginator = self.cursor_paginator
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.paginator.get_paginated_response_schema(schema)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_schema_operation_parameters(self, view):
+        return self.page_number_paginator.get_schema_operation_parameters(view) + \
+            self.cursor_paginator.get_schema_operation_parameters(view)
+
+    @property
+    def display_page_controls(self):
+        return getattr(self.paginator, 'display_page_controls', False)
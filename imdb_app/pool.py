@@ -0,0 +1,263 @@
+import threading
+import time
+from collections import Counter
+
+from django.db import OperationalError
+
+from imdb_app.metrics import PREFIX, format_labels, format_value, registry
+
+# in process database connection pool, used by the imdb_app.backends.* database engines.
+# a thread borrows a connection when Django opens one and gives it back when Django closes it (at the
+# end of every request with CONN_MAX_AGE = 0), so the connection setup (TCP, TLS, auth) is paid once per
+# pooled connection and not once per request. DATABASES[alias]['POOL']:
+#   MIN_SIZE:     connections opened with the pool and never evicted for being idle
+#   MAX_SIZE:     connections open at once, borrowers wait for one beyond that
+#   MAX_IDLE:     seconds an idle connection above MIN_SIZE is kept
+#   TIMEOUT:      seconds a borrower waits for a connection before PoolExhausted
+#   HEALTH_CHECK: run SELECT 1 on a connection before lending it, broken ones are replaced
+
+DEFAULT_OPTIONS = {'MIN_SIZE': 0, 'MAX_SIZE': 10, 'MAX_IDLE': 300, 'TIMEOUT': 5, 'HEALTH_CHECK': True}
+
+
+class PoolExhausted(OperationalError):
+    pass
+
+
+def is_usable(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+        cursor.fetchall()
+    finally:
+        cursor.close()
+    # a connection out of autocommit is in a transaction now
+    connection.rollback()
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+
+    def __init__(self, name, database='', min_size=0, max_size=10, max_idle=300, timeout=5, health_check=True):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError('the pool needs 0 <= MIN_SIZE <= MAX_SIZE and MAX_SIZE >= 1')
+        self.name = name
+        self.database = database
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.health_check = health_check
+        self.condition = threading.Condition()
+        # (connection, idle since), the most recently returned last: borrowed first, the oldest are evicted
+        self.idle = []
+        self.in_use = set()
+        # open connections, idle + in use + being opened
+        self.size = 0
+        # created, closed, borrowed, waits, wait_seconds, exhausted, health_check_failures
+        self.counters = Counter()
+        self.closed = False
+
+    def fill(self, connect):
+        # opens connections up to MIN_SIZE
+        while True:
+            with self.condition:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            connection = self.open(connect)
+            with self.condition:
+                self.idle.append((connection, time.monotonic()))
+                self.condition.notify()
+
+    def open(self, connect):
+        # the caller has counted the connection in size already
+        try:
+            connection = connect()
+        except BaseException:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.counters['created'] += 1
+        return connection
+
+    def discard(self, connection):
+        close_quietly(connection)
+        with self.condition:
+            self.size -= 1
+            self.counters['closed'] += 1
+            self.condition.notify()
+
+    def expired(self):
+        # takes the idle connections above MIN_SIZE that waited longer than MAX_IDLE, condition held
+        expired = []
+        deadline = time.monotonic() - self.max_idle
+        while self.idle and self.idle[0][1] < deadline and self.size - len(expired) > self.min_size:
+            expired.append(self.idle.pop(0)[0])
+        return expired
+
+    def acquire(self, connect):
+        """
+        A connection from the pool, or a new one from connect() while the pool is smaller than MAX_SIZE.
+        Waits up to TIMEOUT seconds for one to be released, then raises PoolExhausted.
+        """
+        deadline = time.monotonic() + self.timeout
+        waited = 0.0
+        while True:
+            connection = None
+            with self.condition:
+                while True:
+                    expired = self.expired()
+                    if self.idle:
+                        connection = self.idle.pop()[0]
+                        break
+                    if self.size < self.max_size:
+                        self.size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['exhausted'] += 1
+                        self.counters['wait_seconds'] += waited
+                        raise PoolExhausted(f'no database connection free in pool {self.name} after '
+                                            f'{self.timeout}s ({self.max_size} in use)')
+                    if not waited:
+                        self.counters['waits'] += 1
+                    start = time.monotonic()
+                    self.condition.wait(remaining)
+                    waited += time.monotonic() - start
+            for stale in expired:
+                self.discard(stale)
+
+            if connection is None:
+                connection = self.open(connect)
+            elif self.health_check:
+                try:
+                    is_usable(connection)
+                except Exception:
+                    with self.condition:
+                        self.counters['health_check_failures'] += 1
+                    self.discard(connection)
+                    continue
+            with self.condition:
+                self.in_use.add(connection)
+                self.counters['borrowed'] += 1
+                self.counters['wait_seconds'] += waited
+            return connection
+
+    def release(self, connection):
+        # back to the pool, after rolling back what the borrower left open; a broken one is closed
+        with self.condition:
+            if connection not in self.in_use:
+                close_quietly(connection)
+                return
+            self.in_use.discard(connection)
+        try:
+            if self.closed:
+                raise OperationalError('the pool is closed')
+            connection.rollback()
+        except Exception:
+            self.discard(connection)
+            return
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def close(self):
+        # closes the idle connections, the borrowed ones are closed when they come back
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.closed = True
+        for connection, _ in idle:
+            self.discard(connection)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': len(self.in_use),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                **{name: self.counters[name] for name in
+                   ('created', 'closed', 'borrowed', 'waits', 'wait_seconds', 'exhausted', 'health_check_failures')},
+            }
+
+
+# one pool per alias and connection parameters (a test database gets its own)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_options(settings_dict):
+    return {**DEFAULT_OPTIONS, **settings_dict.get('POOL', {})}
+
+
+def get_pool(alias, key, settings_dict):
+    with _pools_lock:
+        pool = _pools.get((alias, key))
+        if pool is None:
+            options = pool_options(settings_dict)
+            pool = ConnectionPool(alias, str(settings_dict.get('NAME') or ''), min_size=options['MIN_SIZE'], max_size=options['MAX_SIZE'],
+                                  max_idle=options['MAX_IDLE'], timeout=options['TIMEOUT'],
+                                  health_check=options['HEALTH_CHECK'])
+            _pools[(alias, key)] = pool
+        return pool
+
+
+def pool_stats(alias=None):
+    with _pools_lock:
+        return [pool.stats() for (pool_alias, _), pool in _pools.items() if alias is None or pool_alias == alias]
+
+
+def close_pools(alias=None):
+    with _pools_lock:
+        pools = [(key, pool) for key, pool in _pools.items() if alias is None or key[0] == alias]
+        for key, _ in pools:
+            del _pools[key]
+    for _, pool in pools:
+        pool.close()
+
+
+# name -> (type, help, stats key)
+POOL_METRICS = {
+    'db_pool_connections': ('gauge', 'Open pooled connections by state', None),
+    'db_pool_max_connections': ('gauge', 'MAX_SIZE of the pool', 'max_size'),
+    'db_pool_connections_created_total': ('counter', 'Connections opened by the pool', 'created'),
+    'db_pool_connections_closed_total': ('counter', 'Connections closed by the pool', 'closed'),
+    'db_pool_borrows_total': ('counter', 'Connections lent out', 'borrowed'),
+    'db_pool_waits_total': ('counter', 'Borrowers that had to wait for a connection', 'waits'),
+    'db_pool_wait_seconds_total': ('counter', 'Time borrowers waited for a connection', 'wait_seconds'),
+    'db_pool_exhausted_total': ('counter', 'Borrowers that gave up after TIMEOUT', 'exhausted'),
+    'db_pool_health_check_failures_total': ('counter', 'Idle connections found broken on borrow',
+                                            'health_check_failures'),
+}
+
+
+def render_pool_metrics():
+    with _pools_lock:
+        stats = [((('alias', alias), ('database', pool.database)), pool.stats())
+                 for (alias, _), pool in _pools.items()]
+    if not stats:
+        return []
+    lines = []
+    for name, (metric_type, help_text, key) in POOL_METRICS.items():
+        full_name = f'{PREFIX}_{name}'
+        lines.append(f'# HELP {full_name} {help_text}')
+        lines.append(f'# TYPE {full_name} {metric_type}')
+        for labels, values in stats:
+            if key is None:
+                for state in ('idle', 'in_use'):
+                    lines.append(f'{full_name}{format_labels(labels + (("state", state),))} {format_value(values[state])}')
+            else:
+                lines.append(f'{full_name}{format_labels(labels)} {format_value(values[key])}')
+    return lines
+
+
+registry.add_collector(render_pool_metrics)
@@ -0,0 +1,134 @@
+import datetime
+import math
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from imdb_app.models import Rating, RatingSummary, MovieScore, ScoreRun
+
+# movie rankings read from precomputed scores (MovieScore), refreshed by the refresh_movie_scores command:
+#   top:      the bayesian average (v * R + m * C) / (v + m) of a movie's v ratings averaging R, with C the
+#             mean of all the ratings and m = settings.RANKING_MIN_VOTES, so a few 10s don't beat
+#             thousands of 9s
+#   trending: the ratings of a movie, each one counting half as much every TRENDING_HALF_LIFE_DAYS
+# a refresh after the first one only recomputes the movies whose ratings changed since the last run
+# (RatingSummary.score_stale, set in the transaction of the change), and C in the top scores of every movie
+
+# decayed scores are stored relative to this day, as log2: every score decays by the same factor, so
+# the order doesn't change with time and a movie that isn't rated again keeps its row as it is
+EPOCH = datetime.date(2000, 1, 1)
+MAX_LIMIT = 100
+
+
+def min_votes():
+    return getattr(settings, 'RANKING_MIN_VOTES', 25)
+
+
+def half_life_days():
+    return getattr(settings, 'TRENDING_HALF_LIFE_DAYS', 7)
+
+
+def bayesian(count, total, mean, m):
+    return (total + m * mean) / (count + m)
+
+
+def log_activity(days, half_life):
+    # log2(sum of n * 2 ** (days since EPOCH / half_life)) for the (day, n ratings) of a movie
+    exponents = [math.log2(n) + (day - EPOCH).days / half_life for day, n in days]
+    top = max(exponents)
+    return top + math.log2(sum(2 ** (exponent - top) for exponent in exponents))
+
+
+def decayed(log_score, half_life, today=None):
+    # the activity of a stored trending score, as of today
+    today = today or datetime.date.today()
+    return 2 ** (log_score - (today - EPOCH).days / half_life)
+
+
+def grouped_ratings(movie_ids=None):
+    # (movie_id, rating_date, number of ratings, sum of the ratings), one GROUP BY over the ratings
+    queryset = Rating.objects.order_by()
+    if movie_ids is not None:
+        queryset = queryset.filter(movie_id__in=movie_ids)
+    return queryset.values_list('movie_id', 'rating_date') \
+        .annotate(n=Count('id'), total=Sum('rating')) \
+        .order_by('movie_id', 'rating_date') \
+        .iterator()
+
+
+def compute_scores(rows, mean, m, half_life):
+    for movie_id, days in groupby(rows, key=lambda row: row[0]):
+        days = [(day, n, total) for _, day, n, total in days]
+        count = sum(n for _, n, _ in days)
+        total = sum(total for _, _, total in days)
+        yield MovieScore(
+            movie_id=movie_id,
+            ratings=count,
+            avg=total / count,
+            bayesian=bayesian(count, total, mean, m),
+            trending=log_activity([(day, n) for day, n, _ in days], half_life),
+        )
+
+
+def refresh_movie_scores(full=False, batch_size=1000):
+    """
+    Recomputes the scores of the movies whose ratings changed since the last run, or of every movie with
+    full=True (also when there was no run yet or the settings changed). Returns the ScoreRun.
+    """
+    m, half_life = min_votes(), half_life_days()
+    last = ScoreRun.objects.order_by('-id').first()
+    full = full or last is None or last.mean_rating is None \
+        or (last.min_votes, last.half_life_days) != (m, half_life)
+
+    with transaction.atomic():
+        # the flags are cleared first: a rating changed while the scores are computed waits for the
+        # lock of its summary and flags the movie again for the next run
+        stale = RatingSummary.objects.filter(score_stale=True)
+        if full:
+            stale.update(score_stale=False)
+            totals = Rating.objects.aggregate(n=Count('id'), total=Sum('rating'))
+            MovieScore.objects.all().delete()
+            chunks = [None]
+        else:
+            movie_ids = list(stale.values_list('movie_id', flat=True))
+            chunks = [movie_ids[i:i + batch_size] for i in range(0, len(movie_ids), batch_size)]
+            for chunk in chunks:
+                RatingSummary.objects.filter(movie_id__in=chunk).update(score_stale=False)
+            totals = RatingSummary.objects.aggregate(n=Sum('count'), total=Sum('total'))
+        mean = totals['total'] / totals['n'] if totals['n'] else None
+
+        movies = 0
+        for movie_ids in chunks:
+            scores = list(compute_scores(grouped_ratings(movie_ids), mean, m, half_life)) if mean is not None else []
+            if movie_ids is not None:
+                MovieScore.objects.filter(movie_id__in=movie_ids).delete()
+            MovieScore.objects.bulk_create(scores, batch_size=batch_size)
+            movies += len(scores)
+
+        if not full and mean is not None and mean != last.mean_rating:
+            # C moved: one UPDATE of the top score of the movies that weren't computed again
+            MovieScore.objects.update(bayesian=(F('avg') * F('ratings') + m * mean) / (F('ratings') + m))
+
+        return ScoreRun.objects.create(full=full, movies=movies, mean_rating=mean, min_votes=m,
+                                       half_life_days=half_life)
+
+
+def ranked_movies(order, limit):
+    # one ORDER BY <score> DESC, movie_id LIMIT n over the score's index, joined to the movies
+    return MovieScore.objects.order_by(f'-{order}', 'movie_id') \
+        .values_list('movie_id', 'movie__name', 'movie__release_year', 'ratings', 'avg', order)[:limit]
+
+
+def top_movies(limit=10):
+    return [{'id': movie_id, 'name': name, 'release_year': release_year, 'ratings': ratings, 'avg': avg,
+             'score': score}
+            for movie_id, name, release_year, ratings, avg, score in ranked_movies('bayesian', limit)]
+
+
+def trending_movies(limit=10, today=None):
+    half_life = half_life_days()
+    return [{'id': movie_id, 'name': name, 'release_year': release_year, 'ratings': ratings, 'avg': avg,
+             'score': decayed(score, half_life, today)}
+            for movie_id, name, release_year, ratings, avg, score in ranked_movies('trending', limit)]
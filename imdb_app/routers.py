@@ -0,0 +1,206 @@
+import contextvars
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from imdb_app.metrics import PREFIX, format_labels, format_value, registry
+from imdb_app.middleware import add_connection_wrapper
+
+# read replicas. ReplicaRoutingMiddleware picks one replica of settings.DATABASE_REPLICAS for every
+# GET / HEAD / OPTIONS request and ReplicaRouter sends the ORM reads of that request to it; writes, other
+# requests and code running outside of a request (commands, shell) use the primary ('default').
+# read your writes: a request that may write reads from the primary, and so does its client for
+# READ_YOUR_WRITES_SECONDS after it (a signed cookie), which should be longer than the replication lag
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+SELECTIONS = ('round_robin', 'least_latency')
+PIN_COOKIE = 'imdb_primary'
+PIN_SALT = 'imdb_app.routers'
+# weight of the latest query in the average latency of a replica
+LATENCY_WEIGHT = 0.2
+# least_latency still sends one request in this many round robin, to notice a replica getting faster
+EXPLORE_EVERY = 20
+
+# the replica the reads of the current request go to, None reads from the primary
+current_replica = contextvars.ContextVar('current_replica', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def selection():
+    return getattr(settings, 'REPLICA_SELECTION', 'round_robin')
+
+
+def pin_seconds():
+    return getattr(settings, 'READ_YOUR_WRITES_SECONDS', 5)
+
+
+class ReplicaSelector:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        # alias -> average query time in seconds, requests sent
+        self.latencies = {}
+        self.requests = {}
+
+    def choose(self, aliases, strategy='round_robin'):
+        if strategy not in SELECTIONS:
+            raise ValueError(f"REPLICA_SELECTION must be one of {', '.join(SELECTIONS)}")
+        with self.lock:
+            turn = next(self.counter)
+            if strategy == 'least_latency' and turn % EXPLORE_EVERY:
+                # replicas without a measure yet go first
+                alias = min(aliases, key=lambda name: self.latencies.get(name, 0.0))
+            else:
+                alias = aliases[turn % len(aliases)]
+            self.requests[alias] = self.requests.get(alias, 0) + 1
+        return alias
+
+    def observe(self, alias, seconds):
+        with self.lock:
+            average = self.latencies.get(alias)
+            self.latencies[alias] = seconds if average is None else \
+                average + LATENCY_WEIGHT * (seconds - average)
+
+    def reset(self):
+        with self.lock:
+            self.counter = itertools.count()
+            self.latencies.clear()
+            self.requests.clear()
+
+    def stats(self):
+        with self.lock:
+            return {alias: (self.latencies.get(alias), count) for alias, count in self.requests.items()}
+
+
+selector = ReplicaSelector()
+
+
+def record_replica_latency(execute, sql, params, many, context):
+    # an execute_wrapper of every connection (see middleware.py), times the queries of the current
+    # request's replica for least_latency
+    alias = current_replica.get()
+    if alias is None or context['connection'].alias != alias:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        selector.observe(alias, time.perf_counter() - start)
+
+
+add_connection_wrapper(record_replica_latency)
+
+
+class ReplicaRouter:
+    """
+    Reads go to the replica chosen for the current request (see ReplicaRoutingMiddleware), everything
+    else to the primary. Replicas get their schema from the primary, migrations only run there.
+    """
+
+    def db_for_read(self, model, **hints):
+        return current_replica.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
+
+
+def is_pinned(request):
+    seconds = pin_seconds()
+    return bool(seconds) and request.get_signed_cookie(PIN_COOKIE, default=None, salt=PIN_SALT,
+                                                       max_age=seconds) is not None
+
+
+def replica_for(request):
+    aliases = replicas()
+    if not aliases or request.method not in SAFE_METHODS or is_pinned(request):
+        return None
+    return selector.choose(aliases, selection())
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Chooses the database the reads of a request go to and pins the client to the primary after a
+    request that may have written.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @contextmanager
+    def routing(self, request):
+        alias = replica_for(request)
+        token = current_replica.set(alias)
+        try:
+            yield alias
+        finally:
+            current_replica.reset(token)
+
+    def pin(self, request, response):
+        seconds = pin_seconds()
+        if request.method not in SAFE_METHODS and seconds and replicas():
+            response.set_signed_cookie(PIN_COOKIE, '1', salt=PIN_SALT, max_age=seconds, httponly=True,
+                                       samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with self.routing(request):
+            response = self.get_response(request)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        with self.routing(request):
+            response = await self.get_response(request)
+        return self.pin(request, response)
+
+
+def render_replica_metrics():
+    stats = selector.stats()
+    if not stats:
+        return []
+    lines = [
+        f'# HELP {PREFIX}_db_replica_requests_total Requests whose reads were sent to a replica',
+        f'# TYPE {PREFIX}_db_replica_requests_total counter',
+    ]
+    for alias, (_, count) in sorted(stats.items()):
+        lines.append(f'{PREFIX}_db_replica_requests_total{format_labels((("alias", alias),))} {count}')
+    lines += [
+        f'# HELP {PREFIX}_db_replica_latency_seconds Average query time of a replica',
+        f'# TYPE {PREFIX}_db_replica_latency_seconds gauge',
+    ]
+    for alias, (latency, _) in sorted(stats.items()):
+        if latency is not None:
+            lines.append(f'{PREFIX}_db_replica_latency_seconds{format_labels((("alias", alias),))} '
+                         f'{format_value(latency)}')
+    return lines
+
+
+registry.add_collector(render_replica_metrics)
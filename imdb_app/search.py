@@ -0,0 +1,149 @@
+import re
+
+from django.db import connection
+
+# movie full text search, kept in a separate movie_search table created by migration 0006:
+# a tsvector column with a GIN index on PostgreSQL, an FTS5 virtual table on SQLite
+SEARCH_TABLE = 'movie_search'
+MAX_TERMS = 10
+WORD_RE = re.compile(r'\w+')
+
+
+def query_terms(query):
+    return WORD_RE.findall(query.lower())[:MAX_TERMS]
+
+
+def movies_table(movie_model=None):
+    # rebuild() from a migration passes the historical Movie model and the connection of the schema editor
+    return movie_model._meta.db_table if movie_model is not None else 'movies'
+
+
+class PostgresMovieSearch:
+
+    # name matches (weight A) rank above description matches (weight B)
+    document_sql = "setweight(to_tsvector('english', m.name), 'A') || " \
+                   "setweight(to_tsvector('english', m.description), 'B')"
+
+    def create_table(self, cursor):
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+                       f'movie_id bigint PRIMARY KEY REFERENCES movies (id) ON DELETE CASCADE, '
+                       f'document tsvector NOT NULL)')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx '
+                       f'ON {SEARCH_TABLE} USING gin (document)')
+
+    def drop_table(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def index_movies(self, movie_ids):
+        movie_ids = list(movie_ids)
+        if not movie_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'INSERT INTO {SEARCH_TABLE} (movie_id, document) '
+                           f'SELECT m.id, {self.document_sql} FROM movies m WHERE m.id = ANY(%s) '
+                           f'ON CONFLICT (movie_id) DO UPDATE SET document = EXCLUDED.document',
+                           [movie_ids])
+
+    def remove_movies(self, movie_ids):
+        movie_ids = list(movie_ids)
+        if not movie_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE movie_id = ANY(%s)', [movie_ids])
+
+    def rebuild(self, db_connection=None, movie_model=None):
+        with (db_connection or connection).cursor() as cursor:
+            cursor.execute(f'TRUNCATE {SEARCH_TABLE}')
+            cursor.execute(f'INSERT INTO {SEARCH_TABLE} (movie_id, document) '
+                           f'SELECT m.id, {self.document_sql} FROM {movies_table(movie_model)} m')
+            cursor.execute(f'SELECT count(*) FROM {SEARCH_TABLE}')
+            return cursor.fetchone()[0]
+
+    def to_tsquery(self, terms, description_only=False):
+        # every term is a prefix match, B restricts it to the description part of the document
+        weight = 'B' if description_only else ''
+        return ' & '.join(f'{term}:*{weight}' for term in terms)
+
+    def search(self, query, limit):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT m.id, m.name, m.year, ts_rank(s.document, q) AS rank, "
+                           f"ts_headline('english', m.description, q, 'MaxFragments=2') "
+                           f"FROM {SEARCH_TABLE} s JOIN movies m ON m.id = s.movie_id, "
+                           f"to_tsquery('english', %s) q "
+                           f"WHERE s.document @@ q ORDER BY rank DESC, m.id LIMIT %s",
+                           [self.to_tsquery(query_terms(query)), limit])
+            return cursor.fetchall()
+
+    def matching_ids_sql(self, query, description_only=False):
+        return f"SELECT movie_id FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('english', %s)", \
+            [self.to_tsquery(query_terms(query), description_only)]
+
+
+class SqliteMovieSearch:
+
+    # bm25 column weights: name, description
+    rank_sql = f'-bm25({SEARCH_TABLE}, 10.0, 1.0)'
+
+    def create_table(self, cursor):
+        cursor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} '
+                       f"USING fts5(name, description, tokenize='porter unicode61')")
+
+    def drop_table(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def index_movies(self, movie_ids):
+        movie_ids = list(movie_ids)
+        if not movie_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(movie_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', movie_ids)
+            cursor.execute(f'INSERT INTO {SEARCH_TABLE} (rowid, name, description) '
+                           f'SELECT id, name, description FROM movies WHERE id IN ({placeholders})', movie_ids)
+
+    def remove_movies(self, movie_ids):
+        movie_ids = list(movie_ids)
+        if not movie_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(movie_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', movie_ids)
+
+    def rebuild(self, db_connection=None, movie_model=None):
+        with (db_connection or connection).cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+            cursor.execute(f'INSERT INTO {SEARCH_TABLE} (rowid, name, description) '
+                           f'SELECT id, name, description FROM {movies_table(movie_model)}')
+            cursor.execute(f'SELECT count(*) FROM {SEARCH_TABLE}')
+            return cursor.fetchone()[0]
+
+    def to_match(self, terms, description_only=False):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        if description_only:
+            match = f'{{description}} : ({match})'
+        return match
+
+    def search(self, query, limit):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT m.id, m.name, m.year, {self.rank_sql} AS rank, "
+                           f"snippet({SEARCH_TABLE}, 1, '<b>', '</b>', '...', 32) "
+                           f"FROM {SEARCH_TABLE} JOIN movies m ON m.id = {SEARCH_TABLE}.rowid "
+                           f"WHERE {SEARCH_TABLE} MATCH %s ORDER BY rank DESC, m.id LIMIT %s",
+                           [self.to_match(query_terms(query)), limit])
+            return cursor.fetchall()
+
+    def matching_ids_sql(self, query, description_only=False):
+        return f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', \
+            [self.to_match(query_terms(query), description_only)]
+
+
+def get_movie_search(vendor=None):
+    if (vendor or connection.vendor) == 'postgresql':
+        return PostgresMovieSearch()
+    return SqliteMovieSearch()
+
+
+def search_movies(query, limit):
+    rows = get_movie_search().search(query, limit)
+    return [{'id': movie_id, 'name': name, 'release_year': release_year, 'rank': rank, 'headline': headline}
+            for movie_id, name, release_year, rank, headline in rows]
@@ -1,3 +1,6 @@
+import time
+from collections import Counter
+
 from django.contrib.auth.password_validation import validate_password
 from django.db import transaction
 from rest_framework import serializers
@@ -6,7 +9,9 @@ from rest_framework.exceptions import ValidationError
 from rest_framework.serializers import ModelSerializer
 from rest_framework.validators import UniqueTogetherValidator
 
-from imdb_app.models import Movie, Actor, MovieActor, Rating, Directors, Oscars
+from imdb_app.cache import invalidate_on_write
+from imdb_app.middleware import current_recorder
+from imdb_app.models import Movie, Actor, MovieActor, MovieDirector, Rating, Directors, Oscars
 from imdb_app.validators import MinAgeValidator
 
 
@@ -16,7 +21,39 @@ from imdb_app.validators import MinAgeValidator
 #     description = serializers.CharField()
 
 
-class MovieSerializer(serializers.ModelSerializer):
+class TimedSerializerMixin:
+
+    # the time spent building the output goes to the metrics of the request (see middleware.py),
+    # nested serializers are part of the outermost one
+    def to_representation(self, instance):
+        recorder = current_recorder.get()
+        if recorder is None:
+            return super().to_representation(instance)
+        recorder.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            recorder.serializer_depth -= 1
+            if recorder.serializer_depth == 0:
+                recorder.serializer_time += time.perf_counter() - start
+
+
+class DynamicFieldsMixin:
+
+    # fields=['id', 'name'] keeps only those fields in the output (sparse fieldsets),
+    # expand={'movie': MovieSerializer(read_only=True)} nests related objects (always kept)
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = expand or {}
+        for name, field in expand.items():
+            self.fields[name] = field
+        if fields is not None:
+            for name in set(self.fields) - set(fields) - set(expand):
+                self.fields.pop(name)
+
+
+class MovieSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Movie
         # fields = '__all__'
@@ -25,13 +62,13 @@ class MovieSerializer(serializers.ModelSerializer):
         # depth = 1
 
 
-class DetailedMovieSerializer(serializers.ModelSerializer):
+class DetailedMovieSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Movie
         exclude = ['actors']
 
 
-class ActorSerializer(serializers.ModelSerializer):
+class ActorSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
 
     # birth_year = serializers.IntegerField(required=False, validators=[])
     class Meta:
@@ -45,15 +82,23 @@ class ActorSerializer(serializers.ModelSerializer):
         }
 
 
-class CastSerializer(serializers.ModelSerializer):
+class CastSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
+
+    # the actor is nested, so querysets of this serializer need select_related('actor')
+    actor = ActorSerializer(read_only=True)
+
     class Meta:
         model = MovieActor
         # fields = '__all__'
         exclude = ['id', 'movie']
-        depth = 1
+
+    def __init__(self, *args, actor_fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if actor_fields is not None and 'actor' in self.fields:
+            self.fields['actor'] = ActorSerializer(read_only=True, fields=actor_fields)
 
 
-class WriteCastSerializer(serializers.ModelSerializer):
+class WriteCastSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = MovieActor
         fields = '__all__'
@@ -61,7 +106,7 @@ class WriteCastSerializer(serializers.ModelSerializer):
         # configured blank=True in Models
 
 
-class RatingSerializer(serializers.ModelSerializer):
+class RatingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Rating
         exclude = ['id']
@@ -73,27 +118,48 @@ class RatingSerializer(serializers.ModelSerializer):
 
 
 
-class CastForMovieSerializer(serializers.ModelSerializer):
+def cast_errors(actor_ids, existing_actor_ids):
+    errors = []
+    missing = sorted(set(actor_ids) - set(existing_actor_ids))
+    if missing:
+        errors.append(f"Actors do not exist: {', '.join(map(str, missing))}")
+    duplicates = sorted(actor_id for actor_id, n in Counter(actor_ids).items() if n > 1)
+    if duplicates:
+        errors.append(f"Actors appear more than once in the cast: {', '.join(map(str, duplicates))}")
+    return errors
+
+
+def director_errors(director_ids, existing_director_ids):
+    errors = []
+    missing = sorted(set(director_ids) - set(existing_director_ids))
+    if missing:
+        errors.append(f"Directors do not exist: {', '.join(map(str, missing))}")
+    duplicates = sorted(director_id for director_id, n in Counter(director_ids).items() if n > 1)
+    if duplicates:
+        errors.append(f"Directors appear more than once: {', '.join(map(str, duplicates))}")
+    return errors
+
+
+class CastForMovieSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+
+    # a plain id, the actors of the whole cast are looked up together in CreateMovieSerializer.validate_cast
+    actor = serializers.IntegerField(min_value=1)
+
     class Meta:
         model = MovieActor
         fields = ['actor', 'salary', 'main_role']
 
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Actor.objects.all(),
-                fields=['actor']
-            )
-        ]
-
 
 
-class CreateMovieSerializer(serializers.ModelSerializer):
+class CreateMovieSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     cast = CastForMovieSerializer(required=False, many=True)
+    # ids of the directors, credited links (see MovieDirector)
+    directors = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, write_only=True)
 
     class Meta:
         model = Movie
-        fields = ['id', 'name', 'description', 'duration_in_min', 'release_year', 'cast']
+        fields = ['id', 'name', 'description', 'duration_in_min', 'release_year', 'cast', 'directors']
         extra_kwargs = {
             'id': {'read_only': True}
         }
@@ -106,28 +172,67 @@ class CreateMovieSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         with transaction.atomic():
-            cast_data = validated_data.pop('cast')
+            cast_data = validated_data.pop('cast', [])
+            director_ids = validated_data.pop('directors', [])
             movie = Movie.objects.create(**validated_data)
-            for cast in cast_data:
-                MovieActor.objects.create(**cast, movie_id=movie.id)
+            MovieActor.objects.bulk_create(
+                [MovieActor(movie=movie, actor_id=cast['actor'], salary=cast['salary'], main_role=cast['main_role'])
+                 for cast in cast_data]
+            )
+            MovieDirector.objects.bulk_create(
+                [MovieDirector(movie=movie, director_id=director_id, credited=True) for director_id in director_ids]
+            )
+            # bulk_create sends no post_save signals
+            invalidate_on_write(MovieActor)
+            invalidate_on_write(MovieDirector)
             return movie
 
+    def validate_cast(self, value):
+        actor_ids = [cast['actor'] for cast in value]
+        existing = set(Actor.objects.filter(id__in=actor_ids).values_list('id', flat=True))
+        errors = cast_errors(actor_ids, existing)
+        if errors:
+            raise ValidationError(errors)
+        return value
+
+    def validate_directors(self, value):
+        existing = set(Directors.objects.filter(id__in=value).values_list('id', flat=True))
+        errors = director_errors(value, existing)
+        if errors:
+            raise ValidationError(errors)
+        return value
+
 
     def validate(self, attrs):
         if attrs['release_year'] <= 1920 and attrs['duration_in_min'] >= 60:
             raise ValidationError('Old movies supposed to me short')
         return attrs
 
+
+class BatchMovieSerializer(CreateMovieSerializer):
+
+    # name uniqueness, the cast actors and the directors are checked for a whole chunk of movies at once,
+    # see ingest.MovieIngestion
+    class Meta(CreateMovieSerializer.Meta):
+        validators = []
+
+    def validate_cast(self, value):
+        return value
+
+    def validate_directors(self, value):
+        return value
+
+
 # def validate_cast(val):
 #     if val not in Actor.objects.all():
 #         raise ValidationError("Some of the actors do not exist")
 
-class MovieActorSerializer(serializers.ModelSerializer):
+class MovieActorSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = MovieActor
         fields = '__all__'
 
-class DirectorsSerializer(serializers.ModelSerializer):
+class DirectorsSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Directors
         fields = '__all__'
@@ -138,7 +243,7 @@ class DirectorsSerializer(serializers.ModelSerializer):
         }
 
 
-class OscarsSerializer(serializers.ModelSerializer):
+class OscarsSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Oscars
         fields = '__all__'
@@ -152,7 +257,68 @@ class OscarsSerializer(serializers.ModelSerializer):
         }
 
 
-class SignupSerializer(ModelSerializer):
+class ListOscarsSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
+
+    # filled by annotations on the list queryset (see OscarsViewSet.get_queryset)
+    movie_name = serializers.CharField(read_only=True)
+    actor_name = serializers.CharField(read_only=True)
+    director_name = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Oscars
+        fields = '__all__'
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # actor / director names are only part of the response when the nomination has one
+        for name_field in ('actor_name', 'director_name'):
+            if name_field in data and data[name_field] is None:
+                del data[name_field]
+        return data
+
+
+class MovieOscarsSerializer(ListOscarsSerializer):
+
+    # the nominations of one movie, actor / director names annotated on the prefetch queryset
+    class Meta(ListOscarsSerializer.Meta):
+        fields = ['id', 'nomination', 'ceremony_year', 'actor', 'actor_name', 'director', 'director_name']
+
+
+class FilmographyOscarsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Oscars
+        fields = ['id', 'nomination', 'ceremony_year']
+
+
+class FilmographySerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
+
+    # one movie of an actor / director, from its MovieActor / MovieDirector row. the movie and its rating
+    # summary are selected with the row, the person's nominations for the movie prefetched as movie.nominations
+    movie = MovieSerializer(read_only=True)
+    rating = serializers.SerializerMethodField()
+    oscars = FilmographyOscarsSerializer(source='movie.nominations', many=True, read_only=True)
+
+    def get_rating(self, obj):
+        summary = getattr(obj.movie, 'rating_summary', None)
+        return {
+            'count': summary.count if summary else 0,
+            'avg': summary.avg if summary else None,
+        }
+
+
+class ActorFilmographySerializer(FilmographySerializer):
+    class Meta:
+        model = MovieActor
+        fields = ['movie', 'main_role', 'salary', 'rating', 'oscars']
+
+
+class DirectorFilmographySerializer(FilmographySerializer):
+    class Meta:
+        model = MovieDirector
+        fields = ['movie', 'rating', 'oscars']
+
+
+class SignupSerializer(TimedSerializerMixin, ModelSerializer):
 
     password = serializers.CharField(
         max_length=128, validators=[validate_password], write_only=True)
@@ -175,7 +341,7 @@ class SignupSerializer(ModelSerializer):
         user.save()
         return user
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         exclude = ['password', 'groups', 'last_login', 'user_permissions']
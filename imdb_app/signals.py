@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from imdb_app.authentication import clear_credential_cache
+from imdb_app.cache import invalidate_on_write
+from imdb_app.costars import loaded_costar_graph
+from imdb_app.models import Movie, Actor, MovieActor, MovieDirector, Directors, Oscars, Rating
+
+
+@receiver([post_save, post_delete], sender=Movie)
+@receiver([post_save, post_delete], sender=Actor)
+@receiver([post_save, post_delete], sender=MovieActor)
+@receiver([post_save, post_delete], sender=MovieDirector)
+@receiver([post_save, post_delete], sender=Directors)
+@receiver([post_save, post_delete], sender=Oscars)
+@receiver([post_save, post_delete], sender=Rating)
+def invalidate_cached_responses(sender, **kwargs):
+    invalidate_on_write(sender)
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def forget_verified_credentials(sender, **kwargs):
+    clear_credential_cache()
+
+
+@receiver(pre_save, sender=MovieActor)
+def remember_cast_link(sender, instance, **kwargs):
+    # the (actor, movie) an update replaces, only looked up while the co-star graph is loaded
+    if loaded_costar_graph() is not None and not instance._state.adding and instance.pk is not None:
+        instance._previous_link = MovieActor.objects.filter(pk=instance.pk) \
+            .values_list('actor_id', 'movie_id').first()
+
+
+@receiver([post_save, post_delete], sender=MovieActor)
+def update_costar_graph(sender, instance, created=False, **kwargs):
+    # new rows are linked and updated / deleted ones checked again, after the commit
+    graph = loaded_costar_graph()
+    if graph is None:
+        return
+    if created:
+        actor_id, movie_id = instance.actor_id, instance.movie_id
+        transaction.on_commit(lambda: graph.link(actor_id, movie_id))
+        return
+    pairs = {(instance.actor_id, instance.movie_id)}
+    previous = getattr(instance, '_previous_link', None)
+    if previous:
+        pairs.add(previous)
+    transaction.on_commit(lambda: graph.refresh(pairs))
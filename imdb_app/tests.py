@@ -1,3 +1,1702 @@
-from django.test import TestCase
+import asyncio
+import base64
+import datetime
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command, CommandError
+from django.db import connection, connections, router
+from django.db.utils import load_backend
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APIRequestFactory
+
+from imdb_app.benchmark import generate_catalogue, run_benchmark, find_regressions, load_test, compare_trend_sources, \
+    auth_overhead, \
+    serializer_cpu_per_row, synthetic_cast
+from imdb_app.cache import get_response_cache
+from imdb_app.costars import CoStarGraph, get_costar_graph, reset_costar_graph, timed_paths
+from imdb_app.fastjson import compile_serializer
+from imdb_app.metrics import registry
+from imdb_app.middleware import fingerprint
+from imdb_app.models import Movie, Actor, Directors, Oscars, Rating, RatingSummary, RatingDay, MovieActor, \
+    MovieScore, MovieDirector
+from imdb_app.pool import ConnectionPool, PoolExhausted, close_pools
+from imdb_app.serializers import ListOscarsSerializer, RatingSerializer
+from imdb_app.ranking import refresh_movie_scores
+from imdb_app.routers import PIN_COOKIE, ReplicaSelector, selector
+from imdb_app.trends import stale_rating_days, rebuild_rating_days
+from imdb_app.view_sets import MovieFilterSet, OscarsFilterSet, RatingFilterSet
+from imdb_app.views import get_movies
+
+
+class OscarsListTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.movie = Movie.objects.create(name='Pulp Fiction', description='Mob hitmen', duration_in_min=154,
+                                          release_year=1994)
+        self.actor = Actor.objects.create(name='Uma Thurman', birth_year=1970)
+        self.director = Directors.objects.create(name='Quentin Tarantino', birth_year=1963)
+
+    def create_oscars(self, count):
+        for i in range(count):
+            Oscars.objects.create(nomination='ACTRESS IN A LEADING ROLE', ceremony_year=1995 + i,
+                                  movie=self.movie, actor=self.actor, director=self.director)
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/imdb/oscars/')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_list_includes_names(self):
+        Oscars.objects.create(nomination='best picture', ceremony_year=1995, movie=self.movie)
+        _, response = self.count_list_queries()
+        oscar = response.data['results'][0]
+        self.assertEqual(oscar['movie_name'], 'Pulp Fiction')
+        self.assertEqual(oscar['nomination'], 'BEST PICTURE')
+        self.assertNotIn('actor_name', oscar)
+        self.assertNotIn('director_name', oscar)
+
+    def test_list_query_count_is_constant(self):
+        self.create_oscars(1)
+        single_row_queries, response = self.count_list_queries()
+        self.assertEqual(response.data['results'][0]['actor_name'], 'Uma Thurman')
+        self.assertEqual(response.data['results'][0]['director_name'], 'Quentin Tarantino')
+
+        self.create_oscars(10)
+        full_page_queries, response = self.count_list_queries()
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(single_row_queries, full_page_queries)
+
+
+class RatingSummaryTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.movie = Movie.objects.create(name='Inception', description='Dreams', duration_in_min=148,
+                                          release_year=2010)
+
+    def test_summary_follows_added_and_deleted_ratings(self):
+        for rating in (4, 8, 9):
+            response = self.client.post(f'/api/imdb/ratings/{self.movie.id}', {'rating': rating}, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        summary = RatingSummary.objects.get(movie=self.movie)
+        self.assertEqual((summary.count, summary.total, summary.min_rating, summary.max_rating), (3, 21, 4, 9))
+        self.assertEqual(summary.histogram, [0, 0, 0, 1, 0, 0, 0, 1, 1, 0])
+
+        rating = Rating.objects.get(movie=self.movie, rating=4)
+        response = self.client.delete(f'/api/imdb/ratings/delete/{rating.id}')
+        self.assertEqual(response.status_code, 204)
+
+        summary.refresh_from_db()
+        self.assertEqual((summary.count, summary.total, summary.min_rating, summary.max_rating), (2, 17, 8, 9))
+
+    def test_avg_is_a_single_query(self):
+        Rating.objects.create(movie=self.movie, rating=6)
+        Rating.objects.create(movie=self.movie, rating=9)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/imdb/movies/{self.movie.id}/ratings/avg')
+        self.assertEqual(response.data, {'rating__avg': 7.5})
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_avg_without_ratings(self):
+        response = self.client.get(f'/api/imdb/movies/{self.movie.id}/ratings/avg')
+        self.assertEqual(response.data, {'rating__avg': None})
+        response = self.client.get('/api/imdb/movies/9999/ratings/avg')
+        self.assertEqual(response.status_code, 404)
+
+    def test_rebuild_command(self):
+        Rating.objects.create(movie=self.movie, rating=3)
+        Rating.objects.create(movie=self.movie, rating=5)
+        # queryset deletes skip Rating.delete, so the summary goes stale
+        Rating.objects.filter(rating=3).delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rating_summaries', '--check-only', stdout=StringIO(), stderr=StringIO())
+
+        call_command('rebuild_rating_summaries', stdout=StringIO())
+        summary = RatingSummary.objects.get(movie=self.movie)
+        self.assertEqual((summary.count, summary.total, summary.min_rating, summary.max_rating), (1, 5, 5, 5))
+
+
+class BulkRatingsTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        self.movie = Movie.objects.create(name='Avatar', description='Pandora', duration_in_min=162,
+                                          release_year=2010)
+
+    def test_ndjson_upload(self):
+        body = '\n'.join([
+            json.dumps({'movie_id': self.movie.id, 'rating': 8, 'date': '2020-01-05'}),
+            json.dumps({'movie_id': self.movie.id, 'rating': 11}),
+            'not json',
+            json.dumps({'movie_id': 9999, 'rating': 5}),
+            json.dumps({'movie_id': self.movie.id, 'rating': 6}),
+            json.dumps({'movie_id': self.movie.id, 'rating': 7.9}),
+        ])
+        response = self.client.post('/api/imdb/ratings/bulk?batch_size=2', body,
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['inserted'], 2)
+        self.assertEqual(response.data['rejected'], 4)
+        self.assertEqual([reject['line'] for reject in response.data['rejects']], [2, 3, 4, 6])
+        self.assertEqual(response.data['rejects'][3]['error'], 'rating is missing or not a whole number')
+
+        self.assertEqual(Rating.objects.get(rating=8).rating_date, datetime.date(2020, 1, 5))
+        summary = RatingSummary.objects.get(movie=self.movie)
+        self.assertEqual((summary.count, summary.total), (2, 14))
+
+    def test_csv_upload(self):
+        body = f'movie_id,rating,date\n{self.movie.id},7,2021-03-01\n{self.movie.id},9,yesterday\n' \
+               f'{self.movie.id},7.9,2021-03-01\n'
+        response = self.client.post('/api/imdb/ratings/bulk', body, content_type='text/csv')
+        self.assertEqual(response.data['inserted'], 1)
+        self.assertEqual(response.data['rejects'], [{'line': 3, 'error': 'date must be in YYYY-MM-DD format'},
+                                                    {'line': 4, 'error': 'rating is missing or not a whole number'}])
+
+    def test_only_admins_can_upload(self):
+        self.client.force_authenticate(None)
+        response = self.client.post('/api/imdb/ratings/bulk', '', content_type='application/x-ndjson')
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_import_command_checks_movies_once_per_batch(self):
+        rows = ''.join(json.dumps({'movie_id': self.movie.id, 'rating': 5}) + '\n' for _ in range(50))
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as f:
+            f.write(rows)
+        self.addCleanup(os.remove, f.name)
+
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('import_ratings', f.name, '--batch-size', '25', stdout=StringIO())
+        self.assertEqual(Rating.objects.count(), 50)
+        movie_queries = [q for q in ctx.captured_queries if 'FROM "movies"' in q['sql']]
+        self.assertEqual(len(movie_queries), 2)
+
+
+class CursorPaginationTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        # bulk_create sends no signals to invalidate cached actor lists
+        get_response_cache().clear()
+        Actor.objects.bulk_create([Actor(name=f'Actor {i}', birth_year=1970) for i in range(10)])
+
+    def test_default_is_page_number(self):
+        response = self.client.get('/api/imdb/actors/')
+        self.assertEqual(response.data['count'], 10)
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_cursor_mode_walks_all_rows_without_count(self):
+        names = []
+        url = '/api/imdb/actors/?pagination=cursor&page_size=4'
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertNotIn('count', response.data)
+            for query in ctx.captured_queries:
+                self.assertNotIn('COUNT(', query['sql'].upper())
+                self.assertNotIn('OFFSET', query['sql'].upper())
+            names.extend(actor['name'] for actor in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(names, [f'Actor {i}' for i in range(10)])
+
+    @override_settings(MAX_PAGE_SIZE=5)
+    def test_page_size_is_capped(self):
+        response = self.client.get('/api/imdb/actors/?pagination=cursor&page_size=1000')
+        self.assertEqual(len(response.data['results']), 5)
+
+
+class FilterIndexTestCase(TestCase):
+    # EXPLAIN the querysets the filtersets build and fail if they fall back to a full table scan
+
+    def plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # the test tables are tiny, make the planner show whether an index *can* be used
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def assertNoFullScan(self, queryset, table):
+        plan = self.plan(queryset)
+        if connection.vendor == 'postgresql':
+            self.assertNotIn(f'Seq Scan on {table}', plan)
+        else:
+            self.assertNotRegex(plan, rf'SCAN {table}\b')
+            self.assertIn(f'SEARCH {table}', plan)
+
+    def movies(self, **params):
+        return MovieFilterSet(params, queryset=Movie.objects.all()).qs
+
+    def oscars(self, **params):
+        return OscarsFilterSet(params, queryset=Oscars.objects.all()).qs
+
+    def ratings(self, **params):
+        return RatingFilterSet(params, queryset=Rating.objects.all()).qs
+
+    def test_movie_filters(self):
+        self.assertNoFullScan(self.movies(release_year=2010), 'movies')
+        self.assertNoFullScan(self.movies(duration_from=90), 'movies')
+        self.assertNoFullScan(self.movies(duration_from=90, duration_to=120), 'movies')
+
+    def test_postgresql_only_filters(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("SQLite runs iexact / icontains as LIKE and won't use an index for NOT (x IS NULL)")
+        self.assertNoFullScan(self.movies(name='Avatar'), 'movies')
+        self.assertNoFullScan(self.movies(description='dream'), 'movies')
+        self.assertNoFullScan(self.oscars(actor_nominations=True), 'oscars')
+
+    def test_oscars_filters(self):
+        self.assertNoFullScan(self.oscars(ceremony_year='1995'), 'oscars')
+        self.assertNoFullScan(self.oscars(ceremony_year='1995', nomination='BEST PICTURE'), 'oscars')
+        self.assertNoFullScan(self.oscars(nomination='BEST PICTURE'), 'oscars')
+        self.assertNoFullScan(self.oscars(from_year=1990, to_year=2000), 'oscars')
+
+    def test_rating_filters(self):
+        self.assertNoFullScan(self.ratings(movie=1), 'ratings')
+        self.assertNoFullScan(self.ratings(movie=1, from_date='2020-01-01', to_date='2020-12-31'), 'ratings')
+        self.assertNoFullScan(self.ratings(from_date='2020-01-01', ordering='-rating_date'), 'ratings')
+        self.assertNoFullScan(self.ratings(from_date='2020-01-01', to_date='2020-12-31'), 'ratings')
+
+
+class MovieSearchTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.inception = Movie.objects.create(
+            name='Inception', duration_in_min=148, release_year=2010,
+            description='A thief who steals corporate secrets through the use of dream-sharing technology')
+        self.dreamgirls = Movie.objects.create(name='Dreamgirls', description='A trio of singers',
+                                               duration_in_min=130, release_year=2006)
+        Movie.objects.create(name='Avatar', description='A marine on Pandora', duration_in_min=162,
+                             release_year=2009)
+
+    def search(self, q):
+        response = self.client.get('/api/imdb/movies/search', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_prefix_match_ranks_name_above_description(self):
+        results = self.search('dream')
+        self.assertEqual([movie['id'] for movie in results], [self.dreamgirls.id, self.inception.id])
+        self.assertIn('<b>dream</b>', results[1]['headline'])
+
+    def test_all_terms_must_match(self):
+        results = self.search('thief secr')
+        self.assertEqual([movie['name'] for movie in results], ['Inception'])
+        self.assertEqual(self.search('thief pandora'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.inception.description = 'Heist inside a sleeping mind'
+        self.inception.save()
+        self.assertEqual([movie['name'] for movie in self.search('dream')], ['Dreamgirls'])
+        self.assertEqual([movie['name'] for movie in self.search('heist')], ['Inception'])
+
+        self.dreamgirls.delete()
+        self.assertEqual(self.search('dream'), [])
+
+    def test_requires_a_query(self):
+        response = self.client.get('/api/imdb/movies/search', {'q': '  ?! '})
+        self.assertEqual(response.status_code, 400)
+
+    def test_description_filter_uses_search_index(self):
+        response = self.client.get('/api/imdb/movies/', {'description': 'dream'})
+        self.assertEqual([movie['name'] for movie in response.data['results']], ['Inception'])
+
+    def test_description_without_words_is_no_filter(self):
+        # the function view of /movies, not routed any more
+        for description in ('dream', ' ?! '):
+            with self.subTest(description=description):
+                request = APIRequestFactory().get('/api/imdb/movies', {'description': description})
+                response = get_movies(request)
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 3)
+
+    def test_rebuild_command(self):
+        # bulk_create skips Movie.save, so the movie is missing from the index until a rebuild
+        Movie.objects.bulk_create([Movie(name='Dreamcatcher', description='Friends in the woods',
+                                         duration_in_min=136, release_year=2003)])
+        self.assertEqual(len(self.search('dream')), 2)
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.search('dream')), 3)
+
+
+class ResponseCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.movie = Movie.objects.create(name='The Departed', description='Undercover cop',
+                                          duration_in_min=151, release_year=2006)
+
+    def get(self, url, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, headers=headers)
+        return response, len(ctx.captured_queries)
+
+    def test_repeated_reads_are_served_from_cache(self):
+        first, first_queries = self.get('/api/imdb/movies/?release_year=2006&name=the%20departed')
+        second, second_queries = self.get('/api/imdb/movies/?name=the%20departed&release_year=2006')
+        self.assertGreater(first_queries, 0)
+        self.assertEqual(second_queries, 0)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_if_none_match(self):
+        response, _ = self.get(f'/api/imdb/movies/{self.movie.id}/')
+        not_modified, _ = self.get(f'/api/imdb/movies/{self.movie.id}/', If_None_Match=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.movie.name = 'The Departed (2006)'
+        self.movie.save()
+        changed, _ = self.get(f'/api/imdb/movies/{self.movie.id}/', If_None_Match=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.data['name'], 'The Departed (2006)')
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_related_writes_invalidate(self):
+        actor = Actor.objects.create(name='Jack Nicholson', birth_year=1937)
+        Oscars.objects.create(nomination='ACTOR IN A SUPPORTING ROLE', ceremony_year=2007,
+                              movie=self.movie, actor=actor)
+        response, _ = self.get('/api/imdb/oscars/')
+        self.assertEqual(response.data['results'][0]['actor_name'], 'Jack Nicholson')
+
+        actor.name = 'Jack Nicholson Jr.'
+        actor.save()
+        response, queries = self.get('/api/imdb/oscars/')
+        self.assertGreater(queries, 0)
+        self.assertEqual(response.data['results'][0]['actor_name'], 'Jack Nicholson Jr.')
+
+    def test_roles_are_cached_separately(self):
+        self.get('/api/imdb/actors/')
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        _, queries = self.get('/api/imdb/actors/')
+        self.assertGreater(queries, 0)
+
+    @override_settings(RESPONSE_CACHE={'BACKEND': 'default', 'TIMEOUT': 60})
+    def test_django_cache_backend(self):
+        self.get('/api/imdb/directors/')
+        _, queries = self.get('/api/imdb/directors/')
+        self.assertEqual(queries, 0)
+        Directors.objects.create(name='Martin Scorsese', birth_year=1942)
+        response, _ = self.get('/api/imdb/directors/')
+        self.assertEqual(response.data['count'], 1)
+
+
+class CreateMovieCastTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        self.actors = Actor.objects.bulk_create([Actor(name=f'Actor {i}', birth_year=1970) for i in range(60)])
+
+    def movie(self, name, actors):
+        return {'name': name, 'description': 'A movie', 'duration_in_min': 120, 'release_year': 2000,
+                'cast': [{'actor': actor.id, 'salary': 1000, 'main_role': False} for actor in actors]}
+
+    def create(self, data):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/imdb/movies/', data, format='json')
+        self.cast_queries = [q['sql'] for q in ctx.captured_queries
+                             if 'FROM "actors"' in q['sql'] or 'INTO "movie_actors"' in q['sql']]
+        return response, len(ctx.captured_queries)
+
+    def test_query_count_does_not_depend_on_cast_size(self):
+        response, small_cast_queries = self.create(self.movie('Small', self.actors[:2]))
+        self.assertEqual(response.status_code, 201)
+        response, large_cast_queries = self.create(self.movie('Large', self.actors))
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(small_cast_queries, large_cast_queries)
+        # one IN lookup of the actors and one insert of the whole cast
+        self.assertEqual(len(self.cast_queries), 2)
+        movie = Movie.objects.get(name='Large')
+        self.assertEqual(MovieActor.objects.filter(movie=movie).count(), 60)
+
+    def test_reports_all_missing_and_duplicate_actors(self):
+        data = self.movie('Broken', self.actors[:3])
+        data['cast'] += [{'actor': 99998, 'salary': 1, 'main_role': True},
+                         {'actor': 99999, 'salary': 1, 'main_role': True},
+                         {'actor': self.actors[0].id, 'salary': 1, 'main_role': True}]
+        response, _ = self.create(data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['cast'], [
+            'Actors do not exist: 99998, 99999',
+            f'Actors appear more than once in the cast: {self.actors[0].id}',
+        ])
+        self.assertFalse(Movie.objects.filter(name='Broken').exists())
+
+    def test_cast_invalidated_again_after_commit(self):
+        cache = get_response_cache()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.create(self.movie('Later', self.actors[:2]))
+        generation = cache.generations([MovieActor])
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.generations([MovieActor]), generation)
+
+    def test_cast_is_optional(self):
+        data = self.movie('No cast', [])
+        del data['cast']
+        response, _ = self.create(data)
+        self.assertEqual(response.status_code, 201)
+
+
+class BatchMovieImportTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        self.actor = Actor.objects.create(name='Leonardo DiCaprio', birth_year=1974)
+        Movie.objects.create(name='Titanic', description='Ship', duration_in_min=195, release_year=1997)
+
+    def movie(self, name, actor_id=None):
+        actor_id = actor_id or self.actor.id
+        return {'name': name, 'description': f'About {name}', 'duration_in_min': 120, 'release_year': 2000,
+                'cast': [{'actor': actor_id, 'salary': 100, 'main_role': True}]}
+
+    def test_json_list_in_chunks(self):
+        director = Directors.objects.create(name='James Cameron', birth_year=1954)
+        movies = [{**self.movie(f'Movie {i}'), 'directors': [director.id]} for i in range(7)]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/imdb/movies/batch/?chunk_size=3', movies, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 7)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created'] * 7)
+        self.assertEqual(MovieActor.objects.filter(actor=self.actor).count(), 7)
+        self.assertEqual(MovieDirector.objects.filter(director=director, credited=True).count(), 7)
+        # 3 chunks, each with one name check and one movie insert
+        movie_inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "movies"')]
+        self.assertEqual(len(movie_inserts), 3)
+
+    def test_all_or_nothing(self):
+        movies = [self.movie('New one'), self.movie('Titanic'), self.movie('Other', actor_id=9999),
+                  self.movie('New one')]
+        response = self.client.post('/api/imdb/movies/batch/?chunk_size=1', movies, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.data['rolled_back'])
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         ['rolled_back', 'rejected', 'rejected', 'rejected'])
+        self.assertFalse(Movie.objects.filter(name='New one').exists())
+
+    def test_best_effort_ndjson(self):
+        body = '\n'.join([json.dumps(self.movie('Inception')), 'oops', json.dumps(self.movie('Titanic')),
+                          json.dumps({'name': 'No year'})])
+        response = self.client.post('/api/imdb/movies/batch/?mode=best_effort', body,
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'rejected', 'rejected', 'rejected'])
+        self.assertEqual(results[2]['errors'], {'name': ['A movie with this name already exists']})
+        self.assertIn('release_year', results[3]['errors'])
+        self.assertTrue(Movie.objects.filter(name='Inception', movieactor__actor=self.actor).exists())
+
+    def test_only_staff(self):
+        self.client.force_authenticate(None)
+        response = self.client.post('/api/imdb/movies/batch/', [self.movie('X')], format='json')
+        self.assertIn(response.status_code, (401, 403))
+
+
+class OscarsLeaderboardTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.titanic = Movie.objects.create(name='Titanic', description='Ship', duration_in_min=195,
+                                            release_year=1997)
+        self.departed = Movie.objects.create(name='The Departed', description='Cop', duration_in_min=151,
+                                             release_year=2006)
+        self.actor = Actor.objects.create(name='Leonardo DiCaprio', birth_year=1974)
+        self.director = Directors.objects.create(name='Martin Scorsese', birth_year=1942)
+        # the movie with the lower id has fewer nominations
+        for nomination in ('BEST PICTURE', 'DIRECTING', 'FILM EDITING'):
+            Oscars.objects.create(nomination=nomination, ceremony_year=2007, movie=self.departed,
+                                  director=self.director)
+        Oscars.objects.create(nomination='best picture', ceremony_year=1998, movie=self.titanic)
+        Oscars.objects.create(nomination='ACTOR IN A LEADING ROLE', ceremony_year=1998, movie=self.titanic,
+                              actor=self.actor)
+
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(ctx.captured_queries)
+
+    def test_movies_leaderboard_is_one_query(self):
+        data, queries = self.get('/api/imdb/oscars/leaderboard/movies/')
+        self.assertEqual(data, [
+            {'id': self.departed.id, 'name': 'The Departed', 'nominations': 3},
+            {'id': self.titanic.id, 'name': 'Titanic', 'nominations': 2},
+        ])
+        self.assertEqual(queries, 1)
+
+        _, queries = self.get('/api/imdb/oscars/leaderboard/movies/')
+        self.assertEqual(queries, 0)
+
+    def test_filters_and_limit(self):
+        data, _ = self.get('/api/imdb/oscars/leaderboard/movies/', {'to_year': 2000})
+        self.assertEqual([row['name'] for row in data], ['Titanic'])
+        # ties are broken by id
+        data, _ = self.get('/api/imdb/oscars/leaderboard/movies/', {'nomination': 'Best Picture', 'limit': 1})
+        self.assertEqual(data, [{'id': self.titanic.id, 'name': 'Titanic', 'nominations': 1}])
+
+    def test_actors_and_directors(self):
+        data, _ = self.get('/api/imdb/oscars/leaderboard/actors/')
+        self.assertEqual(data, [{'id': self.actor.id, 'name': 'Leonardo DiCaprio', 'nominations': 1}])
+        data, _ = self.get('/api/imdb/oscars/leaderboard/directors/')
+        self.assertEqual(data, [{'id': self.director.id, 'name': 'Martin Scorsese', 'nominations': 3}])
+
+    def test_most_oscars_and_total(self):
+        data, _ = self.get('/api/imdb/oscars/movie_with_most_oscars')
+        self.assertEqual(data['name'], 'The Departed')
+        data, _ = self.get('/api/imdb/oscars/actor_with_most_oscars/')
+        self.assertEqual(data['name'], 'Leonardo DiCaprio')
+        data, _ = self.get('/api/imdb/oscars/total_oscars/', {'from_year': 2000})
+        self.assertEqual(data, {'total': 3})
+
+    def test_new_oscars_invalidate_the_leaderboard(self):
+        self.get('/api/imdb/oscars/leaderboard/movies/')
+        for nomination in ('SOUND', 'MUSIC'):
+            Oscars.objects.create(nomination=nomination, ceremony_year=1998, movie=self.titanic)
+        data, _ = self.get('/api/imdb/oscars/leaderboard/movies/')
+        self.assertEqual(data[0], {'id': self.titanic.id, 'name': 'Titanic', 'nominations': 4})
+
+
+class BenchmarkTestCase(TestCase):
+
+    def test_generate_run_and_compare(self):
+        generate_catalogue(movies=30, actors=20, directors=5, cast_per_movie=3, ratings_per_movie=2, oscars=20,
+                           chunk_size=7)
+        self.assertEqual(Movie.objects.count(), 30)
+        self.assertEqual(MovieActor.objects.count(), 90)
+        self.assertEqual(RatingSummary.objects.aggregate(n=Sum('count'))['n'], Rating.objects.count())
+
+        report = run_benchmark(iterations=3, only=['oscars', 'ratings avg', 'movie create', 'login'], cold_cache=True)
+        scenarios = report['scenarios']
+        self.assertIn('oscars list', scenarios)
+        self.assertEqual(scenarios['movie ratings avg']['statuses'], [200])
+        self.assertEqual(scenarios['movie create']['statuses'], [201])
+        self.assertEqual(scenarios['login']['statuses'], [200])
+        # writes are rolled back and the staff user of the run deleted
+        self.assertEqual(Movie.objects.count(), 30)
+        self.assertFalse(User.objects.exists())
+
+        self.assertEqual(find_regressions(report, report, threshold=0.2), [])
+        baseline = json.loads(json.dumps(report))
+        baseline['scenarios']['oscars list']['p95_ms'] = 0.0001
+        baseline['scenarios']['oscars list']['queries_per_request'] = 0
+        self.assertEqual(len(find_regressions(report, baseline, threshold=0.2)), 2)
+
+
+class QueryInstrumentationTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        get_response_cache().clear()
+        registry.reset()
+        Movie.objects.create(name='Heat', description='Cops and robbers', duration_in_min=170, release_year=1995)
+
+    @override_settings(DEBUG=True)
+    def test_debug_headers_and_log_line(self):
+        with self.assertLogs('imdb_app.requests', 'INFO') as logs, CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/imdb/movies/')
+        self.assertEqual(int(response['X-DB-Queries']), len(ctx.captured_queries))
+        self.assertEqual(int(response['X-Response-Size']), len(response.content))
+        self.assertGreater(float(response['X-Serializer-Time-ms']), 0)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'movie-list')
+        self.assertEqual(line['status'], 200)
+        self.assertEqual(line['queries'], len(ctx.captured_queries))
+
+    @override_settings(DEBUG=True)
+    async def test_queries_recorded_under_asgi(self):
+        # the sync view runs in a sync_to_async thread, whose connections are not the middleware's
+        response = await self.async_client.get('/api/imdb/movies/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(response['X-DB-Queries']), 0)
+
+    @override_settings(DEBUG=False)
+    def test_no_headers_without_debug(self):
+        response = self.client.get('/api/imdb/movies/')
+        self.assertNotIn('X-DB-Queries', response)
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/imdb/movies/')
+        self.client.get('/api/imdb/movies/')
+        self.assertIn(self.client.get('/metrics').status_code, (401, 403))
+        with override_settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('imdb_requests_total{view="movie-list",method="GET",status="200"} 2', body)
+        self.assertIn('imdb_request_duration_seconds_count{view="movie-list"} 2', body)
+        self.assertIn('# TYPE imdb_db_queries_total counter', body)
+
+    def test_large_counters_are_exact(self):
+        registry.observe('big', 'GET', 200, 0.01, 1234567, 0, 0.1, 0.0, 2 ** 40 + 1)
+        registry.observe('big', 'GET', 200, 0.01, 1, 0, 0.2, 0.0, 1)
+        body = registry.render()
+        self.assertIn('imdb_db_queries_total{view="big"} 1234568\n', body)
+        self.assertIn(f'imdb_response_bytes_total{{view="big"}} {2 ** 40 + 2}\n', body)
+        self.assertIn(f'imdb_db_time_seconds_total{{view="big"}} {0.1 + 0.2!r}\n', body)
+
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint('SELECT * FROM movies WHERE id = 3'),
+                         fingerprint('SELECT * FROM movies WHERE id = 42'))
+        self.assertEqual(fingerprint("SELECT * FROM movies WHERE name = 'Heat'"),
+                         'SELECT * FROM movies WHERE name = ?')
+        self.assertEqual(fingerprint('SELECT * FROM actors WHERE id IN (%s, %s, %s)'),
+                         'SELECT * FROM actors WHERE id IN (...)')
+
+
+class AsyncViewsTestCase(TestCase):
+
+    def setUp(self):
+        get_response_cache().clear()
+        self.movie = Movie.objects.create(name='Alien', description='In space no one can hear you scream',
+                                          duration_in_min=117, release_year=1979)
+        for i in range(4):
+            Movie.objects.create(name=f'Alien {i + 2}', description='More aliens', duration_in_min=100,
+                                 release_year=1986 + i)
+        actor = Actor.objects.create(name='Sigourney Weaver', birth_year=1949)
+        MovieActor.objects.create(movie=self.movie, actor=actor, salary=1000, main_role=True)
+        Rating.objects.create(movie=self.movie, rating=8)
+        Rating.objects.create(movie=self.movie, rating=9)
+        Oscars.objects.create(nomination='VISUAL EFFECTS', ceremony_year=1980, movie=self.movie)
+
+    async def assert_same_response(self, sync_url, async_url):
+        sync_response = await self.async_client.get(sync_url)
+        async_response = await self.async_client.get(async_url)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        # the next / previous links point to the async endpoint
+        self.assertEqual(json.loads(async_response.content.replace(b'/async/', b'/')),
+                         json.loads(sync_response.content))
+
+    async def test_same_responses_as_sync_views(self):
+        movie_id = self.movie.id
+        for sync_url, async_url in [
+            ('/api/imdb/movies/', '/api/imdb/async/movies/'),
+            ('/api/imdb/movies/?page=2&release_year=1987', '/api/imdb/async/movies/?page=2&release_year=1987'),
+            ('/api/imdb/movies/?page=2', '/api/imdb/async/movies/?page=2'),
+            ('/api/imdb/movies/?page=9', '/api/imdb/async/movies/?page=9'),
+            (f'/api/imdb/movies/{movie_id}/', f'/api/imdb/async/movies/{movie_id}/'),
+            ('/api/imdb/movies/999/', '/api/imdb/async/movies/999/'),
+            (f'/api/imdb/movies/{movie_id}/cast', f'/api/imdb/async/movies/{movie_id}/cast'),
+            (f'/api/imdb/movies/{movie_id}/ratings', f'/api/imdb/async/movies/{movie_id}/ratings'),
+            (f'/api/imdb/movies/{movie_id}/ratings/avg', f'/api/imdb/async/movies/{movie_id}/ratings/avg'),
+            ('/api/imdb/oscars/', '/api/imdb/async/oscars/'),
+            ('/api/imdb/oscars/?from_year=1990', '/api/imdb/async/oscars/?from_year=1990'),
+        ]:
+            with self.subTest(url=sync_url):
+                await self.assert_same_response(sync_url, async_url)
+
+    async def test_movie_with_cast_and_rating(self):
+        response = await self.async_client.get(f'/api/imdb/async/movies/{self.movie.id}/?include=cast,rating')
+        data = json.loads(response.content)
+        self.assertEqual(data['name'], 'Alien')
+        self.assertEqual(data['cast'][0]['actor']['name'], 'Sigourney Weaver')
+        self.assertEqual(data['rating'], {'count': 2, 'avg': 8.5, 'min': 8, 'max': 9})
+
+    async def test_invalid_filter(self):
+        response = await self.async_client.get('/api/imdb/async/oscars/?actor=999')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('actor', json.loads(response.content))
+
+
+class LoadTestTestCase(TestCase):
+
+    def test_load_test_keep_alive_server(self):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                body = b'{"ok": true}'
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            result = asyncio.run(load_test(f'http://127.0.0.1:{server.server_port}/ping', connections=5,
+                                           requests=23))
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(result['requests'], 23)
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(result['statuses'], [200])
+
+    def test_load_test_cache_buster(self):
+        paths = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                paths.append(self.path)
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            result = asyncio.run(load_test(f'http://127.0.0.1:{server.server_port}/movies/?page=2', connections=3,
+                                           requests=10, cache_buster='nocache'))
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(result['requests'], 10)
+        self.assertEqual(sorted(paths), sorted(f'/movies/?page=2&nocache={n}' for n in range(10)))
+
+
+class MoviePageTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        get_response_cache().clear()
+        self.movie = Movie.objects.create(name='Fargo', description='A pregnant police chief', duration_in_min=98,
+                                          release_year=1996)
+        self.director = Directors.objects.create(name='Joel Coen', birth_year=1954)
+        Rating.objects.create(movie=self.movie, rating=7)
+        Rating.objects.create(movie=self.movie, rating=9)
+
+    def add_cast_and_oscars(self, n):
+        for i in range(n):
+            actor = Actor.objects.create(name=f'Actor {i}', birth_year=1950 + i)
+            MovieActor.objects.create(movie=self.movie, actor=actor, salary=100 * i, main_role=i == 0)
+            Oscars.objects.create(nomination='ACTRESS IN A LEADING ROLE', ceremony_year=1997, movie=self.movie,
+                                  actor=actor)
+        Oscars.objects.create(nomination='DIRECTING', ceremony_year=1997, movie=self.movie, director=self.director)
+
+    def get_page(self, query=''):
+        get_response_cache().clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/imdb/movies/{self.movie.id}/page/{query}')
+        return response, len(ctx.captured_queries)
+
+    def test_everything_in_a_fixed_number_of_queries(self):
+        self.add_cast_and_oscars(1)
+        response, few_queries = self.get_page()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Fargo')
+        self.assertEqual(response.data['cast'][0]['actor']['name'], 'Actor 0')
+        self.assertEqual(response.data['rating'], {'count': 2, 'avg': 8.0, 'min': 7, 'max': 9})
+        self.assertEqual([oscar['nomination'] for oscar in response.data['oscars']],
+                         ['ACTRESS IN A LEADING ROLE', 'DIRECTING'])
+        self.assertEqual(response.data['oscars'][1]['director_name'], 'Joel Coen')
+        self.assertNotIn('actor_name', response.data['oscars'][1])
+
+        self.add_cast_and_oscars(5)
+        response, many_queries = self.get_page()
+        self.assertEqual(len(response.data['cast']), 6)
+        self.assertEqual(few_queries, many_queries)
+        # the cast matches the cast endpoint
+        self.assertEqual(response.data['cast'], self.client.get(f'/api/imdb/movies/{self.movie.id}/cast').data)
+
+    def test_include_and_sparse_fields(self):
+        self.add_cast_and_oscars(2)
+        response, queries = self.get_page('?include=cast&fields=name&fields[actor]=name'
+                                          '&fields[cast]=actor,main_role')
+        self.assertEqual(response.data, {
+            'name': 'Fargo',
+            'cast': [{'actor': {'name': 'Actor 0'}, 'main_role': True},
+                     {'actor': {'name': 'Actor 1'}, 'main_role': False}],
+        })
+        self.assertEqual(queries, 2)
+
+        response, queries = self.get_page('?include=rating&fields[rating]=avg&fields=id')
+        self.assertEqual(response.data, {'id': self.movie.id, 'rating': {'avg': 8.0}})
+        self.assertEqual(queries, 1)
+
+    def test_invalid_parameters(self):
+        response, _ = self.get_page('?include=trivia')
+        self.assertEqual(response.status_code, 400)
+        response, _ = self.get_page('?fields=budget')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.data)
+        response = self.client.get('/api/imdb/movies/999/page/')
+        self.assertEqual(response.status_code, 404)
+
+
+class SparseFieldsetTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        get_response_cache().clear()
+        self.director = Directors.objects.create(name='Ridley Scott', birth_year=1937)
+        self.movies = [Movie.objects.create(name=f'Blade Runner {i}', description='Replicants', duration_in_min=117,
+                                            release_year=1982 + i, pic_url='http://example.com/poster.jpg')
+                       for i in range(3)]
+        for i, movie in enumerate(self.movies):
+            for j in range(i + 1):
+                actor = Actor.objects.create(name=f'Actor {i}-{j}', birth_year=1950)
+                MovieActor.objects.create(movie=movie, actor=actor, salary=100, main_role=j == 0)
+            Oscars.objects.create(nomination='DIRECTING', ceremony_year=1983 + i, movie=movie, director=self.director)
+
+    def get(self, url):
+        get_response_cache().clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return response, [query['sql'] for query in ctx.captured_queries]
+
+    def test_fields_narrow_the_projection(self):
+        response, queries = self.get('/api/imdb/movies/?fields=id,name')
+        self.assertEqual(response.data['results'][0], {'id': self.movies[0].id, 'name': 'Blade Runner 0'})
+        self.assertNotIn('pic_url', queries[-1])
+
+        response, queries = self.get('/api/imdb/oscars/?fields=nomination,ceremony_year')
+        self.assertEqual(response.data['results'][0], {'nomination': 'DIRECTING', 'ceremony_year': 1983})
+        self.assertNotIn('JOIN', queries[-1])
+
+        response, _ = self.get(f'/api/imdb/movies/{self.movies[0].id}/?fields=description')
+        self.assertEqual(response.data, {'description': 'Replicants'})
+
+    def test_expand(self):
+        response, queries = self.get('/api/imdb/movies/?expand=cast&fields=name')
+        self.assertEqual([len(movie['cast']) for movie in response.data['results']], [1, 2, 3])
+        self.assertEqual(response.data['results'][2]['cast'][2]['actor']['name'], 'Actor 2-2')
+        # count, page, cast with actors
+        self.assertEqual(len(queries), 3)
+
+        response, queries = self.get('/api/imdb/oscars/?expand=director,movie&fields=id,director,movie')
+        self.assertEqual(response.data['results'][0]['director'], {'id': self.director.id, 'name': 'Ridley Scott',
+                                                                   'birth_year': 1937})
+        self.assertEqual(response.data['results'][0]['movie']['name'], 'Blade Runner 0')
+        self.assertEqual(len(queries), 2)
+
+        actor = Actor.objects.get(name='Actor 2-0')
+        response, _ = self.get(f'/api/imdb/actors/{actor.id}/?expand=movies&fields=name')
+        self.assertEqual(response.data['name'], 'Actor 2-0')
+        self.assertEqual([movie['name'] for movie in response.data['movies']], ['Blade Runner 2'])
+
+    def test_cast_in_a_fixed_number_of_queries(self):
+        _, small_cast = self.get(f'/api/imdb/movies/{self.movies[0].id}/cast')
+        response, big_cast = self.get(f'/api/imdb/movies/{self.movies[2].id}/cast')
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(len(small_cast), len(big_cast))
+
+    def test_unknown_names(self):
+        response, _ = self.get('/api/imdb/movies/?fields=budget')
+        self.assertEqual(response.status_code, 400)
+        response, _ = self.get('/api/imdb/directors/?expand=movies')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('expand', response.data)
+
+    def test_expanded_responses_follow_related_writes(self):
+        self.get('/api/imdb/movies/?expand=cast')
+        MovieActor.objects.filter(movie=self.movies[0]).delete()
+        response = self.client.get('/api/imdb/movies/?expand=cast')
+        self.assertEqual(response.data['results'][0]['cast'], [])
+
+
+class RatingQueryTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.up = Movie.objects.create(name='Up', description='Balloons', duration_in_min=96, release_year=2009)
+        self.wall_e = Movie.objects.create(name='Wall-E', description='Robots', duration_in_min=98,
+                                           release_year=2008)
+        for movie, rating, day in ((self.up, 8, 1), (self.up, 3, 2), (self.wall_e, 9, 2), (self.up, 10, 3),
+                                   (self.wall_e, 5, 4)):
+            Rating.objects.create(movie=movie, rating=rating, rating_date=datetime.date(2020, 1, day))
+
+    def ratings(self, query=''):
+        response = self.client.get(f'/api/imdb/ratings?page_size=100{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(rating['rating'], rating['rating_date']) for rating in response.json()['results']]
+
+    def test_filters_are_query_parameters(self):
+        self.assertEqual(self.ratings('&from_date=2020-01-02&to_date=2020-01-03'),
+                         [(3, '2020-01-02'), (9, '2020-01-02'), (10, '2020-01-03')])
+        self.assertEqual(self.ratings(f'&movie={self.wall_e.id}'), [(9, '2020-01-02'), (5, '2020-01-04')])
+        self.assertEqual(self.ratings('&min_rating=5&max_rating=9'),
+                         [(8, '2020-01-01'), (9, '2020-01-02'), (5, '2020-01-04')])
+        self.assertEqual(self.ratings('&from_date=2020-01-03'), [(10, '2020-01-03'), (5, '2020-01-04')])
+
+    def test_ordering(self):
+        self.assertEqual([rating for rating, _ in self.ratings('&ordering=-rating')], [10, 9, 8, 5, 3])
+        # ties on the date keep the id order
+        self.assertEqual(self.ratings('&ordering=-rating_date&max_rating=9'),
+                         [(5, '2020-01-04'), (3, '2020-01-02'), (9, '2020-01-02'), (8, '2020-01-01')])
+
+    def test_pages(self):
+        response = self.client.get('/api/imdb/ratings?ordering=rating')
+        self.assertEqual(response.json()['count'], 5)
+        self.assertEqual([rating['rating'] for rating in response.json()['results']], [3, 5, 8])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([rating['rating'] for rating in response.json()['results']], [9, 10])
+        self.assertIsNone(response.json()['next'])
+
+    def test_one_query_per_page_and_the_count(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/imdb/ratings?from_date=2020-01-02')
+        self.assertEqual(len(ctx.captured_queries), 2)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get('/api/imdb/ratings?from_date=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/imdb/ratings?ordering=movie__name').status_code, 400)
+        response = self.client.get('/api/imdb/ratings?pagination=cursor&ordering=-rating')
+        self.assertEqual(response.status_code, 400)
+
+
+class RatingTrendsTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.up = Movie.objects.create(name='Up', description='Balloons', duration_in_min=96, release_year=2009)
+        self.wall_e = Movie.objects.create(name='Wall-E', description='Robots', duration_in_min=98,
+                                           release_year=2008)
+        # 2020-01-06 is a monday
+        for movie, rating, day in ((self.up, 8, '2020-01-06'), (self.up, 4, '2020-01-06'), (self.up, 6, '2020-01-08'),
+                                   (self.up, 10, '2020-01-13'), (self.up, 9, '2020-02-03'),
+                                   (self.wall_e, 7, '2020-01-07')):
+            Rating.objects.create(movie=movie, rating=rating, rating_date=datetime.date.fromisoformat(day))
+
+    def trends(self, query):
+        response = self.client.get(f'/api/imdb/ratings/trends?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return {movie['name']: [(str(bucket['period']), bucket['count'], bucket['avg']) for bucket in movie['trend']]
+                for movie in response.data['movies']}
+
+    def test_buckets(self):
+        self.assertEqual(self.trends(f'movie={self.up.id}&interval=week'),
+                         {'Up': [('2020-01-06', 3, 6.0), ('2020-01-13', 1, 10.0), ('2020-02-03', 1, 9.0)]})
+        self.assertEqual(self.trends(f'movie={self.up.id}&interval=month'),
+                         {'Up': [('2020-01-01', 4, 7.0), ('2020-02-01', 1, 9.0)]})
+        self.assertEqual(self.trends(f'movie={self.up.id}&interval=day&from_date=2020-01-07&to_date=2020-01-31'),
+                         {'Up': [('2020-01-08', 1, 6.0), ('2020-01-13', 1, 10.0)]})
+
+    def test_top_movies(self):
+        self.assertEqual(list(self.trends('top=2&interval=month')), ['Up', 'Wall-E'])
+        self.assertEqual(list(self.trends('top=1&from_date=2020-01-07&to_date=2020-01-07')), ['Wall-E'])
+
+    def test_read_from_the_rollup(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.trends('top=5')
+        self.assertFalse([query for query in ctx.captured_queries if '"ratings"' in query['sql']])
+
+    def test_rollup_follows_writes(self):
+        rating = Rating.objects.get(movie=self.wall_e)
+        rating.rating_date = datetime.date(2020, 3, 1)
+        rating.save()
+        Rating.objects.filter(movie=self.up, rating=10).get().delete()
+        body = '\n'.join(json.dumps({'movie_id': self.up.id, 'rating': r, 'date': '2020-01-06'}) for r in (1, 2))
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        self.client.post('/api/imdb/ratings/bulk', body, content_type='application/x-ndjson')
+
+        self.assertEqual(stale_rating_days(), [])
+        self.assertFalse(RatingDay.objects.filter(day='2020-01-13').exists())
+        self.assertEqual(RatingDay.objects.get(movie=self.up, day='2020-01-06').count, 4)
+
+    def test_rebuild_after_writes_that_skip_the_rollup(self):
+        Rating.objects.filter(movie=self.up, rating_date__gte='2020-01-13').update(rating=1)
+        self.assertEqual(len(stale_rating_days()), 2)
+        self.assertEqual(rebuild_rating_days(since=datetime.date(2020, 1, 13)), 2)
+        self.assertEqual(stale_rating_days(), [])
+
+    def test_rollup_and_raw_ratings_agree(self):
+        results = compare_trend_sources(repeat=1)
+        self.assertTrue(results)
+        self.assertTrue(all(result['identical'] for result in results.values()))
+
+    def test_bad_parameters(self):
+        for query in ('', 'movie=1&interval=year', 'top=x', f'movie={self.up.id}&from_date=2020-13-01'):
+            self.assertEqual(self.client.get(f'/api/imdb/ratings/trends?{query}').status_code, 400, query)
+
+
+@override_settings(RANKING_MIN_VOTES=2, TRENDING_HALF_LIFE_DAYS=7)
+class MovieRankingTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.today = datetime.date.today()
+        self.movies = {name: Movie.objects.create(name=name, description=name, duration_in_min=100,
+                                                  release_year=2000) for name in ('Classic', 'Hit', 'Fluke')}
+        # Classic: many good ratings long ago, Hit: fewer and worse but recent, Fluke: one 10
+        self.rate('Classic', [9] * 6, days_ago=400)
+        self.rate('Hit', [5, 6, 6], days_ago=1)
+        self.rate('Fluke', [10], days_ago=30)
+
+    def rate(self, name, ratings, days_ago):
+        for rating in ratings:
+            Rating.objects.create(movie=self.movies[name], rating=rating,
+                                  rating_date=self.today - datetime.timedelta(days=days_ago))
+
+    def names(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [movie['name'] for movie in response.data]
+
+    def test_top_weights_by_the_number_of_ratings(self):
+        refresh_movie_scores()
+        self.assertEqual(self.names('/api/imdb/movies/top'), ['Classic', 'Fluke', 'Hit'])
+        # the mean of the 10 ratings is 8.1: (54 + 2 * 8.1) / (6 + 2)
+        self.assertAlmostEqual(self.client.get('/api/imdb/movies/top').data[0]['score'], 8.775)
+
+    def test_trending_favours_recent_ratings(self):
+        refresh_movie_scores()
+        self.assertEqual(self.names('/api/imdb/movies/trending?limit=2'), ['Hit', 'Fluke'])
+        hit = self.client.get('/api/imdb/movies/trending').data[0]
+        self.assertAlmostEqual(hit['score'], 3 * 0.5 ** (1 / 7))
+
+    def test_incremental_refresh_only_recomputes_rated_movies(self):
+        first = refresh_movie_scores()
+        self.assertTrue(first.full)
+        fluke_score = MovieScore.objects.get(movie=self.movies['Fluke'])
+        self.rate('Fluke', [10] * 10, days_ago=0)
+        run = refresh_movie_scores()
+        self.assertFalse(run.full)
+        self.assertEqual(run.movies, 1)
+        self.assertEqual(self.names('/api/imdb/movies/trending?limit=1'), ['Fluke'])
+        self.assertEqual(self.names('/api/imdb/movies/top?limit=1'), ['Fluke'])
+        self.assertNotEqual(MovieScore.objects.get(movie=self.movies['Fluke']).ratings, fluke_score.ratings)
+        # the other scores were kept as they were, but with the new mean: (54 + 2 * 9.05) / (6 + 2)
+        self.assertAlmostEqual(MovieScore.objects.get(movie=self.movies['Classic']).bayesian, 9.0125)
+        self.assertEqual(refresh_movie_scores().movies, 0)
+        self.assertEqual(MovieScore.objects.count(), 3)
+
+        # edited and deleted ratings too, whatever their id
+        rating = Rating.objects.filter(movie=self.movies['Classic']).first()
+        rating.rating = 1
+        rating.save()
+        Rating.objects.filter(movie=self.movies['Hit']).first().delete()
+        run = refresh_movie_scores()
+        self.assertEqual(run.movies, 2)
+        self.assertEqual(MovieScore.objects.get(movie=self.movies['Hit']).ratings, 2)
+
+    def test_settings_change_forces_a_full_refresh(self):
+        refresh_movie_scores()
+        with override_settings(RANKING_MIN_VOTES=100):
+            self.assertTrue(refresh_movie_scores().full)
+
+    def test_one_query(self):
+        refresh_movie_scores()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/imdb/movies/top?limit=2')
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn('LIMIT 2', ctx.captured_queries[0]['sql'])
+
+    def test_bad_limit(self):
+        self.assertEqual(self.client.get('/api/imdb/movies/top?limit=ten').status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AuthenticationTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.staff = User.objects.create_user('staff', password='secret-1', is_staff=True)
+        self.user = User.objects.create_user('user', password='secret-2')
+        self.movie = Movie.objects.create(name='Up', description='Balloons', duration_in_min=96, release_year=2009)
+
+    def login(self, username, password):
+        response = self.client.post('/api/imdb/auth/login', {'username': username, 'password': password})
+        return response.data
+
+    def user_queries(self, method, url, data=None, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, format='json', **headers)
+        return response, [query['sql'] for query in ctx.captured_queries if '"auth_user"' in query['sql']]
+
+    def test_recent_tokens_skip_the_user_lookup(self):
+        access = self.login('staff', 'secret-1')['access']
+        response, queries = self.user_queries('patch', f'/api/imdb/movies/{self.movie.id}/', {'duration_in_min': 100},
+                                              HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+        access = self.login('user', 'secret-2')['access']
+        response, _ = self.user_queries('post', '/api/imdb/movies/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 403)
+
+    def test_old_tokens_load_the_user(self):
+        access = self.login('staff', 'secret-1')['access']
+        with override_settings(STATELESS_JWT_MAX_AGE=datetime.timedelta(0)):
+            response, queries = self.user_queries('get', '/api/imdb/auth/me', HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.data['username'], 'staff')
+
+    def test_me_with_a_stateless_token(self):
+        access = self.login('user', 'secret-2')['access']
+        response = self.client.get('/api/imdb/auth/me', HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.data['username'], 'user')
+
+    def test_refresh_takes_the_current_is_staff(self):
+        refresh = self.login('staff', 'secret-1')['refresh']
+        self.staff.is_staff = False
+        self.staff.save()
+        access = self.client.post('/api/imdb/auth/refresh', {'refresh': refresh}).data['access']
+        response = self.client.patch(f'/api/imdb/movies/{self.movie.id}/', {'duration_in_min': 100},
+                                     HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 403)
+
+    def basic(self, username, password):
+        return 'Basic ' + base64.b64encode(f'{username}:{password}'.encode()).decode()
+
+    def test_basic_credentials_are_verified_once(self):
+        header = self.basic('staff', 'secret-1')
+        response, queries = self.user_queries('get', '/api/imdb/auth/me', HTTP_AUTHORIZATION=header)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        response, queries = self.user_queries('get', '/api/imdb/auth/me', HTTP_AUTHORIZATION=header)
+        self.assertEqual(response.data['username'], 'staff')
+        self.assertEqual(queries, [])
+
+    def test_basic_cache_forgets_changed_users(self):
+        header = self.basic('staff', 'secret-1')
+        self.client.get('/api/imdb/auth/me', HTTP_AUTHORIZATION=header)
+        self.staff.set_password('secret-3')
+        self.staff.save()
+        self.assertEqual(self.client.get('/api/imdb/auth/me', HTTP_AUTHORIZATION=header).status_code, 401)
+
+    def test_failed_basic_attempts_are_not_cached(self):
+        wrong = self.basic('staff', 'wrong')
+        for _ in range(2):
+            response, queries = self.user_queries('get', '/api/imdb/auth/me', HTTP_AUTHORIZATION=wrong)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(len(queries), 1)
+
+    @override_settings(BASIC_AUTH_CACHE={'MAX_ENTRIES': 1, 'TIMEOUT': 60})
+    def test_basic_cache_is_bounded(self):
+        self.client.get('/api/imdb/auth/me', HTTP_AUTHORIZATION=self.basic('staff', 'secret-1'))
+        self.client.get('/api/imdb/auth/me', HTTP_AUTHORIZATION=self.basic('user', 'secret-2'))
+        _, queries = self.user_queries('get', '/api/imdb/auth/me', HTTP_AUTHORIZATION=self.basic('staff', 'secret-1'))
+        self.assertEqual(len(queries), 1)
+
+    def test_benchmark(self):
+        users = User.objects.count()
+        results = auth_overhead(iterations=2)
+        # its user is deleted afterwards
+        self.assertEqual(User.objects.count(), users)
+        self.assertEqual(list(results), ['anonymous', 'basic', 'basic, cached', 'jwt', 'jwt, stateless'])
+        self.assertTrue(all(result['statuses'] == [200] for result in results.values()))
+        self.assertEqual(results['jwt, stateless']['queries_per_request'], results['anonymous']['queries_per_request'])
+
+
+class FastSerializationTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.movie = Movie.objects.create(name='Amélie "Le Fabuleux Destin"\u2028', description='Paris',
+                                          duration_in_min=122.5, release_year=2001, pic_url=None)
+        Actor.objects.create(name='Audrey Tautou \u2029 \\ 日本', birth_year=1976)
+        Actor.objects.create(name='Nobody', birth_year=None)
+        for rating in (3, 10):
+            Rating.objects.create(movie=self.movie, rating=rating, rating_date=datetime.date(2001, 4, 25))
+
+    def test_same_bytes_as_the_serializers(self):
+        fast = self.client.get('/api/imdb/ratings').content
+        with override_settings(FAST_SERIALIZATION=False):
+            slow = self.client.get('/api/imdb/ratings').content
+        self.assertEqual(fast, slow)
+        self.assertEqual(json.loads(fast)['results'], [{'rating': 3, 'rating_date': '2001-04-25'},
+                                                       {'rating': 10, 'rating_date': '2001-04-25'}])
+
+        fast = self.client.get(f'/api/imdb/movies/{self.movie.id}/ratings').content
+        with override_settings(FAST_SERIALIZATION=False):
+            slow = self.client.get(f'/api/imdb/movies/{self.movie.id}/ratings').content
+        self.assertEqual(fast, slow)
+
+        results = serializer_cpu_per_row(repeat=1)
+        self.assertEqual(set(results), {'ratings', 'actors', 'movies'})
+        self.assertTrue(all(result['identical'] for result in results.values()))
+
+    def test_indented_responses_use_the_serializers(self):
+        response = self.client.get('/api/imdb/ratings', HTTP_ACCEPT='application/json; indent=2')
+        self.assertIn(b'\n    {', response.content)
+
+    def test_fields_the_encoders_dont_know_fall_back(self):
+        self.assertIsNone(compile_serializer(ListOscarsSerializer))
+        self.assertEqual(compile_serializer(RatingSerializer).columns, ['rating', 'rating_date'])
+
+
+class ExportTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        self.movie = Movie.objects.create(name='Up', description='Balloons', duration_in_min=96, release_year=2009)
+        self.other = Movie.objects.create(name='Wall-E', description='Robots', duration_in_min=98,
+                                          release_year=2008)
+        self.actor = Actor.objects.create(name='Ed Asner', birth_year=1929)
+        MovieActor.objects.create(movie=self.movie, actor=self.actor, salary=500, main_role=True)
+        Oscars.objects.create(nomination='MUSIC', ceremony_year=2010, movie=self.movie)
+
+    def add_ratings(self, n):
+        Rating.objects.bulk_create(Rating(movie=self.movie, rating=i % 10 + 1,
+                                          rating_date=datetime.date(2020, 1, 1) + datetime.timedelta(days=i % 365))
+                                   for i in range(n))
+
+    def stream(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ratings_ndjson_with_filters(self):
+        self.add_ratings(40)
+        Rating.objects.create(movie=self.other, rating=5, rating_date=datetime.date(2020, 1, 5))
+        lines = self.stream(f'/api/imdb/ratings/export?movie={self.movie.id}&from_date=2020-01-05'
+                            f'&to_date=2020-01-10&chunk_size=4').splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(set(rows[0]), {'id', 'movie_id', 'rating', 'rating_date'})
+        self.assertTrue(all(row['movie_id'] == self.movie.id for row in rows))
+        self.assertEqual(rows[0]['rating_date'], '2020-01-05')
+
+    def test_csv_and_movies_with_cast(self):
+        content = self.stream('/api/imdb/movies/export?output=csv')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'id,name,description,duration_in_min,release_year,pic_url,actor,actor_name,'
+                                   'salary,main_role')
+        self.assertEqual(lines[1], f'{self.movie.id},Up,Balloons,96.0,2009,,{self.actor.id},Ed Asner,500,True')
+        self.assertEqual(lines[2], f'{self.other.id},Wall-E,Robots,98.0,2008,,,,,')
+
+        movies = [json.loads(line) for line in self.stream('/api/imdb/movies/export?from_year=2009').splitlines()]
+        self.assertEqual(len(movies), 1)
+        self.assertEqual(movies[0]['cast'], [{'actor': self.actor.id, 'actor_name': 'Ed Asner', 'salary': 500,
+                                              'main_role': True}])
+
+        oscars = [json.loads(line) for line in self.stream('/api/imdb/oscars/export').splitlines()]
+        self.assertEqual(oscars[0]['movie_name'], 'Up')
+
+    def test_bad_parameters_and_permissions(self):
+        self.assertEqual(self.client.get('/api/imdb/ratings/export?from_date=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/imdb/ratings/export?output=xml').status_code, 400)
+        self.assertEqual(APIClient().get('/api/imdb/ratings/export').status_code, 401)
+
+    def peak_memory(self, url):
+        # peak of the Python allocations while the whole export is consumed
+        response = self.client.get(url)
+        tracemalloc.start()
+        try:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+            return tracemalloc.get_traced_memory()[1], size
+        finally:
+            tracemalloc.stop()
+
+    def test_memory_does_not_grow_with_the_table(self):
+        self.add_ratings(2000)
+        small_peak, small_size = self.peak_memory('/api/imdb/ratings/export?chunk_size=500')
+        self.add_ratings(18000)
+        big_peak, big_size = self.peak_memory('/api/imdb/ratings/export?chunk_size=500')
+        self.assertGreater(big_size, small_size * 9)
+        self.assertLess(big_peak, small_peak * 1.5)
+
+
+class FilmographyTestCase(TestCase):
+
+    def setUp(self):
+        get_response_cache().clear()
+        self.client = APIClient()
+        self.actor = Actor.objects.create(name='Frances McDormand', birth_year=1957)
+        self.director = Directors.objects.create(name='Joel Coen', birth_year=1954)
+
+    def add_movies(self, count, first_year=1980):
+        movies = Movie.objects.bulk_create([Movie(name=f'Movie {i}', description='d', duration_in_min=100,
+                                                  release_year=first_year + i) for i in range(count)])
+        MovieActor.objects.bulk_create([MovieActor(actor=self.actor, movie=movie, salary=1000 * (i + 1),
+                                                   main_role=i % 2 == 0) for i, movie in enumerate(movies)])
+        MovieDirector.objects.bulk_create([MovieDirector(director=self.director, movie=movie) for movie in movies])
+        return movies
+
+    def test_actor_movies(self):
+        older, newer = self.add_movies(2)
+        Rating.objects.create(movie=older, rating=8)
+        Rating.objects.create(movie=older, rating=6)
+        Oscars.objects.create(nomination='ACTRESS IN A LEADING ROLE', ceremony_year=1981, movie=older,
+                              actor=self.actor)
+        Oscars.objects.create(nomination='BEST PICTURE', ceremony_year=1981, movie=older)
+
+        response = self.client.get(f'/api/imdb/actors/{self.actor.id}/movies/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        first, second = response.data['results']
+        self.assertEqual(first['movie']['name'], newer.name)
+        self.assertEqual(first['rating'], {'count': 0, 'avg': None})
+        self.assertEqual(first['oscars'], [])
+        self.assertEqual((second['main_role'], second['salary']), (True, 1000))
+        self.assertEqual(second['rating'], {'count': 2, 'avg': 7.0})
+        # the actor's nominations only
+        self.assertEqual([oscar['nomination'] for oscar in second['oscars']], ['ACTRESS IN A LEADING ROLE'])
+
+        self.assertEqual(self.client.get('/api/imdb/actors/0/movies/').status_code, 404)
+
+    def test_director_movies(self):
+        movie = Movie.objects.create(name='Fargo', description='Snow', duration_in_min=98, release_year=1996)
+        # a directing nomination links the director to the movie
+        Oscars.objects.create(nomination='DIRECTING', ceremony_year=1997, movie=movie, director=self.director)
+
+        response = self.client.get(f'/api/imdb/directors/{self.director.id}/movies/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        result = response.data['results'][0]
+        self.assertEqual(result['movie']['name'], 'Fargo')
+        self.assertEqual([oscar['ceremony_year'] for oscar in result['oscars']], [1997])
+        self.assertNotIn('salary', result)
+
+    def test_director_links_follow_the_nominations(self):
+        movie = Movie.objects.create(name='Fargo', description='Snow', duration_in_min=98, release_year=1996)
+        ethan = Directors.objects.create(name='Ethan Coen', birth_year=1957)
+        oscar = Oscars.objects.create(nomination='DIRECTING', ceremony_year=1997, movie=movie, director=self.director)
+        oscar.director = ethan
+        oscar.save()
+        self.assertEqual(list(MovieDirector.objects.values_list('director_id', flat=True)), [ethan.id])
+        oscar.delete()
+        self.assertFalse(MovieDirector.objects.exists())
+
+    def test_directors_given_with_the_movie(self):
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        data = {'name': 'Fargo', 'description': 'Snow', 'duration_in_min': 98, 'release_year': 1996,
+                'directors': [self.director.id]}
+        response = self.client.post('/api/imdb/movies/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        # a nomination going away doesn't take a credited link with it
+        Oscars.objects.create(nomination='DIRECTING', ceremony_year=1997, movie_id=response.data['id'],
+                              director=self.director).delete()
+        response = self.client.get(f'/api/imdb/directors/{self.director.id}/movies/')
+        self.assertEqual([result['movie']['name'] for result in response.data['results']], ['Fargo'])
+
+        response = self.client.post('/api/imdb/movies/', {**data, 'name': 'Other', 'directors': [99999]},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['directors'], ['Directors do not exist: 99999'])
+
+    def count_queries(self, url):
+        get_response_cache().clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_does_not_grow_with_the_filmography(self):
+        movies = self.add_movies(3)
+        for movie in movies:
+            Oscars.objects.create(nomination='ACTOR IN A LEADING ROLE', ceremony_year=2000, movie=movie,
+                                  actor=self.actor)
+        urls = [f'/api/imdb/actors/{self.actor.id}/movies/?page_size=50',
+                f'/api/imdb/directors/{self.director.id}/movies/?page_size=50']
+        few = [self.count_queries(url)[0] for url in urls]
+        self.add_movies(40, first_year=1900)
+        for url, queries in zip(urls, few):
+            many, response = self.count_queries(url)
+            self.assertEqual(many, queries)
+            self.assertEqual(len(response.data['results']), 43)
+
+    def test_pages(self):
+        self.add_movies(5)
+        response = self.client.get(f'/api/imdb/actors/{self.actor.id}/movies/?page_size=2&page=3')
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([result['movie']['release_year'] for result in response.data['results']], [1980])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(f'/api/imdb/actors/{self.actor.id}/movies/?pagination=cursor&page_size=2')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+
+class CoStarPathTestCase(TestCase):
+
+    def setUp(self):
+        reset_costar_graph()
+        self.addCleanup(reset_costar_graph)
+        self.client = APIClient()
+        self.actors = Actor.objects.bulk_create([Actor(name=name) for name in ('Bacon', 'Hanks', 'Ryan', 'Alone')])
+        self.movies = Movie.objects.bulk_create([
+            Movie(name=name, description='d', duration_in_min=100, release_year=year)
+            for name, year in (('Apollo 13', 1995), ('Sleepless in Seattle', 1993), ('Other', 2000))])
+        bacon, hanks, ryan, _ = self.actors
+        apollo, sleepless, _ = self.movies
+        self.cast(bacon, apollo)
+        self.cast(hanks, apollo)
+        self.cast(hanks, sleepless)
+        self.cast(ryan, sleepless)
+
+    def cast(self, actor, movie):
+        return MovieActor.objects.create(actor=actor, movie=movie, salary=1000, main_role=False)
+
+    def path(self, source, target, query=''):
+        return self.client.get(f'/api/imdb/actors/{source.id}/path/{target.id}/{query}')
+
+    def test_path_with_movie_names(self):
+        bacon, hanks, ryan, alone = self.actors
+        response = self.path(bacon, ryan)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['degrees'], 2)
+        self.assertEqual([(step['actor']['name'], step['movie'] and step['movie']['name'])
+                          for step in response.data['path']],
+                         [('Bacon', None), ('Hanks', 'Apollo 13'), ('Ryan', 'Sleepless in Seattle')])
+
+        self.assertEqual(self.path(bacon, alone).data, {'from': bacon.id, 'to': alone.id, 'degrees': None, 'path': []})
+        self.assertIsNone(self.path(bacon, ryan, '?max_degrees=1').data['degrees'])
+        self.assertEqual(self.path(bacon, ryan, '?max_degrees=0').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/imdb/actors/{bacon.id}/path/0/').status_code, 404)
+
+    def test_graph_follows_the_cast(self):
+        bacon, hanks, ryan, alone = self.actors
+        apollo, sleepless, other = self.movies
+        self.path(bacon, ryan)
+
+        # new rows are linked after the commit
+        graph = get_costar_graph()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cast(alone, apollo)
+        self.assertIsNotNone(graph.shortest_path(alone.id, ryan.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            MovieActor.objects.filter(actor=alone).delete()
+
+        # bulk inserts are read before the next search
+        MovieActor.objects.bulk_create([MovieActor(actor=bacon, movie=other, salary=1, main_role=False),
+                                        MovieActor(actor=alone, movie=other, salary=1, main_role=False)])
+        self.assertEqual(self.path(alone, bacon).data['degrees'], 1)
+
+        # and so are the rows of a transaction that committed after one with higher ids
+        late = MovieActor.objects.bulk_create([MovieActor(actor=ryan, movie=apollo, salary=1, main_role=False)])[0]
+        graph.last_id = late.id + 10
+        graph.sync()
+        self.assertIn((ryan.id, apollo.id), set(graph.pairs()))
+        late.delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MovieActor.objects.filter(actor=alone).delete()
+        self.assertIsNone(self.path(alone, bacon).data['degrees'])
+
+        # a change the signals don't see (another process, QuerySet.update) is caught checking the path
+        MovieActor.objects.filter(actor=ryan).update(movie=other)
+        response = self.path(bacon, ryan)
+        self.assertEqual([step['movie'] and step['movie']['name'] for step in response.data['path']],
+                         [None, 'Other'])
+
+    def test_bidirectional_search_finds_shortest_paths(self):
+        graph = CoStarGraph(synthetic_cast(actors=300, movies=200, cast_per_movie=3, seed=1))
+        pairs = [(graph.actors.ids[i], graph.actors.ids[-1 - i]) for i in range(100)]
+        _, degrees = timed_paths(graph, pairs, max_degrees=20)
+        _, one_way = timed_paths(graph, pairs, max_degrees=20, bidirectional=False)
+        self.assertEqual(degrees, one_way)
+        self.assertTrue(any(n and n > 2 for n in degrees))
+
+        # enough changes merge the overlays into new arrays
+        links = set(graph.pairs())
+        for movie_id in range(1000, 2200):
+            graph.link(1, movie_id)
+        graph.unlink(*next(iter(links)))
+        # merged at the 1001st change
+        self.assertEqual(graph.changes, 200)
+        self.assertEqual(set(graph.pairs()),
+                         links - {next(iter(links))} | {(1, movie_id) for movie_id in range(1000, 2200)})
+
+
+class ConnectionPoolTestCase(TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        self.addCleanup(close_pools, 'pooled')
+
+    def connect(self):
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def test_connections_are_reused(self):
+        pool = ConnectionPool('test', min_size=1, max_size=2)
+        pool.fill(self.connect)
+        first = pool.acquire(self.connect)
+        pool.release(first)
+        self.assertIs(pool.acquire(self.connect), first)
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['borrowed'], stats['in_use'], stats['idle']), (1, 2, 1, 0))
+
+    def test_exhaustion_waits_then_fails(self):
+        pool = ConnectionPool('test', max_size=1, timeout=0.05)
+        held = pool.acquire(self.connect)
+        with self.assertRaises(PoolExhausted):
+            pool.acquire(self.connect)
+        self.assertEqual((pool.stats()['waits'], pool.stats()['exhausted']), (1, 1))
+
+        # a connection released while a borrower waits goes to it
+        pool.timeout = 5
+        threading.Timer(0.05, pool.release, [held]).start()
+        self.assertIs(pool.acquire(self.connect), held)
+        self.assertGreater(pool.stats()['wait_seconds'], 0)
+
+    def test_idle_connections_above_min_size_are_evicted(self):
+        pool = ConnectionPool('test', min_size=1, max_size=3, max_idle=0)
+        connections = [pool.acquire(self.connect) for _ in range(3)]
+        for conn in connections:
+            pool.release(conn)
+        pool.acquire(self.connect)
+        stats = pool.stats()
+        self.assertEqual((stats['closed'], stats['size']), (2, 1))
+
+    def test_broken_connections_are_replaced(self):
+        pool = ConnectionPool('test', max_size=1)
+        broken = pool.acquire(self.connect)
+        pool.release(broken)
+        broken.close()
+        replacement = pool.acquire(self.connect)
+        self.assertIsNot(replacement, broken)
+        replacement.execute('SELECT 1')
+        stats = pool.stats()
+        self.assertEqual((stats['health_check_failures'], stats['created'], stats['size']), (1, 2, 1))
+
+    def test_threads_share_max_size_connections(self):
+        pool = ConnectionPool('test', max_size=3)
+        errors = []
+
+        def borrow():
+            try:
+                for _ in range(20):
+                    conn = pool.acquire(self.connect)
+                    conn.execute('SELECT 1')
+                    pool.release(conn)
+            except Exception as e:
+                errors.append(e)
+
+        workers = [threading.Thread(target=borrow) for _ in range(8)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        stats = pool.stats()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(stats['created'], 3)
+        self.assertEqual((stats['borrowed'], stats['in_use'], stats['exhausted']), (160, 0, 0))
+
+    def pooled_wrapper(self, **settings):
+        settings_dict = {**connection.settings_dict, 'ENGINE': 'imdb_app.backends.sqlite3', 'NAME': self.path,
+                         'CONN_MAX_AGE': 0, **settings}
+        return load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, 'pooled')
+
+    def test_database_engine_borrows_from_the_pool(self):
+        wrapper = self.pooled_wrapper(POOL={'MAX_SIZE': 2})
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        # the end of a request
+        wrapper.close_if_unusable_or_obsolete()
+        self.assertIsNone(wrapper.connection)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIs(wrapper.connection, raw)
+        wrapper.close()
+
+        metrics = registry.render()
+        self.assertIn('imdb_db_pool_borrows_total{alias="pooled",database="%s"} 2' % self.path, metrics)
+        self.assertIn('imdb_db_pool_connections{alias="pooled",database="%s",state="idle"} 1' % self.path, metrics)
+        # exact past 10 ** 6
+        wrapper.connection_pool.counters['borrowed'] += 10 ** 6
+        self.assertIn('imdb_db_pool_borrows_total{alias="pooled",database="%s"} 1000002' % self.path,
+                      registry.render())
+
+        with self.assertRaises(ImproperlyConfigured):
+            self.pooled_wrapper(CONN_MAX_AGE=60).ensure_connection()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_SELECTION='round_robin')
+class ReplicaRoutingTestCase(TestCase):
+    # 'replica' is a second SQLite database with the same schema and other rows, so a response shows
+    # which database it was read from. it isn't in DATABASES, the test runner would make it a test database
+
+    @classmethod
+    def setUpClass(cls):
+        handle, cls.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        super().setUpClass()
+        connections.settings['replica'] = {**connection.settings_dict, 'NAME': cls.path}
+        cls.databases = cls.databases | {'replica'}
+        # the router keeps migrations off the replicas
+        with override_settings(DATABASE_REPLICAS=[]):
+            call_command('migrate', database='replica', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.databases = cls.databases - {'replica'}
+        os.remove(cls.path)
+        super().tearDownClass()
+
+    def setUp(self):
+        get_response_cache().clear()
+        selector.reset()
+        self.client = APIClient()
+        self.movie = Movie.objects.create(name='Primary', description='d', duration_in_min=90, release_year=2000)
+        Movie.objects.using('replica').create(id=self.movie.id, name='Replica', description='d',
+                                              duration_in_min=90, release_year=2000)
+        self.url = f'/api/imdb/movies/{self.movie.id}/'
+
+    def test_reads_go_to_the_replica(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Replica')
+        # outside of a request
+        self.assertEqual(Movie.objects.get(id=self.movie.id).name, 'Primary')
+        self.assertIn('imdb_db_replica_requests_total{alias="replica"} 1', registry.render())
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        response = self.client.patch(self.url, {'duration_in_min': 100}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(Movie.objects.using('replica').get(id=self.movie.id).duration_in_min, 90)
+
+        # another client caches the lagging replica's response after the write
+        self.assertEqual(APIClient().get(self.url).data['duration_in_min'], 90)
+        response = self.client.get(self.url)
+        self.assertEqual((response.data['name'], response.data['duration_in_min']), ('Primary', 100))
+
+        # after READ_YOUR_WRITES_SECONDS
+        del self.client.cookies[PIN_COOKIE]
+        self.assertEqual(self.client.get(self.url).data['name'], 'Replica')
+
+        with override_settings(READ_YOUR_WRITES_SECONDS=0):
+            response = self.client.patch(self.url, {'duration_in_min': 110}, format='json')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    async def test_replica_latency_recorded_under_asgi(self):
+        # the queries run in a sync_to_async thread, not in the one of the middleware
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        latency, count = selector.stats()['replica']
+        self.assertEqual(count, 1)
+        self.assertIsNotNone(latency)
+
+    def test_migrations_only_run_on_the_primary(self):
+        self.assertFalse(router.allow_migrate('replica', 'imdb_app', model_name='movie'))
+        self.assertTrue(router.allow_migrate('default', 'imdb_app', model_name='movie'))
+
+    def test_selection(self):
+        replicas = ReplicaSelector()
+        self.assertEqual([replicas.choose(['a', 'b']) for _ in range(4)], ['a', 'b', 'a', 'b'])
+
+        replicas = ReplicaSelector()
+        replicas.observe('a', 0.010)
+        # b has no measure yet
+        replicas.choose(['a', 'b'], 'least_latency')
+        self.assertEqual(replicas.choose(['a', 'b'], 'least_latency'), 'b')
+        replicas.observe('b', 0.050)
+        self.assertEqual(replicas.choose(['a', 'b'], 'least_latency'), 'a')
+        with self.assertRaises(ValueError):
+            replicas.choose(['a'], 'random')
@@ -0,0 +1,95 @@
+from django.db import transaction
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import Trunc
+
+from imdb_app.models import Movie, Rating, RatingDay
+
+# rating trends: the number and the average of the ratings of movies per day / week / month.
+# they are read from the daily rollup (RatingDay, kept up to date with every rating that is written),
+# whose rows are bucketed again with Trunc*, so a dashboard never scans the ratings table.
+# source='raw' buckets the ratings themselves, to check / benchmark the rollup against
+
+INTERVALS = ('day', 'week', 'month')
+MAX_TOP = 50
+
+SOURCES = {
+    # model, date column, number of ratings, sum of the ratings
+    'rollup': (RatingDay, 'day', Sum('count'), Sum('total')),
+    'raw': (Rating, 'rating_date', Count('id'), Sum('rating')),
+}
+
+
+def in_range(queryset, column, from_date, to_date):
+    if from_date:
+        queryset = queryset.filter(**{f'{column}__gte': from_date})
+    if to_date:
+        queryset = queryset.filter(**{f'{column}__lte': to_date})
+    return queryset
+
+
+def top_movie_ids(top, from_date=None, to_date=None, source='rollup'):
+    # the most rated movies of the date range, most rated first
+    model, column, count, _ = SOURCES[source]
+    rows = in_range(model.objects.all(), column, from_date, to_date) \
+        .values('movie_id').annotate(n=count).order_by('-n', 'movie_id')[:top]
+    return [row['movie_id'] for row in rows]
+
+
+def buckets(movie_ids, interval, from_date=None, to_date=None, source='rollup'):
+    # {movie_id: [(start of the period, number of ratings, sum of the ratings)]}, periods in order
+    model, column, count, total = SOURCES[source]
+    rows = in_range(model.objects.filter(movie_id__in=movie_ids), column, from_date, to_date) \
+        .annotate(period=Trunc(column, interval, output_field=DateField())) \
+        .values_list('movie_id', 'period') \
+        .annotate(n=count, total=total) \
+        .order_by('movie_id', 'period')
+    result = {}
+    for movie_id, period, n, total_rating in rows:
+        result.setdefault(movie_id, []).append((period, n, total_rating))
+    return result
+
+
+def rating_trends(movie_ids=None, top=None, interval='week', from_date=None, to_date=None, source='rollup'):
+    # trends of movie_ids, or of the top most rated movies of the range; unknown movies are left out
+    if interval not in INTERVALS:
+        raise ValueError(f"interval must be one of {', '.join(INTERVALS)}")
+    if top is not None:
+        movie_ids = top_movie_ids(min(top, MAX_TOP), from_date, to_date, source)
+    names = dict(Movie.objects.filter(id__in=movie_ids).values_list('id', 'name'))
+    trends = buckets(list(names), interval, from_date, to_date, source)
+    return [{
+        'movie_id': movie_id,
+        'name': names[movie_id],
+        'trend': [{'period': period, 'count': n, 'avg': total / n}
+                  for period, n, total in trends.get(movie_id, [])],
+    } for movie_id in dict.fromkeys(movie_ids) if movie_id in names]
+
+
+def days_from_ratings(since=None):
+    # one GROUP BY over the ratings: {(movie_id, day): (number of ratings, sum of the ratings)}
+    rows = in_range(Rating.objects.order_by(), 'rating_date', since, None) \
+        .values_list('movie_id', 'rating_date').annotate(n=Count('id'), total=Sum('rating'))
+    return {(movie_id, day): (n, total) for movie_id, day, n, total in rows.iterator()}
+
+
+def rebuild_rating_days(since=None, batch_size=1000):
+    # recomputes the rollup from the ratings, only the days from since on when given (after writes that
+    # skipped Rating.save / delete, like QuerySet.update() or a raw import)
+    with transaction.atomic():
+        days = days_from_ratings(since)
+        in_range(RatingDay.objects.all(), 'day', since, None).delete()
+        RatingDay.objects.bulk_create([RatingDay(movie_id=movie_id, day=day, count=n, total=total)
+                                       for (movie_id, day), (n, total) in days.items()], batch_size=batch_size)
+    return len(days)
+
+
+def stale_rating_days(since=None):
+    # the (movie_id, day) whose rollup row doesn't match the ratings
+    expected = days_from_ratings(since)
+    stale = []
+    rows = in_range(RatingDay.objects.all(), 'day', since, None).values_list('movie_id', 'day', 'count', 'total')
+    for movie_id, day, n, total in rows.iterator():
+        if expected.pop((movie_id, day), None) != (n, total):
+            stale.append((movie_id, day))
+    # days that have ratings but no rollup row
+    return stale + list(expected)
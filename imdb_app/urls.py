@@ -17,7 +17,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from imdb_app import views
+from imdb_app import views, async_views
 from imdb_app.view_sets import MovieViewSet, ActorViewSet, DirectorsViewSet, OscarsViewSet
 from imdb_app.views import signup, me
 
@@ -57,17 +57,34 @@ urlpatterns = [
 
 
     path('oscars/years/<oscar_year>/', OscarsViewSet.as_view({'get': 'get_year'}), name='get_year'),
-    path('oscars/movie_with_most_oscars', OscarsViewSet.get_movie_with_most_oscars),
+    path('oscars/movie_with_most_oscars', OscarsViewSet.as_view({'get': 'get_movie_with_most_oscars'})),
 
     # ratings:
     path('ratings', views.get_ratings),
+    path('ratings/bulk', views.bulk_add_ratings),
+    path('ratings/export', views.export_ratings),
+    path('ratings/trends', views.get_rating_trends),
     path('ratings/delete/<int:rating_id>', views.delete_rating),
 
     # combinations:
     path('ratings/<int:movie_id>', views.add_rating_to_movie),
+    path('movies/search', views.search_movies),
+    path('movies/top', views.get_top_movies),
+    path('movies/trending', views.get_trending_movies),
+    path('movies/export', views.export_movies),
+    path('oscars/export', views.export_oscars),
     path('movies/<int:movie_id>/ratings', views.get_movie_ratings),
     path('movies/<int:movie_id>/ratings/avg', views.get_avg_movie_rating),
-    path('movies/<int:movie_id>/actor', views.add_actor_to_movie)
+    path('movies/<int:movie_id>/actor', views.add_actor_to_movie),
+    path('movies/<int:movie_id>/cast', views.get_movie_actors),
+
+    # async reads, the same responses without a worker thread per request under ASGI
+    path('async/movies/', async_views.get_movies),
+    path('async/movies/<int:movie_id>/', async_views.get_movie),
+    path('async/movies/<int:movie_id>/cast', async_views.get_movie_cast),
+    path('async/movies/<int:movie_id>/ratings', async_views.get_movie_ratings),
+    path('async/movies/<int:movie_id>/ratings/avg', async_views.get_avg_movie_rating),
+    path('async/oscars/', async_views.get_oscars),
 ]
 
 urlpatterns.extend(router.urls)
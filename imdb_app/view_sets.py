@@ -1,6 +1,11 @@
+import logging
+
 import django_filters
-from django.db.models import Count, OuterRef, Subquery
+from django.db.models import Count, OuterRef, Subquery, F, Prefetch
+from django.db.models.expressions import RawSQL
+from django.conf import settings
 from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
 from django_filters import FilterSet
 from rest_framework import mixins, status
 from rest_framework.authtoken.admin import User
@@ -11,10 +16,18 @@ from rest_framework.viewsets import ModelViewSet, GenericViewSet
 from django.core.exceptions import ValidationError
 
 
-from imdb_app.models import Movie, Actor, Directors, Oscars
+from imdb_app.cache import CachedResponseMixin
+from imdb_app.costars import MAX_DEGREES, actor_path
+from imdb_app.fieldsets import Expansion, SparseFieldsetMixin, sparse_fields, cast_prefetch, checked_names, \
+    split_param
+from imdb_app.ingest import ingest_movies, iter_movie_items, iter_ndjson_movie_items, DEFAULT_MOVIE_CHUNK_SIZE
+from imdb_app.models import Movie, Actor, Directors, Oscars, MovieActor, MovieDirector, Rating
+from imdb_app.search import get_movie_search, query_terms
 from imdb_app.serializers import MovieSerializer, DetailedMovieSerializer, CreateMovieSerializer, CastSerializer, \
-    ActorSerializer, DirectorsSerializer, OscarsSerializer, SignupSerializer
+    ActorSerializer, DirectorsSerializer, OscarsSerializer, SignupSerializer, ListOscarsSerializer, \
+    MovieOscarsSerializer, ActorFilmographySerializer, DirectorFilmographySerializer
 
+logger = logging.getLogger(__name__)
 
 # users:
 
@@ -38,26 +51,34 @@ class MovieFilterSet(FilterSet):
     name = django_filters.CharFilter(field_name='name', lookup_expr='iexact')
     duration_from = django_filters.NumberFilter('duration_in_min', lookup_expr='gte')
     duration_to = django_filters.NumberFilter('duration_in_min', lookup_expr='lte')
-    description = django_filters.CharFilter(field_name='description', lookup_expr='icontains')
+    description = django_filters.CharFilter(method='filter_description')
 
     class Meta:
         model = Movie
         fields = ['release_year']
 
+    def filter_description(self, queryset, name, value):
+        # words (prefixes) of the description, served by the full text search index
+        if not query_terms(value):
+            return queryset
+        return queryset.filter(id__in=RawSQL(*get_movie_search().matching_ids_sql(value, description_only=True)))
+
 class MoviePermission(BasePermission):
 
+    read_actions = ('list', 'retrieve', 'page')
+
     def has_permission(self, request, view):
-        print("inside has_permission")
+        logger.debug('has_permission %s %s', view.action, request.user)
         return request.user.is_staff or view.action \
-            in ('list', 'retrieve')
+            in self.read_actions
 
     def has_object_permission(self, request, view, obj):
-        print("inside has_object_permission", obj)
-        return view.action == 'retrieve' or \
-            obj.created_by == request.user
-        # obj.created_by_id == request.user.id
+        logger.debug('has_object_permission %s %s', view.action, obj)
+        return view.action in self.read_actions or request.user.is_staff
 
-class MovieViewSet(mixins.CreateModelMixin,
+class MovieViewSet(SparseFieldsetMixin,
+                   CachedResponseMixin,
+                   mixins.CreateModelMixin,
                    mixins.RetrieveModelMixin,
                    mixins.UpdateModelMixin,
                    mixins.ListModelMixin,
@@ -66,7 +87,12 @@ class MovieViewSet(mixins.CreateModelMixin,
     serializer_class = MovieSerializer
     queryset = Movie.objects.all()
     filterset_class = MovieFilterSet
+    cache_models = (Movie,)
     permission_classes = [MoviePermission]
+    expandable = {
+        'cast': Expansion(CastSerializer, prefetch=cast_prefetch, source='movieactor_set',
+                          models=(MovieActor, Actor)),
+    }
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -90,18 +116,190 @@ class MovieViewSet(mixins.CreateModelMixin,
         else:
             return super().get_serializer_class()
 
+    def get_cache_models(self):
+        if self.action == 'page':
+            return (Movie, MovieActor, Actor, Rating, Oscars, Directors)
+        return super().get_cache_models()
+
+    def get_queryset(self):
+        if self.action == 'page':
+            return self.page_queryset()
+        return super().get_queryset()
+
+    # parts of the movie page besides the movie itself, all of them unless ?include= says otherwise
+    page_includes = ('cast', 'rating', 'oscars')
+    rating_fields = ('count', 'avg', 'min', 'max')
+
+    def page_include(self):
+        if 'include' not in self.request.query_params:
+            return set(self.page_includes)
+        return set(checked_names(split_param(self.request.query_params['include']), self.page_includes,
+                                 'include', 'Unknown includes'))
+
+    def page_queryset(self):
+        # the movie with its rating summary in one query, the cast (with the actors) and the
+        # nominations (with the actor / director names) in one prefetch query each
+        include = self.page_include()
+        queryset = Movie.objects.all()
+        movie_fields = sparse_fields(self.request, None, DetailedMovieSerializer().fields)
+        if 'rating' in include:
+            queryset = queryset.select_related('rating_summary')
+        if movie_fields is not None:
+            columns = ['id', *movie_fields]
+            if 'rating' in include:
+                columns += ['rating_summary__count', 'rating_summary__total',
+                            'rating_summary__min_rating', 'rating_summary__max_rating']
+            queryset = queryset.only(*columns)
+        if 'cast' in include:
+            queryset = queryset.prefetch_related(cast_prefetch())
+        if 'oscars' in include:
+            queryset = queryset.prefetch_related(Prefetch(
+                'oscars_set', queryset=Oscars.objects.annotate(
+                    actor_name=F('actor__name'),
+                    director_name=F('director__name'),
+                ).order_by('ceremony_year', 'id')))
+        return queryset
+
+    def build_page(self, request, *args, **kwargs):
+        include = self.page_include()
+        movie = self.get_object()
+        data = DetailedMovieSerializer(movie, fields=sparse_fields(
+            request, None, DetailedMovieSerializer().fields)).data
+
+        if 'cast' in include:
+            data['cast'] = CastSerializer(
+                movie.movieactor_set.all(), many=True,
+                fields=sparse_fields(request, 'cast', CastSerializer().fields),
+                actor_fields=sparse_fields(request, 'actor', ActorSerializer().fields),
+            ).data
+        if 'rating' in include:
+            summary = getattr(movie, 'rating_summary', None)
+            rating = {
+                'count': summary.count if summary else 0,
+                'avg': summary.avg if summary else None,
+                'min': summary.min_rating if summary else None,
+                'max': summary.max_rating if summary else None,
+            }
+            fields = sparse_fields(request, 'rating', self.rating_fields)
+            data['rating'] = {name: value for name, value in rating.items() if fields is None or name in fields}
+        if 'oscars' in include:
+            data['oscars'] = MovieOscarsSerializer(
+                movie.oscars_set.all(), many=True,
+                fields=sparse_fields(request, 'oscars', MovieOscarsSerializer().fields),
+            ).data
+        return Response(data)
+
+    @action(methods=['GET'], detail=True, url_path='page')
+    def page(self, request, *args, **kwargs):
+        # everything a movie page shows in one response: ?include=cast,rating,oscars (default all)
+        # and sparse fieldsets ?fields= (the movie), fields[cast]=, fields[actor]=, fields[rating]=, fields[oscars]=
+        return self.cached_response(request, self.build_page, *args, **kwargs)
+
+    @action(methods=['POST'], detail=False, url_path='batch')
+    def batch_create(self, request, *args, **kwargs):
+        # a JSON list of movies, or NDJSON read line by line from the request stream.
+        # ?mode=best_effort keeps the valid movies when others are rejected, ?chunk_size= sets the
+        # number of movies inserted (and, in best effort mode, committed) together
+        try:
+            chunk_size = max(int(request.query_params.get('chunk_size', DEFAULT_MOVIE_CHUNK_SIZE)), 1)
+        except ValueError:
+            return Response({'chunk_size': 'must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        atomic = request.query_params.get('mode', 'atomic') != 'best_effort'
+
+        if request.content_type.startswith('application/x-ndjson'):
+            items = iter_ndjson_movie_items(request._request)
+        elif isinstance(request.data, list):
+            items = iter_movie_items(request.data)
+        else:
+            return Response({'non_field_errors': ['Expected a list of movies']},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        report = ingest_movies(items, chunk_size=chunk_size, atomic=atomic)
+        if report['rolled_back']:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif report['rejected']:
+            response_status = status.HTTP_200_OK
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response(report, status=response_status)
+
+# filmography of actors / directors:
+
+def filmography_queryset(model, person_field, person_id):
+    # the MovieActor / MovieDirector rows of one person, newest movie first, with the movie and its rating
+    # summary in the same query and the person's nominations for the movies of a page in one prefetch query
+    nominations = Oscars.objects.filter(**{person_field: person_id}).order_by('ceremony_year', 'id')
+    return model.objects.filter(**{person_field: person_id}) \
+        .select_related('movie', 'movie__rating_summary') \
+        .prefetch_related(Prefetch('movie__oscars_set', queryset=nominations, to_attr='nominations')) \
+        .order_by('-movie__release_year', 'movie_id', 'id')
+
+
+class FilmographyMixin:
+    """
+    GET <id>/movies/: the movies of the person, paginated, with their rating summary and the person's
+    nominations. A constant number of queries whatever the length of the filmography.
+    """
+    filmography_model = None
+    filmography_field = None
+    filmography_serializer = None
+    filmography_cache_models = ()
+
+    def get_cache_models(self):
+        if self.action == 'movies':
+            return self.filmography_cache_models
+        return super().get_cache_models()
+
+    def build_filmography(self, request, *args, **kwargs):
+        person = self.get_object()
+        page = self.paginate_queryset(filmography_queryset(self.filmography_model, self.filmography_field,
+                                                           person.id))
+        return self.get_paginated_response(self.filmography_serializer(page, many=True).data)
+
+    @action(methods=['GET'], detail=True, url_path='movies')
+    def movies(self, request, *args, **kwargs):
+        return self.cached_response(request, self.build_filmography, *args, **kwargs)
+
+
 # actor:
 
-class ActorViewSet(ModelViewSet):
+class ActorViewSet(FilmographyMixin, SparseFieldsetMixin, CachedResponseMixin, ModelViewSet):
     serializer_class = ActorSerializer
     queryset = Actor.objects.all()
+    cache_models = (Actor,)
+    filmography_model = MovieActor
+    filmography_field = 'actor_id'
+    filmography_serializer = ActorFilmographySerializer
+    filmography_cache_models = (Actor, Movie, MovieActor, Rating, Oscars)
+    expandable = {
+        'movies': Expansion(MovieSerializer, prefetch='movie_set', source='movie_set', models=(Movie, MovieActor)),
+    }
+
+    @action(methods=['GET'], detail=True, url_path=r'path/(?P<other_id>\d+)')
+    def path(self, request, other_id, *args, **kwargs):
+        # the shortest chain of co-stars from this actor to another one, ?max_degrees= movies at most
+        try:
+            max_degrees = int(request.query_params.get('max_degrees', MAX_DEGREES))
+        except ValueError:
+            max_degrees = 0
+        if not 1 <= max_degrees <= MAX_DEGREES:
+            return Response({'max_degrees': f'must be a number from 1 to {MAX_DEGREES}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        actor = self.get_object()
+        other = get_object_or_404(Actor, id=other_id)
+        return Response({'from': actor.id, 'to': other.id, **actor_path(actor.id, other.id, max_degrees)})
 
 
 # directors:
 
-class DirectorsViewSet(ModelViewSet):
+class DirectorsViewSet(FilmographyMixin, SparseFieldsetMixin, CachedResponseMixin, ModelViewSet):
     serializer_class = DirectorsSerializer
     queryset = Directors.objects.all()
+    cache_models = (Directors,)
+    filmography_model = MovieDirector
+    filmography_field = 'director_id'
+    filmography_serializer = DirectorFilmographySerializer
+    filmography_cache_models = (Directors, Movie, MovieDirector, Rating, Oscars)
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -110,11 +308,34 @@ class DirectorsViewSet(ModelViewSet):
             return super().get_serializer_class()
 
 # oscar:
+class RatingFilterSet(FilterSet):
+
+    from_date = django_filters.DateFilter('rating_date', lookup_expr='gte')
+    to_date = django_filters.DateFilter('rating_date', lookup_expr='lte')
+    movie = django_filters.NumberFilter('movie_id')
+    min_rating = django_filters.NumberFilter('rating', lookup_expr='gte')
+    max_rating = django_filters.NumberFilter('rating', lookup_expr='lte')
+    # ties are broken by id so that the pages don't overlap
+    ordering = django_filters.OrderingFilter(fields=('id', 'rating', 'rating_date'))
+
+    class Meta:
+        model = Rating
+        fields = []
+
+    @property
+    def qs(self):
+        queryset = super().qs
+        ordering = list(queryset.query.order_by) or ['id']
+        if not {'id', '-id'} & set(ordering):
+            ordering.append('id')
+        return queryset.order_by(*ordering)
+
+
 class OscarsFilterSet(FilterSet):
 
     ceremony_year = django_filters.CharFilter(field_name='ceremony_year', lookup_expr='exact')
-    from_year = django_filters.NumberFilter('duration_in_min', lookup_expr='gte')
-    to_year = django_filters.NumberFilter('duration_in_min', lookup_expr='lte')
+    from_year = django_filters.NumberFilter('ceremony_year', lookup_expr='gte')
+    to_year = django_filters.NumberFilter('ceremony_year', lookup_expr='lte')
     nomination = django_filters.CharFilter(field_name='nomination', lookup_expr='exact')
     actor_nominations = django_filters.BooleanFilter(field_name='actor',lookup_expr='isnull', exclude=True)
 
@@ -124,7 +345,9 @@ class OscarsFilterSet(FilterSet):
 
 
 
-class OscarsViewSet(mixins.CreateModelMixin,
+class OscarsViewSet(SparseFieldsetMixin,
+                   CachedResponseMixin,
+                   mixins.CreateModelMixin,
                    mixins.RetrieveModelMixin,
                    mixins.UpdateModelMixin,
                    mixins.ListModelMixin,
@@ -132,39 +355,33 @@ class OscarsViewSet(mixins.CreateModelMixin,
     serializer_class = OscarsSerializer
     queryset = Oscars.objects.all()
     filterset_class = OscarsFilterSet
+    cache_models = (Oscars, Movie, Actor, Directors)
+    expandable = {
+        'movie': Expansion(MovieSerializer, select='movie'),
+        'actor': Expansion(ActorSerializer, select='actor'),
+        'director': Expansion(DirectorsSerializer, select='director'),
+    }
+    name_annotations = {
+        'movie_name': F('movie__name'),
+        'actor_name': F('actor__name'),
+        'director_name': F('director__name'),
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # one joined query instead of a lookup per movie / actor / director,
+            # joining only for the names that are asked for
+            fields = self.requested_fields()
+            queryset = queryset.annotate(**{name: expression for name, expression in self.name_annotations.items()
+                                            if fields is None or name in fields})
+        return queryset
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-        page = self.paginate_queryset(queryset)
-
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            data = serializer.data.copy()
-        else:
-            serializer = self.get_serializer(queryset, many=True)
-            data = serializer.data
-
-        for oscar in data:
-            movie = Movie.objects.get(id=oscar['movie'])
-            movie_serializer = MovieSerializer(movie)
-            oscar['movie_name'] = movie_serializer.data['name']
-
-            actor_id = oscar['actor']
-            if actor_id:
-                actor = Actor.objects.get(id=actor_id)
-                actor_serializer = ActorSerializer(actor)
-                oscar['actor_name'] = actor_serializer.data['name']
-
-            director_id = oscar['director']
-            if director_id:
-                director = Directors.objects.get(id=director_id)
-                director_serializer = DirectorsSerializer(director)
-                oscar['director_name'] = director_serializer.data['name']
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ListOscarsSerializer
+        return super().get_serializer_class()
 
-        if page is not None:
-            return self.get_paginated_response(data)
-        else:
-            return Response(data)
     def create(self, request, *args, **kwargs):
         try:
             serializer = self.get_serializer(data=request.data)
@@ -187,24 +404,53 @@ class OscarsViewSet(mixins.CreateModelMixin,
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
-    @action(methods=['GET'], detail=True, url_path='movie_with_most_oscars ')
-    def get_movie_with_most_oscars(self):
-        qs = Oscars.objects.all().annotate().order_by('movie_id')
-        data = {}
-        if qs.exists():
-            most_common_movie_id = qs.first().movie_id
-            movie = Movie.objects.get(id= most_common_movie_id)
-            data['movie_id'] = most_common_movie_id
-            movie_serializer = MovieSerializer(movie)
-            data['movie_name'] = movie_serializer.data['name']
-        else:
-            data = None
-        return JsonResponse(data)
-    @action(methods=['GET'], detail=True, url_path='actor_with_most_oscars ')
-    def get_actor_with_most_oscars (self, request, *args, **kwargs):
-        pass
-
-    @action(methods=['GET'], detail=True, url_path='total_oscars ')
-    def get_total_oscars (self, request, *args, **kwargs):
-        pass
-
+    # leaderboard name -> (id field, name field) of the Oscars rows
+    leaderboards = {
+        'movies': ('movie_id', 'movie__name'),
+        'actors': ('actor_id', 'actor__name'),
+        'directors': ('director_id', 'director__name'),
+    }
+
+    def leaderboard_rows(self, leaderboard, limit):
+        # one GROUP BY over the (filtered) oscars table, joined for the names
+        id_field, name_field = self.leaderboards[leaderboard]
+        queryset = self.filter_queryset(Oscars.objects.all()).filter(**{f'{id_field}__isnull': False})
+        rows = queryset.order_by().values(id_field, name_field) \
+            .annotate(nominations=Count('id')).order_by('-nominations', id_field)[:limit]
+        return [{'id': row[id_field], 'name': row[name_field], 'nominations': row['nominations']}
+                for row in rows]
+
+    def build_leaderboard(self, request, leaderboard):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), settings.MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({'limit': 'must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.leaderboard_rows(leaderboard, limit))
+
+    def build_top_of_leaderboard(self, request, leaderboard):
+        rows = self.leaderboard_rows(leaderboard, 1)
+        if not rows:
+            return Response({'detail': 'No Oscars found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(rows[0])
+
+    def build_total(self, request):
+        return Response({'total': self.filter_queryset(Oscars.objects.all()).count()})
+
+    @action(methods=['GET'], detail=False, url_path='leaderboard/(?P<leaderboard>movies|actors|directors)',
+            url_name='leaderboard')
+    def leaderboard(self, request, leaderboard, *args, **kwargs):
+        # top ?limit= movies / actors / directors by nominations, takes the OscarsFilterSet filters
+        # (from_year, to_year, nomination, ...). cached until the oscars change
+        return self.cached_response(request, self.build_leaderboard, leaderboard=leaderboard)
+
+    @action(methods=['GET'], detail=False, url_path='movie_with_most_oscars')
+    def get_movie_with_most_oscars(self, request, *args, **kwargs):
+        return self.cached_response(request, self.build_top_of_leaderboard, leaderboard='movies')
+
+    @action(methods=['GET'], detail=False, url_path='actor_with_most_oscars')
+    def get_actor_with_most_oscars(self, request, *args, **kwargs):
+        return self.cached_response(request, self.build_top_of_leaderboard, leaderboard='actors')
+
+    @action(methods=['GET'], detail=False, url_path='total_oscars')
+    def get_total_oscars(self, request, *args, **kwargs):
+        return self.cached_response(request, self.build_total)
@@ -1,15 +1,34 @@
+import logging
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import BasePermission, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.request import Request
-
+from rest_framework.settings import api_settings
+
+from imdb_app import export
+from imdb_app.authentication import database_user
+from imdb_app.fastjson import list_response, paginated_response
+from imdb_app.ingest import ingest_ratings, DEFAULT_BATCH_SIZE, MAX_BATCH_SIZE
+from imdb_app.metrics import metrics_view
+from imdb_app import search as movie_search
+from imdb_app import ranking
+from imdb_app import trends
+from imdb_app.models import RatingSummary
+from imdb_app.pagination import OptInCursorPagination
 from imdb_app.serializers import *
+from imdb_app.view_sets import RatingFilterSet
 
 from django.db.models import Avg
+from django.db.models.expressions import RawSQL
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
@@ -42,20 +61,21 @@ def get_movies(request: Request):
 
     if request.method == 'GET':
         all_movies = Movie.objects.all()
-        print("initial query:", all_movies.query)
 
         if 'name' in request.query_params:
             all_movies = all_movies.filter(name__iexact=request.query_params['name'])
-            print("after adding name filter", all_movies.query)
         if 'duration_from' in request.query_params:
             all_movies = all_movies.filter(duration_in_min__gte=request.query_params['duration_from'])
-            print("after adding duration_from filter", all_movies.query)
         if 'duration_to' in request.query_params:
             all_movies = all_movies.filter(duration_in_min__lte=request.query_params['duration_to'])
-            print("after adding duration_to filter", all_movies.query)
-        if 'description' in request.query_params:
-            all_movies = all_movies.filter(description__icontains=request.query_params['description'])
-            print("after adding description filter", all_movies.query)
+        # no words (punctuation, spaces) is no filter, as in MovieFilterSet.filter_description
+        if movie_search.query_terms(request.query_params.get('description', '')):
+            matching_ids = movie_search.get_movie_search().matching_ids_sql(
+                request.query_params['description'], description_only=True)
+            all_movies = all_movies.filter(id__in=RawSQL(*matching_ids))
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('movies query: %s', all_movies.query)
 
         serializer = MovieSerializer(instance=all_movies, many=True)
         return Response(data=serializer.data)
@@ -81,32 +101,78 @@ def get_movie(request, movie_id):
 def get_movie_actors(request, movie_id):
 
     movie = get_object_or_404(Movie, id=movie_id)
-    all_casts = movie.movieactor_set.all()
+    all_casts = movie.movieactor_set.select_related('actor').order_by('id')
     serializer = CastSerializer(instance=all_casts, many=True)
     return Response(data=serializer.data)
 
 
+@api_view(['GET'])
+def search_movies(request):
+    query = request.query_params.get('q', '')
+    if not movie_search.query_terms(query):
+        return Response({'q': 'A search term is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(int(request.query_params.get('limit', 20)), settings.MAX_PAGE_SIZE)
+    except ValueError:
+        return Response({'limit': 'must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(movie_search.search_movies(query, max(limit, 1)))
+
+
+def ranking_response(request, ranked):
+    try:
+        limit = min(int(request.query_params.get('limit', 10)), ranking.MAX_LIMIT)
+    except ValueError:
+        return Response({'limit': 'must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(ranked(max(limit, 1)))
+
+
+# ?limit=<n> (10 by default). read from the scores of the last refresh_movie_scores run, see ranking.py
+
+@api_view(['GET'])
+def get_top_movies(request):
+    return ranking_response(request, ranking.top_movies)
+
+@api_view(['GET'])
+def get_trending_movies(request):
+    return ranking_response(request, ranking.trending_movies)
+
+
 @api_view(['GET'])
 def get_actors(request):
     all_actors = Actor.objects.all()
-    serializer = ActorSerializer(instance=all_actors, many=True)
-    return Response(data=serializer.data)
+    return list_response(request, all_actors, ActorSerializer)
 
 
 @api_view(['GET'])
 def get_ratings(request):
-    if request.method == 'GET':
-        from_date = request.data.get('from_date')
-        to_date = request.data.get('to_date')
-        if from_date and to_date:
-            all_ratings = Rating.objects.filter(rating_date__gte= from_date, rating_date__lte= to_date)
-        else:
-            all_ratings = Rating.objects.all()
+    # ?from_date=&to_date= (YYYY-MM-DD, inclusive), ?movie=<id>, ?min_rating=&max_rating=,
+    # ?ordering=-rating_date,rating (id by default), paginated. the date range and the movie filter are
+    # served by the (movie_id, rating_date) and rating_date indexes
+    filterset = RatingFilterSet(request.query_params, queryset=Rating.objects.all())
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    paginator = api_settings.DEFAULT_PAGINATION_CLASS()
+    if 'ordering' in request.query_params and isinstance(paginator, OptInCursorPagination) \
+            and paginator.use_cursor(request):
+        raise ValidationError({'ordering': ['Cursor pagination is ordered by id.']})
+    page = paginator.paginate_queryset(filterset.qs, request)
+    return paginated_response(request, paginator, page, RatingSerializer)
 
-        serializer = RatingSerializer(instance=all_ratings, many=True)
-        return Response(data=serializer.data)
-    else:
-        return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+@api_view(['GET'])
+def get_rating_trends(request):
+    # ?movie=<id>[,<id>...] or ?top=<n> (the most rated movies of the range), ?interval=day|week|month
+    # (week by default), ?from_date=&to_date= (YYYY-MM-DD, inclusive). read from the daily rollup
+    params = request.query_params
+    try:
+        movie_ids = export.parse_ids(params, 'movie')
+        top = export.parse_int(params, 'top')
+        if not movie_ids and top is None:
+            raise ValueError('movie or top is required')
+        result = trends.rating_trends(movie_ids, top if not movie_ids else None, params.get('interval', 'week'),
+                                      export.parse_date(params, 'from_date'), export.parse_date(params, 'to_date'))
+    except ValueError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'interval': params.get('interval', 'week'), 'movies': result})
 
 @api_view(['DELETE'])
 def delete_rating(request, rating_id):
@@ -121,16 +187,16 @@ def delete_rating(request, rating_id):
 @api_view(['GET'])
 def get_movie_ratings(request, movie_id):
     movie = Movie.objects.get(id=movie_id)
-    serializer = RatingSerializer(
-        instance=movie.rating_set.all(), many=True)
-    return Response(data=serializer.data)
+    return list_response(request, movie.rating_set.all(), RatingSerializer)
 
 @api_view(['GET'])
 def get_avg_movie_rating(request, movie_id):
-    movie = get_object_or_404(Movie, id=movie_id)
-    avg_rating = movie.rating_set.aggregate(Avg('rating'))
-    print(avg_rating)
-    return Response(avg_rating)
+    summary = RatingSummary.objects.filter(movie_id=movie_id).first()
+    if summary is None:
+        # no rating was ever added to this movie (or it doesn't exist)
+        get_object_or_404(Movie, id=movie_id)
+        return Response({'rating__avg': None})
+    return Response({'rating__avg': summary.avg})
 
 
 
@@ -167,7 +233,7 @@ def add_rating_to_movie(request, movie_id):
     if request.method == 'POST':
         get_object_or_404(Movie, id=movie_id)
         if 11 > int(rating) > 0:
-            new_rating = Rating.objects.create(rating= rating, rating_date= datetime.today(), movie_id= movie_id)
+            new_rating = Rating.objects.create(rating= rating, movie_id= movie_id)
             serializer = RatingSerializer(new_rating)
             return Response(serializer.data)
         else:
@@ -176,6 +242,49 @@ def add_rating_to_movie(request, movie_id):
     else:
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def bulk_add_ratings(request):
+    # the body is read line by line from the request stream, never parsed into request.data
+    fmt = 'csv' if request.content_type.startswith('text/csv') else 'ndjson'
+    try:
+        batch_size = int(request.query_params.get('batch_size', DEFAULT_BATCH_SIZE))
+    except ValueError:
+        return Response({'batch_size': 'must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    report = ingest_ratings(request._request, fmt=fmt, batch_size=min(max(batch_size, 1), MAX_BATCH_SIZE))
+    return Response(report)
+
+def export_response(request, table):
+    output = request.query_params.get('output', 'ndjson')
+    if output not in export.OUTPUTS:
+        return Response({'output': f"must be one of {', '.join(export.OUTPUTS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        chunk_size = min(max(int(request.query_params.get('chunk_size', export.DEFAULT_CHUNK_SIZE)), 1),
+                         export.MAX_CHUNK_SIZE)
+        chunks = export.EXPORTS[table](request.query_params, output, chunk_size)
+    except ValueError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    response = StreamingHttpResponse(chunks, content_type=export.OUTPUTS[output])
+    response['Content-Disposition'] = f'attachment; filename="{table}.{output}"'
+    return response
+
+# streamed exports, ?output=ndjson (default) or csv
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_ratings(request):
+    return export_response(request, 'ratings')
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_movies(request):
+    return export_response(request, 'movies')
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_oscars(request):
+    return export_response(request, 'oscars')
+
 @api_view(['POST'])
 def signup(request):
     if request.data['is_staff']:
@@ -196,11 +305,24 @@ def signup(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def me(request):
-    serializer = UserSerializer(instance=request.user)
+    serializer = UserSerializer(instance=database_user(request.user))
     return Response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def me_get_users(request):
-    serializer = UserSerializer(instance=request.user)
-    return Response(serializer.data)
\ No newline at end of file
+    serializer = UserSerializer(instance=database_user(request.user))
+    return Response(serializer.data)
+
+
+class MetricsPermission(BasePermission):
+    # staff users, or scrapers connecting from settings.METRICS_ALLOWED_IPS
+
+    def has_permission(self, request, view):
+        return request.user.is_staff or request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+@api_view(['GET'])
+@permission_classes([MetricsPermission])
+def metrics(request):
+    return metrics_view(request)
@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/4.1/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -45,6 +46,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # outermost, so that the queries of the other middleware are counted too
+    'imdb_app.middleware.QueryInstrumentationMiddleware',
+    # before anything reads from the database, see DATABASE_REPLICAS
+    'imdb_app.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,6 +94,39 @@ DATABASES = {
     }
 }
 
+# connections come from the in process pool of imdb_app/pool.py and go back to it at the end of every
+# request (so CONN_MAX_AGE stays 0), MAX_SIZE per worker process: keep workers * MAX_SIZE under the
+# server's max_connections. IMDB_DB_POOL=0 uses Django's persistent connections instead, one per thread
+# kept IMDB_CONN_MAX_AGE seconds and checked before a request reuses it
+if os.environ.get('IMDB_DB_POOL', '1') != '0':
+    DATABASES['default'].update({
+        'ENGINE': 'imdb_app.backends.postgresql',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MIN_SIZE': 2,
+            'MAX_SIZE': 10,
+            'MAX_IDLE': 300,
+            'TIMEOUT': 5,
+            'HEALTH_CHECK': True,
+        },
+    })
+else:
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.environ.get('IMDB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    })
+
+# read replicas of 'default', one alias per host of IMDB_DB_REPLICA_HOSTS=host1,host2 (see imdb_app/routers.py).
+# GET / HEAD / OPTIONS requests read from one of them, picked 'round_robin' or by 'least_latency'; a
+# client reads from 'default' for READ_YOUR_WRITES_SECONDS after a request that may have written
+DATABASE_ROUTERS = ['imdb_app.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+for number, host in enumerate(filter(None, os.environ.get('IMDB_DB_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{number}')
+REPLICA_SELECTION = os.environ.get('IMDB_DB_REPLICA_SELECTION', 'round_robin')
+READ_YOUR_WRITES_SECONDS = 5
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -132,17 +170,76 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # page numbers by default, ?pagination=cursor switches to keyset pagination
+    'DEFAULT_PAGINATION_CLASS': 'imdb_app.pagination.OptInCursorPagination',
     'PAGE_SIZE': 3,
+    # JSONRenderer that also passes through the lists rendered by imdb_app.fastjson
+    'DEFAULT_RENDERER_CLASSES': [
+        'imdb_app.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Basic with a short lived cache of verified passwords, JWT without a user lookup for recent tokens
+    # (see imdb_app/authentication.py)
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
+        'imdb_app.authentication.CachedBasicAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'imdb_app.authentication.ClaimsJWTAuthentication',
     ]
 }
 
+# largest ?page_size= a client can ask for
+MAX_PAGE_SIZE = 100
+
+# cached list / retrieve responses of the catalogue viewsets (see imdb_app/cache.py).
+# 'lru' is per process, set BACKEND to the alias of a shared Django cache when running several workers
+RESPONSE_CACHE = {
+    'BACKEND': 'lru',
+    'MAX_ENTRIES': 1024,
+    'TIMEOUT': 300,
+}
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(weeks=100),
     "REFRESH_TOKEN_LIFETIME": timedelta(weeks=100),
-}
\ No newline at end of file
+    # tokens carry is_staff, refreshed from the user on every refresh
+    "TOKEN_OBTAIN_SERIALIZER": "imdb_app.authentication.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "imdb_app.authentication.ClaimsTokenRefreshSerializer",
+}
+# access tokens younger than this are trusted without loading the user, so a change of is_staff /
+# is_active takes up to this long to apply to them. None loads the user on every request
+STATELESS_JWT_MAX_AGE = timedelta(minutes=15)
+# verified Basic auth credentials, kept TIMEOUT seconds. MAX_ENTRIES 0 turns the cache off
+BASIC_AUTH_CACHE = {
+    'MAX_ENTRIES': 1024,
+    'TIMEOUT': 60,
+}
+# read only lists (ratings, actors) are written to JSON from values_list() rows, see imdb_app/fastjson.py
+FAST_SERIALIZATION = True
+
+# movies/top and movies/trending (see imdb_app/ranking.py): the number of ratings a movie needs before its
+# own average outweighs the mean of all the ratings, and the days after which a rating counts half as much
+RANKING_MIN_VOTES = 25
+TRENDING_HALF_LIFE_DAYS = 7
+
+# a request repeating one query shape this many times is logged as a likely N+1 (see imdb_app/middleware.py)
+N_PLUS_ONE_THRESHOLD = 5
+# /metrics is served to staff users and to scrapers connecting from these addresses (REMOTE_ADDR, so the
+# address of a reverse proxy in front of the app would let everyone through it)
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('IMDB_METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # one JSON line per request: view, status, queries, db / serializer time, response size, at INFO.
+        # off by default (likely N+1 warnings only), IMDB_REQUEST_LOG_LEVEL=INFO turns them on
+        'imdb_app.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('IMDB_REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
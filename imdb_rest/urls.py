@@ -16,7 +16,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from imdb_app.views import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/imdb/', include('imdb_app.urls'))
+    path('api/imdb/', include('imdb_app.urls')),
+    path('metrics', metrics),
 ]
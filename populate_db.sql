@@ -70,6 +70,9 @@ insert into public.oscars (nomination,ceremony_year,actor_id,director_id,movie_i
 	('DIRECTOR',2002,6,1,8),
 	('DIRECTOR',2003,5,2,3);
 
+insert into public.movie_directors (movie_id,director_id,credited)
+	select distinct movie_id, director_id, false from public.oscars where director_id is not null;
+
 ALTER SEQUENCE actors_id_seq RESTART WITH 100;
 ALTER SEQUENCE movies_id_seq RESTART WITH 100;
 ALTER SEQUENCE ratings_id_seq RESTART WITH 100;